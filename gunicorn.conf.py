@@ -0,0 +1,65 @@
+from pathlib import Path
+import gc
+import multiprocessing
+import os
+import tempfile
+
+
+bind = "0.0.0.0:5000"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Import the app, and load the embedding model, classifier and label encoder, once in the master process rather than
+# once per worker. Forked workers then share the model weights copy-on-write. The master only loads the models — it
+# never runs inference — so no thread pools (PyTorch / OpenMP, tokenizers) are started before the fork.
+# Set GUNICORN_PRELOAD=false to load the models in each worker instead — workers then start serving requests classified
+# by filename at once, at the cost of a copy of the models per worker.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Each worker writes its metrics to files in this directory, and /metrics aggregates them across workers (see
+# src/classifier/metrics.py). It has to be set before the app — and so prometheus_client — is imported.
+_metrics_dir = Path(
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        os.path.join(tempfile.gettempdir(), "classifier_metrics"),
+    )
+)
+
+
+# Runs in the master on startup. Clear out the previous run's metrics files, so its counts aren't reported again.
+def on_starting(server):
+    _metrics_dir.mkdir(parents=True, exist_ok=True)
+    for metrics_file in _metrics_dir.glob("*.db"):
+        metrics_file.unlink()
+
+
+# Runs in the master once the app is imported, before any workers are forked. Models are otherwise loaded on first use,
+# so load them here for the workers to share.
+def when_ready(server):
+    if server.cfg.preload_app:
+        from src.classifier.pipeline import warm_up
+
+        warm_up()
+
+
+# Runs in the master just before each worker is forked. Moves every object allocated so far (including the models'
+# Python objects) into a permanent generation the garbage collector never scans, so the workers' collections don't
+# write to — and so copy — the pages they live on.
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+# Runs in each worker once it has started. Without preload_app, the models haven't been loaded yet — optionally start
+# loading them in the background, while the worker serves requests that don't need them.
+def post_worker_init(worker):
+    from src.classifier.config_loader import RUNTIME_SETTINGS
+    from src.classifier.pipeline import start_background_warm_up
+
+    if RUNTIME_SETTINGS["startup"]["background_warm_up"] and not worker.cfg.preload_app:
+        start_background_warm_up()
+
+
+# Runs in the master when a worker exits.
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
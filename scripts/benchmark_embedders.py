@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import joblib
+import numpy as np
+import pandas as pd
+
+
+# Config
+VAL_PATH = "data/validation"
+MODEL_PATH = "src/classifier/file_content_classifier/models"
+ONNX_PATH = os.path.join(MODEL_PATH, "onnx")
+BACKENDS = ["sentence_transformers", "onnx:model.onnx", "onnx:model.int8.onnx"]
+LATENCY_RUNS = 50
+
+
+def load_validation_data():
+    texts, labels = [], []
+    for filename in sorted(os.listdir(VAL_PATH)):
+        if filename.endswith(".csv"):
+            df = pd.read_csv(os.path.join(VAL_PATH, filename))
+            texts.extend(df["text"].tolist())
+            labels.extend(df["label"].tolist())
+    return texts, labels
+
+
+def load_embedder(backend):
+    if backend == "sentence_transformers":
+        from sentence_transformers import SentenceTransformer
+
+        embedder_name = open(os.path.join(MODEL_PATH, "embedder.txt")).read().strip()
+        return SentenceTransformer(embedder_name, device="cpu")
+
+    sys.path.insert(0, "src")
+    from classifier.file_content_classifier.embedders import OnnxEmbedder
+
+    onnx_model = backend.split(":", 1)[1]
+    return OnnxEmbedder(
+        os.path.join(ONNX_PATH, onnx_model), os.path.join(ONNX_PATH, "tokenizer.json")
+    )
+
+
+# Peak resident memory of this process, in MB.
+def peak_rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+# Benchmark a single backend — run in its own process, so its memory footprint is measured in isolation.
+def run_backend(backend, embeddings_path):
+    texts, labels = load_validation_data()
+
+    start = time.perf_counter()
+    embedder = load_embedder(backend)
+    load_seconds = time.perf_counter() - start
+
+    classifier = joblib.load(os.path.join(MODEL_PATH, "classifier.joblib"))
+    label_encoder = joblib.load(os.path.join(MODEL_PATH, "label_encoder.joblib"))
+
+    # Single-document latency, as seen by one /classify_file request.
+    embedder.encode(texts[:1])
+    latencies = []
+    for text in texts[:LATENCY_RUNS]:
+        start = time.perf_counter()
+        embedder.encode([text])
+        latencies.append(time.perf_counter() - start)
+
+    # Batch throughput, as seen by /classify_files.
+    start = time.perf_counter()
+    embeddings = np.asarray(embedder.encode(texts))
+    batch_seconds = time.perf_counter() - start
+    np.save(embeddings_path, embeddings)
+
+    predictions = label_encoder.inverse_transform(
+        classifier.classes_[classifier.predict_proba(embeddings).argmax(axis=1)]
+    )
+
+    return {
+        "backend": backend,
+        "accuracy": float(np.mean(predictions == np.array(labels))),
+        "load_seconds": load_seconds,
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "throughput_docs_per_second": len(texts) / batch_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare_backends(backends):
+    classifier = joblib.load(os.path.join(MODEL_PATH, "classifier.joblib"))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reports, embeddings = [], []
+        for i, backend in enumerate(backends):
+            embeddings_path = os.path.join(tmp_dir, f"{i}.npy")
+            output = subprocess.run(
+                [sys.executable, __file__, "--run", backend, embeddings_path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            reports.append(json.loads(output.strip().splitlines()[-1]))
+            embeddings.append(np.load(embeddings_path))
+
+    # Compare every backend against the first (reference) backend.
+    reference = embeddings[0]
+    reference_predictions = classifier.predict(reference)
+    for report, backend_embeddings in zip(reports, embeddings):
+        cosine = np.sum(reference * backend_embeddings, axis=1) / (
+            np.linalg.norm(reference, axis=1)
+            * np.linalg.norm(backend_embeddings, axis=1)
+        )
+        report["min_cosine_to_reference"] = float(cosine.min())
+        report["prediction_agreement"] = float(
+            np.mean(classifier.predict(backend_embeddings) == reference_predictions)
+        )
+
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare embedding backends on accuracy, latency, throughput and memory."
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=BACKENDS,
+        help="Backends to compare: sentence_transformers, or onnx:<model file in models/onnx>. The first is the reference.",
+    )
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_backend(*args.run)))
+        sys.exit()
+
+    reports = compare_backends(args.backends)
+    print(pd.DataFrame(reports).set_index("backend").round(4).to_string())
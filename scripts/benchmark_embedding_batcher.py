@@ -0,0 +1,109 @@
+import argparse
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from benchmark_embedders import load_embedder, load_validation_data
+
+
+# Config
+CONCURRENCY = [1, 4, 16]
+MAX_WAIT_MS = [1, 5, 20]
+MAX_BATCH_SIZE = 32
+SECONDS = 10
+
+
+# Encode one document per call from each of `concurrency` threads for `seconds`, as concurrent /classify_file requests
+# would — returns the documents encoded per second, and the latency of each call.
+def run_load(embedder, texts, concurrency, seconds):
+    latencies = [[] for _ in range(concurrency)]
+    deadline = time.perf_counter() + seconds
+
+    def client(i):
+        n = i
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            embedder.encode([texts[n % len(texts)]])
+            latencies[i].append(time.perf_counter() - start)
+            n += concurrency
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate([np.array(l) for l in latencies])
+    return len(all_latencies) / elapsed, all_latencies
+
+
+def benchmark(backend, concurrency_levels, max_wait_ms_values, max_batch_size, seconds):
+    sys.path.insert(0, "src")
+    from classifier.file_content_classifier.embedders import EmbeddingBatcher
+
+    texts, _ = load_validation_data()
+    embedder = load_embedder(backend)
+    embedder.encode(texts[:1])
+
+    configurations = [("none", embedder)] + [
+        (
+            f"max_wait_ms={max_wait_ms}",
+            EmbeddingBatcher(embedder, max_batch_size, max_wait_ms),
+        )
+        for max_wait_ms in max_wait_ms_values
+    ]
+
+    reports = []
+    for concurrency in concurrency_levels:
+        for batching, configured_embedder in configurations:
+            throughput, latencies = run_load(
+                configured_embedder, texts, concurrency, seconds
+            )
+            reports.append(
+                {
+                    "concurrency": concurrency,
+                    "batching": batching,
+                    "throughput_docs_per_second": throughput,
+                    "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+                    "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+                }
+            )
+            print(reports[-1], file=sys.stderr)
+
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare embedding throughput and latency with and without micro-batching, under concurrent load."
+    )
+    parser.add_argument(
+        "--backend",
+        default="sentence_transformers",
+        help="sentence_transformers, or onnx:<model file in models/onnx>.",
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=CONCURRENCY)
+    parser.add_argument("--max-wait-ms", nargs="+", type=float, default=MAX_WAIT_MS)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument(
+        "--seconds", type=float, default=SECONDS, help="Duration of each run."
+    )
+    args = parser.parse_args()
+
+    reports = benchmark(
+        args.backend,
+        args.concurrency,
+        args.max_wait_ms,
+        args.max_batch_size,
+        args.seconds,
+    )
+    print(
+        pd.DataFrame(reports)
+        .set_index(["concurrency", "batching"])
+        .round(2)
+        .to_string()
+    )
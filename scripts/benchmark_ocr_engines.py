@@ -0,0 +1,162 @@
+import argparse
+import difflib
+import io
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from benchmark_ocr_preprocessing import load_documents
+
+
+# Config
+CONCURRENCY = [1, 4]
+POOL_SIZES = [1, 4]
+SECONDS = 20
+# Upscaled copies of each image are also OCR'd, standing in for phone photos (they're downscaled by preprocessing).
+PHONE_PHOTO_MEGAPIXELS = 12
+
+
+# The engines to compare, as (name, function creating the engine) — pytesseract, and tesserocr with each pool size.
+def engine_factories(pool_sizes, tessdata_path):
+    from classifier.ocr_engines import PytesseractEngine, TesserocrEngine
+
+    return [("pytesseract", PytesseractEngine)] + [
+        (
+            f"tesserocr pool_size={pool_size}",
+            lambda pool_size=pool_size: TesserocrEngine(
+                pool_size=pool_size, tessdata_path=tessdata_path
+            ),
+        )
+        for pool_size in pool_sizes
+    ]
+
+
+# OCR one image per call from each of `concurrency` threads for `seconds`, as concurrent requests (or a multi-page pdf's
+# pages) would — returns the images OCR'd per second, and the latency of each call.
+def run_load(engine, images, concurrency, seconds):
+    latencies = [[] for _ in range(concurrency)]
+    deadline = time.perf_counter() + seconds
+
+    # Every thread cycles through all the images (from a different one), so each sees the same mix of image sizes.
+    def client(i):
+        n = i
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            engine.image_to_string(images[n % len(images)])
+            latencies[i].append(time.perf_counter() - start)
+            n += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = np.concatenate([np.array(l) for l in latencies])
+    return len(all_latencies) / elapsed, all_latencies
+
+
+def benchmark(
+    concurrency_levels,
+    pool_sizes,
+    seconds,
+    phone_photo_megapixels,
+    include_pdfs,
+    tessdata_path,
+):
+    sys.path.insert(0, "src")
+    from classifier.ocr_preprocessing import open_image, preprocess_image
+
+    # Images are preprocessed as the pipeline would, outside the timed OCR calls.
+    images = [
+        preprocess_image(open_image(io.BytesIO(image_bytes)))
+        for _, image_bytes in load_documents(phone_photo_megapixels, include_pdfs)
+    ]
+
+    reports = []
+    baseline_texts = None
+    for name, create_engine in engine_factories(pool_sizes, tessdata_path):
+        # The first call includes loading the language data (on every call, for pytesseract).
+        start = time.perf_counter()
+        try:
+            engine = create_engine()
+            texts = [engine.image_to_string(img) for img in images[:1]]
+        except Exception as e:
+            # E.g. the engine's package, the tesseract command or the language data isn't installed.
+            print(f"Skipping {name}: {e!r}", file=sys.stderr)
+            continue
+        first_call_seconds = time.perf_counter() - start
+        texts += [engine.image_to_string(img) for img in images[1:]]
+        if baseline_texts is None:
+            baseline_texts = texts
+
+        for concurrency in concurrency_levels:
+            throughput, latencies = run_load(engine, images, concurrency, seconds)
+            reports.append(
+                {
+                    "engine": name,
+                    "concurrency": concurrency,
+                    "first_call_ms": first_call_seconds * 1000,
+                    "throughput_images_per_second": throughput,
+                    "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+                    "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+                    # How much of the first engine's text each engine reproduces.
+                    "text_similarity": float(
+                        np.mean(
+                            [
+                                difflib.SequenceMatcher(None, a, b).ratio()
+                                for a, b in zip(baseline_texts, texts)
+                            ]
+                        )
+                    ),
+                }
+            )
+            print(reports[-1], file=sys.stderr)
+
+    return pd.DataFrame(reports)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare OCR throughput and latency of the pytesseract and tesserocr engines, on the images and "
+        "scanned pdfs in files/ and tests/files/, with OCR called from several threads at once."
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY)
+    parser.add_argument(
+        "--pool-sizes",
+        type=int,
+        nargs="+",
+        default=POOL_SIZES,
+        help="tesserocr pool sizes to compare.",
+    )
+    parser.add_argument("--seconds", type=float, default=SECONDS)
+    parser.add_argument(
+        "--phone-photo-megapixels",
+        type=float,
+        default=PHONE_PHOTO_MEGAPIXELS,
+        help="Size of the upscaled copy of each image (0 to skip them).",
+    )
+    parser.add_argument(
+        "--no-pdfs",
+        action="store_true",
+        help="Skip the scanned pdfs (which need poppler to rasterise).",
+    )
+    parser.add_argument(
+        "--tessdata-path",
+        help="Directory containing eng.traineddata for tesserocr (default: TESSDATA_PREFIX).",
+    )
+    args = parser.parse_args()
+
+    results = benchmark(
+        args.concurrency,
+        args.pool_sizes,
+        args.seconds,
+        args.phone_photo_megapixels,
+        not args.no_pdfs,
+        args.tessdata_path,
+    )
+    print(results.set_index(["engine", "concurrency"]).round(3).to_string())
@@ -0,0 +1,215 @@
+import argparse
+import difflib
+import io
+import os
+import sys
+import time
+import pandas as pd
+
+
+# Config
+FILE_DIRS = ["files", "tests/files"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tiff", ".bmp")
+PDF_DPI = 300
+# Upscaled copies of each image are also benchmarked, standing in for phone photos — the sample images are small.
+PHONE_PHOTO_MEGAPIXELS = 12
+EXPECTED_LABELS = {
+    "bank_statement": "bank_statement",
+    "drivers_licen": "driving_license",
+    "invoice": "invoice",
+    "poorly_named.jpg": "driving_license",
+    "poorly_named.pdf": "invoice",
+}
+
+DEFAULT_SETTINGS = {
+    "enabled": True,
+    "max_megapixels": 9,
+    "grayscale": False,
+    "binarize": False,
+    "detect_orientation": False,
+    "header_first": {"enabled": False, "height_fraction": 0.3},
+}
+CONFIGURATIONS = {
+    "none": {**DEFAULT_SETTINGS, "enabled": False},
+    "default": DEFAULT_SETTINGS,
+    "grayscale": {**DEFAULT_SETTINGS, "grayscale": True},
+    "max_4mp": {**DEFAULT_SETTINGS, "max_megapixels": 4},
+    "max_2mp": {**DEFAULT_SETTINGS, "max_megapixels": 2},
+    "max_4mp_binarize": {**DEFAULT_SETTINGS, "max_megapixels": 4, "binarize": True},
+    "max_4mp_header_first": {
+        **DEFAULT_SETTINGS,
+        "max_megapixels": 4,
+        "header_first": {"enabled": True, "height_fraction": 0.3},
+    },
+}
+
+
+def expected_label(name):
+    for prefix, label in EXPECTED_LABELS.items():
+        if name.startswith(prefix):
+            return label
+    return None
+
+
+# The documents to OCR, as (name, encoded image bytes) — images as they are, plus phone-photo sized copies, and the first
+# page of each scanned pdf rasterised at PDF_DPI (unless include_pdfs is False, e.g. without poppler installed).
+def load_documents(phone_photo_megapixels, include_pdfs=True):
+    from PIL import Image
+
+    documents = []
+    for file_dir in FILE_DIRS:
+        for name in sorted(os.listdir(file_dir)):
+            path = os.path.join(file_dir, name)
+
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(path, "rb") as file:
+                    documents.append((name, file.read()))
+
+                if phone_photo_megapixels:
+                    img = Image.open(path)
+                    scale = (
+                        phone_photo_megapixels * 1_000_000 / (img.width * img.height)
+                    ) ** 0.5
+                    photo = img.resize(
+                        (round(img.width * scale), round(img.height * scale)),
+                        Image.Resampling.LANCZOS,
+                    )
+                    buffer = io.BytesIO()
+                    photo.save(buffer, "JPEG", quality=90)
+                    documents.append(
+                        (f"{name} ({phone_photo_megapixels}MP)", buffer.getvalue())
+                    )
+
+            elif include_pdfs and name.lower().endswith(".pdf"):
+                from pdf2image import convert_from_path
+                from classifier.pdf_pages import iter_pdf_pages
+
+                with open(path, "rb") as file:
+                    pages = list(iter_pdf_pages(file))
+                if any(page["text"].strip() for page in pages):
+                    continue
+
+                (page,) = convert_from_path(
+                    path, dpi=PDF_DPI, first_page=1, last_page=1
+                )
+                buffer = io.BytesIO()
+                page.save(buffer, "PNG")
+                documents.append((f"{name} (page 1)", buffer.getvalue()))
+
+    return documents
+
+
+# OCR one document with the given preprocessing settings, classifying its text as the pipeline would (the content
+# rules, then the models) — with header-first OCR, the rest of the page is only OCR'd if the rules aren't satisfied by
+# the header. Returns the text, the label, and the preprocessing and OCR times.
+def ocr_and_classify(image_bytes, settings):
+    from classifier.config_loader import DOCUMENT_RULES
+    from classifier.file_content_classifier.classifier import (
+        classify_using_file_content_rules,
+        classify_using_models,
+    )
+    from classifier.ocr_engines import get_ocr_engine
+    from classifier.ocr_preprocessing import (
+        open_image,
+        preprocess_image,
+        split_header_region,
+    )
+
+    start = time.perf_counter()
+    regions = split_header_region(
+        preprocess_image(open_image(io.BytesIO(image_bytes), settings), settings),
+        settings,
+    )
+    preprocessing_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text, result = None, None
+    for region in regions:
+        region_text = get_ocr_engine().image_to_string(region).strip()
+        text = region_text if text is None else f"{text} {region_text}"
+        result = classify_using_file_content_rules(text, DOCUMENT_RULES, 0.8)
+        if result is not None:
+            break
+    ocr_seconds = time.perf_counter() - start
+
+    if result is None:
+        (result,) = classify_using_models([text], 0.8)
+    label = result["data"]["label"] if result["success"] else None
+
+    return text, label, preprocessing_seconds, ocr_seconds
+
+
+def benchmark(configurations, phone_photo_megapixels, include_pdfs=True):
+    sys.path.insert(0, "src")
+    documents = load_documents(phone_photo_megapixels, include_pdfs)
+
+    rows = []
+    for name, image_bytes in documents:
+        baseline_text = None
+        for configuration in configurations:
+            text, label, preprocessing_seconds, ocr_seconds = ocr_and_classify(
+                image_bytes, CONFIGURATIONS[configuration]
+            )
+            if baseline_text is None:
+                baseline_text = text
+
+            rows.append(
+                {
+                    "document": name,
+                    "configuration": configuration,
+                    "preprocessing_ms": preprocessing_seconds * 1000,
+                    "ocr_ms": ocr_seconds * 1000,
+                    "total_ms": (preprocessing_seconds + ocr_seconds) * 1000,
+                    # How much of the first configuration's text is recovered.
+                    "text_similarity": difflib.SequenceMatcher(
+                        None, baseline_text, text
+                    ).ratio(),
+                    "label": label,
+                    "correct": label == expected_label(name),
+                }
+            )
+            print(rows[-1], file=sys.stderr)
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare OCR time, extracted text and classification across OCR preprocessing settings, on the "
+        "images and scanned pdfs in files/ and tests/files/."
+    )
+    parser.add_argument(
+        "--configurations",
+        nargs="+",
+        choices=list(CONFIGURATIONS),
+        default=list(CONFIGURATIONS),
+        help="The first configuration is the baseline text similarity is measured against.",
+    )
+    parser.add_argument(
+        "--phone-photo-megapixels",
+        type=float,
+        default=PHONE_PHOTO_MEGAPIXELS,
+        help="Size of the upscaled copy of each image (0 to skip them).",
+    )
+    parser.add_argument(
+        "--no-pdfs",
+        action="store_true",
+        help="Skip the scanned pdfs (which need poppler to rasterise).",
+    )
+    args = parser.parse_args()
+
+    results = benchmark(
+        args.configurations, args.phone_photo_megapixels, not args.no_pdfs
+    )
+    print(results.set_index(["document", "configuration"]).round(3).to_string())
+    print()
+    print(
+        results.groupby("configuration", sort=False)
+        .agg(
+            total_ms=("total_ms", "sum"),
+            mean_text_similarity=("text_similarity", "mean"),
+            accuracy=("correct", "mean"),
+        )
+        .round(3)
+        .to_string()
+    )
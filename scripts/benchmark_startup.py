@@ -0,0 +1,101 @@
+import argparse
+import re
+import subprocess
+import sys
+
+
+# Config
+# Libraries that should only be imported once a request needs them (or by the background warm-up).
+HEAVY_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "transformers",
+    "onnxruntime",
+    "sklearn",
+    "joblib",
+    "pdfminer",
+    "pdf2image",
+    "pytesseract",
+    "docx",
+    "openpyxl",
+    "PIL",
+]
+FILENAME_CLASSIFIABLE_FILE = "tests/files/bank_statement_1.pdf"
+
+# Imports the app and serves one request classified by filename, printing the time taken to import the app and to
+# answer the request.
+STARTUP_SCRIPT = f"""
+import time
+start = time.perf_counter()
+from src.app import app
+imported = time.perf_counter()
+with open({FILENAME_CLASSIFIABLE_FILE!r}, "rb") as file:
+    response = app.test_client().post("/classify_file", data={{"file": (file, "bank_statement_1.pdf")}})
+assert response.status_code == 200, response.get_json()
+print(imported - start, time.perf_counter() - start)
+"""
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)")
+
+
+# Run the startup script under -X importtime, returning the timings and each imported module's cumulative import time.
+def measure_startup():
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    import_seconds, first_response_seconds = map(
+        float, process.stdout.strip().splitlines()[-1].split()
+    )
+
+    imports = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            imports[match[3]] = int(match[2])
+
+    return import_seconds, first_response_seconds, imports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure app startup time and check heavy libraries aren't imported at startup."
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        help="Fail if answering the first filename-classifiable request takes longer than this.",
+    )
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    import_seconds, first_response_seconds, imports = measure_startup()
+
+    print(f"Import src.app: {import_seconds:.3f}s")
+    print(f"First filename-classified response: {first_response_seconds:.3f}s")
+
+    # Packages include the time spent importing their own dependencies, so nested packages are counted more than once.
+    print("\nSlowest packages to import (cumulative):")
+    packages = sorted(
+        (
+            (cumulative_us, module)
+            for module, cumulative_us in imports.items()
+            if "." not in module
+        ),
+        reverse=True,
+    )
+    for cumulative_us, module in packages[: args.top]:
+        print(f"  {cumulative_us / 1e6:8.3f}s  {module}")
+
+    eager_heavy_modules = [module for module in HEAVY_MODULES if module in imports]
+    if eager_heavy_modules:
+        print(
+            f"\nHeavy libraries imported at startup: {', '.join(eager_heavy_modules)}"
+        )
+
+    if eager_heavy_modules or (
+        args.max_seconds is not None and first_response_seconds > args.max_seconds
+    ):
+        sys.exit(1)
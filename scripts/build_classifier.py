@@ -1,17 +1,28 @@
+import argparse
 import os
+import sys
+import numpy as np
 import pandas as pd
+from scipy import sparse
 from sentence_transformers import SentenceTransformer
 from sklearn.linear_model import LogisticRegression
 from sklearn.preprocessing import LabelEncoder
 import joblib
 
+
 # Config
 TRAIN_PATH = "data/training"
 MODEL_PATH = "src/classifier/file_content_classifier/models"
 EMBEDDER_NAME = "all-MiniLM-L6-v2"
 OUTPUT_CLASSIFIER = os.path.join(MODEL_PATH, "classifier.joblib")
 OUTPUT_LABEL_ENCODER = os.path.join(MODEL_PATH, "label_encoder.joblib")
+OUTPUT_CLASSIFIER_HEAD = os.path.join(MODEL_PATH, "classifier_head.npz")
 OUTPUT_EMBEDDER = os.path.join(MODEL_PATH, "embedder.txt")
+OUTPUT_NGRAM_CLASSIFIER = os.path.join(MODEL_PATH, "ngram_classifier.npz")
+# Hashed n-gram tier (see src/classifier/file_content_classifier/ngram.py).
+NGRAM_FEATURES = 2**18
+CHAR_NGRAM_RANGE = (3, 5)
+WORD_NGRAM_RANGE = (1, 2)
 
 
 def load_training_data():
@@ -25,6 +36,78 @@ def load_training_data():
     return all_texts, all_labels
 
 
+# Whether LogisticRegression.predict_proba normalises one-vs-rest sigmoids or takes a softmax — as scikit-learn decides.
+def multi_class_mode(clf):
+    multi_class = getattr(clf, "multi_class", "auto")
+    if multi_class == "ovr" or (
+        multi_class in ("auto", "deprecated")
+        and (clf.classes_.size <= 2 or clf.solver == "liblinear")
+    ):
+        return "ovr"
+    return "multinomial"
+
+
+# Export the classifier head as plain arrays (see src/classifier/file_content_classifier/head.py), so the service can
+# score embeddings with NumPy alone — without scikit-learn or unpickling.
+# Any further arrays (e.g. feature settings) are saved alongside.
+def export_classifier_head(clf, le, path=OUTPUT_CLASSIFIER_HEAD, **arrays):
+    np.savez_compressed(
+        path,
+        coef=clf.coef_,
+        intercept=clf.intercept_,
+        labels=le.inverse_transform(clf.classes_),
+        multi_class=np.array(multi_class_mode(clf)),
+        **arrays,
+    )
+    print(f"Saved classifier head to {path}")
+
+
+# Sparse matrix of the texts' hashed n-gram features — computed by the same function the service uses.
+def ngram_feature_matrix(texts):
+    sys.path.insert(0, "src")
+    from classifier.file_content_classifier.ngram import hashed_ngram_features
+
+    rows = [
+        hashed_ngram_features(text, NGRAM_FEATURES, CHAR_NGRAM_RANGE, WORD_NGRAM_RANGE)
+        for text in texts
+    ]
+    return sparse.csr_matrix(
+        (
+            np.concatenate([values for _, values in rows]),
+            np.concatenate([indices for indices, _ in rows]),
+            np.cumsum([0] + [len(indices) for indices, _ in rows]),
+        ),
+        shape=(len(texts), NGRAM_FEATURES),
+    )
+
+
+# Train the hashed n-gram tier, run before the embedding model. Its weights are stored as float32 — only the n-grams
+# seen in training have non-zero weights, so the compressed artifact stays small.
+def train_ngram_classifier(path=OUTPUT_NGRAM_CLASSIFIER):
+    print("Loading training data")
+    texts, labels = load_training_data()
+
+    print("Hashing n-gram features")
+    X = ngram_feature_matrix(texts)
+
+    le = LabelEncoder()
+    y = le.fit_transform(labels)
+
+    print("Training n-gram classifier")
+    clf = LogisticRegression(max_iter=1000, random_state=42, solver="liblinear")
+    clf.fit(X, y)
+    clf.coef_ = clf.coef_.astype(np.float32)
+
+    export_classifier_head(
+        clf,
+        le,
+        path,
+        n_features=np.array(NGRAM_FEATURES),
+        char_ngram_range=np.array(CHAR_NGRAM_RANGE),
+        word_ngram_range=np.array(WORD_NGRAM_RANGE),
+    )
+
+
 def train_classifier():
     print("Loading training data")
     texts, labels = load_training_data()
@@ -51,7 +134,32 @@ def train_classifier():
         f.write(EMBEDDER_NAME)
 
     print(f"Saved classifier to {OUTPUT_CLASSIFIER}")
+    export_classifier_head(clf, le)
+
+    train_ngram_classifier()
 
 
 if __name__ == "__main__":
-    train_classifier()
+    parser = argparse.ArgumentParser(
+        description="Train the embedding classifier and the hashed n-gram classifier, and export their artifacts."
+    )
+    parser.add_argument(
+        "--head-only",
+        action="store_true",
+        help="Only re-export the classifier head from the existing classifier and label encoder.",
+    )
+    parser.add_argument(
+        "--ngram-only",
+        action="store_true",
+        help="Only train the hashed n-gram classifier tier.",
+    )
+    args = parser.parse_args()
+
+    if args.ngram_only:
+        train_ngram_classifier()
+    elif args.head_only:
+        export_classifier_head(
+            joblib.load(OUTPUT_CLASSIFIER), joblib.load(OUTPUT_LABEL_ENCODER)
+        )
+    else:
+        train_classifier()
@@ -0,0 +1,115 @@
+import argparse
+import os
+import sys
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import LabelEncoder
+
+from build_classifier import export_classifier_head
+
+
+# Config
+DATA_PATH = "data/layout"
+OUTPUT_LAYOUT_CLASSIFIER = (
+    "src/classifier/layout_classifier/models/layout_classifier.npz"
+)
+# Real images the classifier is also checked against, by filename prefix.
+FILE_DIRS = ["files", "tests/files"]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tiff", ".bmp")
+EXPECTED_LABELS = {
+    "bank_statement": "bank_statement",
+    "drivers_licen": "driving_license",
+    "invoice": "invoice",
+    "poorly_named.jpg": "driving_license",
+}
+
+
+def image_features(path):
+    sys.path.insert(0, "src")
+    from classifier.layout_classifier.features import (
+        layout_features,
+        open_layout_image,
+    )
+
+    with open(path, "rb") as file:
+        return layout_features(open_layout_image(file))
+
+
+# Features and labels of the images rendered by generate_document_images.py, in data/layout/<split>/<label>/.
+def load_images(split):
+    features, labels = [], []
+    split_path = os.path.join(DATA_PATH, split)
+    for label in sorted(os.listdir(split_path)):
+        for name in sorted(os.listdir(os.path.join(split_path, label))):
+            features.append(image_features(os.path.join(split_path, label, name)))
+            labels.append(label)
+    return np.array(features), np.array(labels)
+
+
+def expected_label(name):
+    for prefix, label in EXPECTED_LABELS.items():
+        if name.startswith(prefix):
+            return label
+    return None
+
+
+# Report accuracy, and how many images are confident enough to skip OCR (and how accurate those are), at each
+# min_confidence — on the validation images, and on the real images in files/ and tests/files/.
+def evaluate(clf, le, mean, scale, X_val, y_val):
+    real_features, real_labels = [], []
+    for file_dir in FILE_DIRS:
+        for name in sorted(os.listdir(file_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS) and expected_label(name):
+                real_features.append(image_features(os.path.join(file_dir, name)))
+                real_labels.append(expected_label(name))
+
+    for name, X, y in [
+        ("validation", X_val, y_val),
+        ("files", np.array(real_features), np.array(real_labels)),
+    ]:
+        probabilities = clf.predict_proba((X - mean) / scale)
+        predicted = le.inverse_transform(probabilities.argmax(axis=1))
+        confidences = probabilities.max(axis=1)
+        print(f"{name}: accuracy {np.mean(predicted == y):.3f} over {len(y)} images")
+
+        for min_confidence in (0.8, 0.9, 0.95, 0.99):
+            confident = confidences >= min_confidence
+            accuracy = (
+                np.mean(predicted[confident] == y[confident])
+                if confident.any()
+                else float("nan")
+            )
+            print(
+                f"  min_confidence {min_confidence}: {confident.mean():.3f} skip OCR, {accuracy:.3f} of those correct"
+            )
+
+
+def train_layout_classifier(path=OUTPUT_LAYOUT_CLASSIFIER):
+    print("Computing layout features")
+    X, labels = load_images("training")
+    X_val, y_val = load_images("validation")
+
+    mean = X.mean(axis=0)
+    # Constant features (e.g. an always-empty histogram bin) are left unscaled.
+    scale = np.where(X.std(axis=0) > 0, X.std(axis=0), 1)
+
+    le = LabelEncoder()
+    y = le.fit_transform(labels)
+
+    print("Training layout classifier")
+    clf = LogisticRegression(max_iter=1000, random_state=42, C=0.1)
+    clf.fit((X - mean) / scale, y)
+
+    evaluate(clf, le, mean, scale, X_val, y_val)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    export_classifier_head(clf, le, path, mean=mean, scale=scale)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train the image layout classifier on the images rendered by generate_document_images.py, and "
+        "export it."
+    )
+    parser.parse_args()
+
+    train_layout_classifier()
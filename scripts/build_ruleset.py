@@ -0,0 +1,30 @@
+import argparse
+import sys
+import time
+
+
+# Config
+RULES_PATH = "src/classifier/config/industry_rules.yaml"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Validate a rules file and write its precompiled artifact beside it — workers load the artifact "
+        "at startup (and on reload) instead of parsing and validating the YAML, for as long as the YAML is unchanged."
+    )
+    parser.add_argument(
+        "rules_path",
+        nargs="?",
+        default=RULES_PATH,
+        help="industry_rules.yaml to build (e.g. the one in CLASSIFIER_CONFIG_DIR).",
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, "src")
+    from classifier.config_loader import write_compiled_rules
+
+    start = time.perf_counter()
+    artifact_path = write_compiled_rules(args.rules_path)
+    print(
+        f"Compiled '{args.rules_path}' to '{artifact_path}' in {time.perf_counter() - start:.2f}s"
+    )
@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from benchmark_embedders import MODEL_PATH, load_embedder, load_validation_data
+
+
+# Config
+MIN_CONFIDENCE = 0.8
+
+
+# Predict labels for the texts, timing the whole call — returns the labels, their confidences and the time per text.
+def timed_score(score, texts):
+    start = time.perf_counter()
+    labels, confidences, _ = score(texts)
+    elapsed = time.perf_counter() - start
+    return np.asarray(labels), np.asarray(confidences), elapsed / len(texts)
+
+
+def evaluate(backend, min_confidence):
+    sys.path.insert(0, "src")
+    from classifier.file_content_classifier.head import LinearClassifierHead
+    from classifier.file_content_classifier.ngram import HashedNgramClassifier
+
+    texts, labels = load_validation_data()
+    labels = np.array(labels)
+
+    ngram_classifier = HashedNgramClassifier(
+        os.path.join(MODEL_PATH, "ngram_classifier.npz")
+    )
+    ngram_labels, ngram_confidences, ngram_seconds = timed_score(
+        ngram_classifier.score, texts
+    )
+
+    embedder = load_embedder(backend)
+    classifier_head = LinearClassifierHead(
+        os.path.join(MODEL_PATH, "classifier_head.npz")
+    )
+    embedding_labels, embedding_confidences, embedding_seconds = timed_score(
+        lambda texts: classifier_head.score(embedder.encode(texts)), texts
+    )
+
+    # The pipeline only falls back on the embedding model for texts the n-gram tier isn't confident about.
+    resolved = ngram_confidences >= min_confidence
+    tiered_labels = np.where(resolved, ngram_labels, embedding_labels)
+
+    return {
+        "validation_texts": len(texts),
+        "min_confidence": min_confidence,
+        "ngram_resolved_fraction": float(resolved.mean()),
+        "ngram_accuracy_on_resolved": (
+            float((ngram_labels[resolved] == labels[resolved]).mean())
+            if resolved.any()
+            else None
+        ),
+        "embedding_accuracy_on_resolved": (
+            float((embedding_labels[resolved] == labels[resolved]).mean())
+            if resolved.any()
+            else None
+        ),
+        "ngram_accuracy": float((ngram_labels == labels).mean()),
+        "embedding_accuracy": float((embedding_labels == labels).mean()),
+        "tiered_accuracy": float((tiered_labels == labels).mean()),
+        "embedding_confident_fraction": float(
+            (embedding_confidences >= min_confidence).mean()
+        ),
+        "ngram_ms_per_text": ngram_seconds * 1000,
+        "embedding_ms_per_text": embedding_seconds * 1000,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the hashed n-gram classifier tier with the embedding model on the validation data."
+    )
+    parser.add_argument(
+        "--backend",
+        default="sentence_transformers",
+        help="sentence_transformers, or onnx:<model file in models/onnx>.",
+    )
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    report = evaluate(args.backend, args.min_confidence)
+    print(pd.Series(report).to_string())
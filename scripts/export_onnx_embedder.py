@@ -0,0 +1,80 @@
+import argparse
+import os
+from sentence_transformers import SentenceTransformer
+import torch
+
+
+# Config
+MODEL_PATH = "src/classifier/file_content_classifier/models"
+ONNX_PATH = os.path.join(MODEL_PATH, "onnx")
+OUTPUT_MODEL = os.path.join(ONNX_PATH, "model.onnx")
+OUTPUT_QUANTISED_MODEL = os.path.join(ONNX_PATH, "model.int8.onnx")
+OUTPUT_TOKENIZER = os.path.join(ONNX_PATH, "tokenizer.json")
+
+
+# Wraps the full SentenceTransformer pipeline (transformer, pooling, normalisation) so the exported graph outputs
+# exactly what SentenceTransformer.encode returns.
+class SentenceEmbeddingModel(torch.nn.Module):
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(dict(zip(self.input_names, inputs)))["sentence_embedding"]
+
+
+def export_embedder(quantise):
+    embedder_name = open(os.path.join(MODEL_PATH, "embedder.txt")).read().strip()
+
+    print(f"Loading embedding model: {embedder_name}")
+    model = SentenceTransformer(embedder_name, device="cpu")
+    model.eval()
+
+    os.makedirs(ONNX_PATH, exist_ok=True)
+
+    # Save the tokenizer with the model's truncation length baked in, so the runtime doesn't need transformers.
+    tokenizer = model.tokenizer.backend_tokenizer
+    tokenizer.enable_truncation(max_length=model.max_seq_length)
+    tokenizer.save(OUTPUT_TOKENIZER)
+
+    print("Exporting to ONNX")
+    example = model.tokenize(["An example document."])
+    input_names = list(example)
+    torch.onnx.export(
+        SentenceEmbeddingModel(model, input_names),
+        tuple(example[name] for name in input_names),
+        OUTPUT_MODEL,
+        input_names=input_names,
+        output_names=["sentence_embedding"],
+        dynamic_axes={
+            **{name: {0: "batch", 1: "sequence"} for name in input_names},
+            "sentence_embedding": {0: "batch"},
+        },
+        opset_version=17,
+        dynamo=False,
+    )
+    print(f"Saved ONNX model to {OUTPUT_MODEL}")
+
+    if quantise:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print("Quantising weights to int8")
+        quantize_dynamic(
+            OUTPUT_MODEL, OUTPUT_QUANTISED_MODEL, weight_type=QuantType.QInt8
+        )
+        print(f"Saved quantised ONNX model to {OUTPUT_QUANTISED_MODEL}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the embedding model to ONNX for the onnx embedding backend."
+    )
+    parser.add_argument(
+        "--no-quantise",
+        action="store_true",
+        help="Skip writing the dynamically quantised (int8) variant.",
+    )
+    args = parser.parse_args()
+
+    export_embedder(quantise=not args.no_quantise)
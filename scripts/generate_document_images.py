@@ -0,0 +1,185 @@
+import argparse
+import os
+import random
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from generate_bank_statements import generate_statement
+from generate_driving_licenses import generate_license
+from generate_invoices import generate_invoice
+
+
+# Config
+OUTPUT_PATH = "data/layout"
+GENERATORS = {
+    "driving_license": generate_license,
+    "bank_statement": generate_statement,
+    "invoice": generate_invoice,
+}
+# ID-1 card (85.6 x 54mm) and A4 page (210 x 297mm) sizes, in pixels.
+CARD_SIZE = (856, 540)
+PAGE_SIZE = (1240, 1754)
+# Generated images are saved with this long side, like uploads downscaled by a phone or scanner app.
+MAX_SIDE = 1200
+
+
+def random_colour(low, high):
+    return tuple(random.randint(low, high) for _ in range(3))
+
+
+def font(size):
+    return ImageFont.load_default(size=size)
+
+
+# The text generated for a document, as lines.
+def document_lines(label):
+    return GENERATORS[label]()["text"].split("\\n")
+
+
+# A driving license card — a pastel background with a coloured header band, a photo of the holder (a face-like blob on
+# a plain backdrop), and the generated license text beside it.
+def render_card(lines):
+    card = Image.new("RGB", CARD_SIZE, random_colour(170, 250))
+    draw = ImageDraw.Draw(card)
+    width, height = CARD_SIZE
+
+    if random.random() < 0.7:
+        draw.rectangle(
+            (0, 0, width, random.randint(50, 110)), fill=random_colour(20, 200)
+        )
+
+    photo_left = random.choice(
+        [random.randint(20, 60), width - random.randint(250, 300)]
+    )
+    photo_top = random.randint(120, 180)
+    photo = (
+        photo_left,
+        photo_top,
+        photo_left + random.randint(180, 240),
+        height - random.randint(30, 80),
+    )
+    draw.rectangle(photo, fill=random_colour(60, 200))
+    face_width = (photo[2] - photo[0]) * 0.3
+    centre = ((photo[0] + photo[2]) / 2, (photo[1] + photo[3]) / 2)
+    draw.ellipse(
+        (
+            centre[0] - face_width,
+            centre[1] - face_width * 1.3,
+            centre[0] + face_width,
+            centre[1] + face_width,
+        ),
+        fill=random_colour(120, 230),
+    )
+    draw.rectangle(
+        (photo[0], centre[1] + face_width * 1.1, photo[2], photo[3]),
+        fill=random_colour(0, 255),
+    )
+
+    text_left = photo[2] + 30 if photo_left < width / 2 else random.randint(30, 60)
+    top = photo_top - random.randint(0, 40)
+    size = random.randint(26, 38)
+    for line in lines:
+        draw.text((text_left, top), line, fill=random_colour(0, 70), font=font(size))
+        top += size + random.randint(6, 16)
+
+    return card
+
+
+# A bank statement or invoice page — a white or off-white page, with the generated text as left-aligned lines under a
+# bolder heading, optionally a logo block and table rules, and plenty of blank space below.
+def render_page(lines):
+    page = Image.new("RGB", PAGE_SIZE, random_colour(235, 255))
+    draw = ImageDraw.Draw(page)
+    width, height = PAGE_SIZE
+    margin = random.randint(90, 160)
+
+    if random.random() < 0.5:
+        logo_left = random.choice([margin, width - margin - 220])
+        draw.rectangle(
+            (logo_left, margin, logo_left + 220, margin + 90),
+            fill=random_colour(0, 200),
+        )
+
+    top = margin + random.randint(120, 200)
+    size = random.randint(22, 30)
+    draw.text((margin, top), lines[0], fill=(0, 0, 0), font=font(size * 2))
+    top += size * 2 + 40
+
+    for line in lines[1:]:
+        draw.text((margin, top), line, fill=random_colour(0, 50), font=font(size))
+        if random.random() < 0.3:
+            draw.line(
+                (margin, top + size + 8, width - margin, top + size + 8),
+                fill=random_colour(120, 200),
+                width=2,
+            )
+        top += size + random.randint(18, 34)
+        if top > height - margin:
+            break
+
+    return page
+
+
+# Photograph or scan the rendered document — a photo places it on a random surface, slightly rotated and unevenly lit;
+# a scan crops to it. Both are blurred a little and saved as JPEG by the caller.
+def capture(document):
+    if random.random() < 0.6:
+        width, height = document.size
+        margin = int(max(width, height) * random.uniform(0.03, 0.25))
+        photo = Image.new(
+            "RGB", (width + 2 * margin, height + 2 * margin), random_colour(40, 220)
+        )
+        photo.paste(document, (margin, margin))
+        photo = photo.rotate(
+            random.uniform(-6, 6),
+            resample=Image.Resampling.BICUBIC,
+            fillcolor=photo.getpixel((0, 0)),
+        )
+        lighting = (
+            Image.linear_gradient("L").resize(photo.size).rotate(random.uniform(0, 360))
+        )
+        document = Image.composite(
+            photo, photo.point(lambda level: level * 0.75), lighting
+        )
+
+    return document.filter(ImageFilter.GaussianBlur(random.uniform(0, 1.2)))
+
+
+def render_document(label):
+    lines = document_lines(label)
+    document = render_card(lines) if label == "driving_license" else render_page(lines)
+    img = capture(document)
+    img.thumbnail((MAX_SIDE, MAX_SIDE))
+    return img
+
+
+def save_images(label, num, path):
+    os.makedirs(path, exist_ok=True)
+    for i in range(num):
+        render_document(label).save(
+            os.path.join(path, f"{label}_{i}.jpg"), quality=random.randint(60, 95)
+        )
+    print(f"Generated {num} synthetic {label} images and saved to '{path}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render the synthetic documents as images (photos and scans), to train the layout classifier."
+    )
+    parser.add_argument(
+        "--train", type=int, default=200, help="Images per document class for training."
+    )
+    parser.add_argument(
+        "--validation",
+        type=int,
+        default=30,
+        help="Images per document class for validation.",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    for label in GENERATORS:
+        save_images(label, args.train, os.path.join(OUTPUT_PATH, "training", label))
+        save_images(
+            label, args.validation, os.path.join(OUTPUT_PATH, "validation", label)
+        )
@@ -0,0 +1,96 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import pandas as pd
+import requests
+
+
+# smaps_rollup fields reported for each process, in kB.
+FIELDS = [
+    "Rss",
+    "Pss",
+    "Shared_Clean",
+    "Shared_Dirty",
+    "Private_Clean",
+    "Private_Dirty",
+]
+
+
+def read_smaps_rollup(pid):
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            field, _, value = line.partition(":")
+            if field in FIELDS:
+                memory[field] = int(value.split()[0])
+    return memory
+
+
+def child_pids(parent_pid):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The parent pid is the second field after the (parenthesised) command name.
+                ppid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+        if ppid == parent_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+# Send requests so every worker has loaded its models and run inference at least once before measuring.
+def warm_up(url, file_path, count, concurrency):
+    def classify(_):
+        with open(file_path, "rb") as file:
+            requests.post(url, files={"file": file}, timeout=300)
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(classify, range(count)))
+
+
+def measure(master_pid):
+    rows = []
+    for role, pid in [("master", master_pid)] + [
+        ("worker", pid) for pid in child_pids(master_pid)
+    ]:
+        memory = read_smaps_rollup(pid)
+        rows.append(
+            {
+                "pid": pid,
+                "role": role,
+                **{f"{field}_mb": memory[field] / 1024 for field in FIELDS},
+            }
+        )
+    return pd.DataFrame(rows).set_index("pid")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report the memory used by a gunicorn master and its workers. "
+        "Pss splits shared pages evenly between the processes sharing them, so the total Pss is the memory the "
+        "whole server actually uses — summing Rss counts shared model weights once per worker."
+    )
+    parser.add_argument("master_pid", type=int)
+    parser.add_argument(
+        "--warm-up-file", help="File to POST to the server before measuring."
+    )
+    parser.add_argument("--url", default="http://localhost:5000/classify_file")
+    parser.add_argument("--warm-up-requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.warm_up_file:
+        warm_up(args.url, args.warm_up_file, args.warm_up_requests, args.concurrency)
+
+    report = measure(args.master_pid)
+    workers = report[report["role"] == "worker"]
+    print(report.round(1).to_string())
+    print()
+    print(f"Workers: {len(workers)}")
+    print(f"Mean worker RSS: {workers['Rss_mb'].mean():.1f} MB")
+    print(f"Mean worker PSS: {workers['Pss_mb'].mean():.1f} MB")
+    print(f"Total PSS (master + workers): {report['Pss_mb'].sum():.1f} MB")
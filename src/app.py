@@ -1,14 +1,176 @@
-from flask import Flask, request, jsonify
+from pathlib import Path
+import hmac
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+
+from flask import Flask, Request, request, jsonify
+from werkzeug.datastructures import FileStorage
+
+from src.classifier.config_loader import RUNTIME_SETTINGS, reload_ruleset
+from src.classifier.jobs import JobQueue, run_job_worker
+from src.classifier.metrics import debug_summary, observe_file, render_metrics
+from src.classifier.pipeline import (
+    classify_file,
+    classify_file_deferred,
+    classify_files,
+    classify_spooled_file,
+    start_background_warm_up,
+)
+from src.streaming_upload import open_streamed_upload
+
+
+_UPLOAD_SETTINGS = RUNTIME_SETTINGS["uploads"]
+
+
+# Keeps uploaded files in memory up to uploads.memory_max_bytes, spilling larger ones to disk — werkzeug's default
+# spills any request over 500KB, so most documents would otherwise be written to a temporary file.
+def _upload_spool():
+    return tempfile.SpooledTemporaryFile(
+        max_size=_UPLOAD_SETTINGS["memory_max_bytes"], mode="rb+"
+    )
+
+
+class _UploadRequest(Request):
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return _upload_spool()
 
-from src.classifier.pipeline import classify_file
 
 app = Flask(__name__)
+app.request_class = _UploadRequest
+
+
+# Upper bound on the number of files (including zip archive members) classified in a single batch request.
+_MAX_BATCH_FILES = 500
+
+
+_JOB_SETTINGS = RUNTIME_SETTINGS["jobs"]
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+# Create the job queue on first use (i.e., after gunicorn has forked), starting any in-process job workers.
+def _get_job_queue():
+    global _job_queue
+
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(
+                _JOB_SETTINGS["queue_path"], _JOB_SETTINGS["spool_dir"]
+            )
+            for _ in range(_JOB_SETTINGS["in_process_workers"]):
+                threading.Thread(
+                    target=run_job_worker,
+                    args=(
+                        _job_queue,
+                        classify_spooled_file,
+                        _JOB_SETTINGS["poll_interval_seconds"],
+                        _JOB_SETTINGS["result_ttl_seconds"],
+                    ),
+                    kwargs={"lease_seconds": _JOB_SETTINGS["lease_seconds"]},
+                    daemon=True,
+                ).start()
+
+    return _job_queue
+
+
+# Check whether the client opted in to asynchronous classification.
+def _async_requested():
+    return request.args.get("async", "").lower() in (
+        "1",
+        "true",
+    ) or "respond-async" in request.headers.get("Prefer", "")
+
+
+# Check whether the client asked for debug output — the time spent in each pipeline stage, and the stage that settled
+# the file's result.
+def _debug_requested():
+    return request.headers.get("X-Classifier-Debug", "").lower() in ("1", "true")
+
+
+# Error result for a batch with more files than _MAX_BATCH_FILES.
+def _too_many_files(file_count):
+    return {
+        "success": False,
+        "error": {
+            "message": "Too many files in the request.",
+            "action": f"Submit at most {_MAX_BATCH_FILES} files per request.",
+            "code": "too_many_files",
+            "details": {"file_count": file_count},
+        },
+    }
+
+
+# Expand zip archives into their member files so each member is classified individually. Returns the member files, or
+# an error result if the batch (file_count files so far) would then have more than _MAX_BATCH_FILES files, or the
+# members more than uploads.max_zip_bytes of content. Both are checked against the archive's directory before anything
+# is decompressed — zipfile stops decompressing a member at its declared size (and fails its CRC check if the data goes
+# on), so the declared sizes hold. Members are spooled like uploads, in memory up to uploads.memory_max_bytes.
+def _expand_zip(file, file_count):
+    with zipfile.ZipFile(file.stream) as archive:
+        # Skip directories and macOS resource fork metadata.
+        members = [
+            member
+            for member in archive.infolist()
+            if not (member.is_dir() or member.filename.startswith("__MACOSX/"))
+        ]
+        if file_count + len(members) > _MAX_BATCH_FILES:
+            return None, _too_many_files(file_count + len(members))
+
+        uncompressed_bytes = sum(member.file_size for member in members)
+        if uncompressed_bytes > _UPLOAD_SETTINGS["max_zip_bytes"]:
+            return None, {
+                "success": False,
+                "error": {
+                    "message": f"Zip archive '{file.filename}' is too large once decompressed.",
+                    "action": f"Submit archives of at most {_UPLOAD_SETTINGS['max_zip_bytes']} bytes uncompressed.",
+                    "code": "zip_too_large",
+                    "details": {
+                        "filename": file.filename,
+                        "uncompressed_bytes": uncompressed_bytes,
+                    },
+                },
+            }
+
+        files = []
+        for member in members:
+            stream = _upload_spool()
+            with archive.open(member) as member_file:
+                shutil.copyfileobj(member_file, stream)
+            stream.seek(0)
+            files.append(
+                FileStorage(stream=stream, filename=Path(member.filename).name)
+            )
+    return files, None
+
+
+# Open the uploaded file while it's still being received, rather than through request.files, which reads the whole
+# request body first. The filename stages only need the part's headers, so unsupported files and filename matches are
+# answered without reading the file's body at all, and the MIME check only reads its start.
+def _streamed_upload(field_name):
+    if (
+        request.mimetype != "multipart/form-data"
+        or "boundary" not in request.mimetype_params
+    ):
+        return None
+
+    return open_streamed_upload(
+        request.stream,
+        request.mimetype_params["boundary"],
+        field_name,
+        _upload_spool(),
+    )
 
 
 @app.route("/classify_file", methods=["POST"])
 def classify_file_route():
 
-    if "file" not in request.files:
+    file = _streamed_upload("file")
+    if file is None:
         return (
             jsonify(
                 {
@@ -24,7 +186,6 @@ def classify_file_route():
             400,
         )
 
-    file = request.files["file"]
     if file.filename == "":
         return (
             jsonify(
@@ -41,9 +202,221 @@ def classify_file_route():
             400,
         )
 
-    classification_result, status_code = classify_file(file)
+    with observe_file() as observation:
+        if _async_requested():
+            classification_result, status_code = classify_file_deferred(
+                file, _get_job_queue().enqueue
+            )
+        else:
+            classification_result, status_code = classify_file(file)
+
+    if _debug_requested():
+        classification_result = {
+            **classification_result,
+            "debug": debug_summary(observation),
+        }
+
+    if status_code == 202:
+        job_id = classification_result["data"]["job_id"]
+        return (
+            jsonify(classification_result),
+            status_code,
+            {"Location": f"/jobs/{job_id}"},
+        )
+
     return jsonify(classification_result), status_code
 
 
+# Prometheus metrics — stage timings, which stage settled each file, OCR pages and result cache lookups, across all
+# worker processes (see src/classifier/metrics.py).
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+
+    body, content_type = render_metrics()
+    return body, 200, {"Content-Type": content_type}
+
+
+# Check the request carries the admin token (the CLASSIFIER_ADMIN_TOKEN env variable) — no request does if it's unset.
+def _admin_authorised():
+    token = os.getenv("CLASSIFIER_ADMIN_TOKEN", "")
+    provided = request.headers.get("X-Classifier-Admin-Token", "")
+    return bool(token) and hmac.compare_digest(provided.encode(), token.encode())
+
+
+# Reload the document rules and supported file types now, rather than on the next poll — in this worker process only,
+# the others pick the change up on their next poll (see ruleset in runtime_settings.yaml). Reports the rules version in
+# use, or that the new config was rejected (the previous rules stay in use). Disabled by default, and only served to
+# requests carrying the admin token.
+@app.route("/admin/reload_rules", methods=["POST"])
+def reload_rules_route():
+
+    if not RUNTIME_SETTINGS["ruleset"]["admin_endpoint"]:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "Reloading rules over HTTP is disabled.",
+                        "action": "Enable ruleset.admin_endpoint in runtime_settings.yaml.",
+                        "code": "endpoint_disabled",
+                        "details": {},
+                    },
+                }
+            ),
+            404,
+        )
+
+    if not _admin_authorised():
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "Missing or incorrect admin token.",
+                        "action": "Send the token set in CLASSIFIER_ADMIN_TOKEN in the X-Classifier-Admin-Token header.",
+                        "code": "unauthorised",
+                        "details": {},
+                    },
+                }
+            ),
+            401,
+        )
+
+    ruleset, error = reload_ruleset(force=True)
+    if error is not None:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "Rules config is invalid — the previous rules are still in use.",
+                        "action": "Validate the rules config (e.g., with scripts/build_ruleset.py) and reload again.",
+                        "code": "invalid_rules",
+                        "details": {"rules_version": ruleset.version},
+                    },
+                }
+            ),
+            422,
+        )
+
+    return jsonify({"success": True, "data": {"rules_version": ruleset.version}}), 200
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_route(job_id):
+
+    job = _get_job_queue().get(job_id)
+    if job is None:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": f"Job '{job_id}' not found.",
+                        "action": "Ensure the job id is correct — finished jobs expire after a while.",
+                        "code": "job_not_found",
+                        "details": {"job_id": job_id},
+                    },
+                }
+            ),
+            404,
+        )
+
+    # Still queued or running — tell the client to keep polling.
+    if job["result"] is None:
+        return (
+            jsonify(
+                {"success": True, "data": {"job_id": job_id, "status": job["status"]}}
+            ),
+            202,
+        )
+
+    return jsonify(job["result"]), job["status_code"]
+
+
+@app.route("/classify_files", methods=["POST"])
+def classify_files_route():
+
+    uploads = request.files.getlist("files")
+    if not uploads:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "No files part in the request.",
+                        "action": "Ensure form field includes one or more files (or a zip archive) with name 'files'.",
+                        "code": "missing_file_part",
+                        "details": {},
+                    },
+                }
+            ),
+            400,
+        )
+
+    files = []
+    for upload in uploads:
+        if Path(upload.filename).suffix.lower() == ".zip":
+            try:
+                members, error = _expand_zip(upload, len(files))
+            except zipfile.BadZipFile:
+                return (
+                    jsonify(
+                        {
+                            "success": False,
+                            "error": {
+                                "message": f"Could not read zip archive '{upload.filename}'.",
+                                "action": "Ensure the archive is not corrupted.",
+                                "code": "invalid_zip_file",
+                                "details": {"filename": upload.filename},
+                            },
+                        }
+                    ),
+                    400,
+                )
+            if error is not None:
+                return jsonify(error), 400
+            files.extend(members)
+        else:
+            files.append(upload)
+
+    if len(files) > _MAX_BATCH_FILES:
+        return jsonify(_too_many_files(len(files))), 400
+
+    # Files without a name can't be classified — report them individually rather than failing the whole batch.
+    named_files = [file for file in files if file.filename != ""]
+    named_results = iter(classify_files(named_files))
+
+    results = []
+    for file in files:
+        if file.filename == "":
+            classification_result, status_code = (
+                {
+                    "success": False,
+                    "error": {
+                        "message": "No selected file.",
+                        "action": "Select a file before submitting.",
+                        "code": "no_file_selected",
+                        "details": {},
+                    },
+                },
+                400,
+            )
+        else:
+            classification_result, status_code = next(named_results)
+
+        results.append(
+            {
+                "filename": file.filename,
+                "status_code": status_code,
+                **classification_result,
+            }
+        )
+
+    return jsonify({"success": True, "data": {"results": results}}), 200
+
+
 if __name__ == "__main__":
+    if RUNTIME_SETTINGS["startup"]["background_warm_up"]:
+        start_background_warm_up()
     app.run(debug=True)
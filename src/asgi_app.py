@@ -0,0 +1,253 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import hmac
+import os
+import tempfile
+import threading
+
+from quart import Quart, Request, request, jsonify
+from quart.formparser import FormDataParser
+from werkzeug.datastructures import FileStorage
+
+from src.classifier.config_loader import RUNTIME_SETTINGS, get_ruleset, reload_ruleset
+from src.classifier.metrics import debug_summary, observe_file, render_metrics
+from src.classifier.pipeline import (
+    classify_file_cache_stages,
+    classify_file_content_stages,
+    classify_file_metadata_stages,
+    start_background_warm_up,
+)
+
+
+_UPLOAD_SETTINGS = RUNTIME_SETTINGS["uploads"]
+_ASGI_SETTINGS = RUNTIME_SETTINGS["asgi"]
+
+
+# Same upload spooling as the WSGI app (see app.py) — small uploads stay in memory, larger ones spill to disk.
+def _upload_stream(total_content_length, content_type, filename, content_length):
+    return tempfile.SpooledTemporaryFile(
+        max_size=_UPLOAD_SETTINGS["memory_max_bytes"], mode="rb+"
+    )
+
+
+# Parses uploads into werkzeug's FileStorage rather than Quart's — Quart's save() is a coroutine, but the pipeline saves
+# files (for manual review) from the executor threads, synchronously.
+class _UploadFormDataParser(FormDataParser):
+    file_storage_class = FileStorage
+
+    def __init__(self, **kwargs):
+        super().__init__(stream_factory=_upload_stream, **kwargs)
+
+
+class _UploadRequest(Request):
+    form_data_parser_class = _UploadFormDataParser
+
+
+app = Quart(__name__)
+app.request_class = _UploadRequest
+# Quart caps request bodies at 16MB by default — the WSGI app doesn't, so neither does this one.
+app.config["MAX_CONTENT_LENGTH"] = None
+
+
+# Text extraction and embedding hold the GIL or block for whole seconds, so they run on a bounded thread pool rather
+# than the event loop. At most max_pending files may be queued for or running on it; beyond that, requests are turned
+# away with a 503 instead of piling up behind the pool.
+_content_executor = ThreadPoolExecutor(
+    max_workers=_ASGI_SETTINGS["content_workers"], thread_name_prefix="content"
+)
+_content_slots = threading.BoundedSemaphore(_ASGI_SETTINGS["max_pending"])
+
+
+# Released by the executor thread itself, so a slot stays taken until the work finishes — even if the client has
+# disconnected and the request's coroutine was cancelled.
+def _run_content_stages(file, file_ext, cache_key, ruleset):
+    try:
+        return classify_file_content_stages(file, file_ext, cache_key, ruleset)
+    finally:
+        _content_slots.release()
+
+
+# Check whether the client asked for debug output (see app.py).
+def _debug_requested():
+    return request.headers.get("X-Classifier-Debug", "").lower() in ("1", "true")
+
+
+@app.before_serving
+async def _warm_up():
+    if RUNTIME_SETTINGS["startup"]["background_warm_up"]:
+        start_background_warm_up()
+
+
+@app.route("/classify_file", methods=["POST"])
+async def classify_file_route():
+
+    files = await request.files
+    if "file" not in files:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "No file part in the request.",
+                        "action": "Ensure form field includes a file with name 'file'.",
+                        "code": "missing_file_part",
+                        "details": {},
+                    },
+                }
+            ),
+            400,
+        )
+
+    file = files["file"]
+    if file.filename == "":
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "No selected file.",
+                        "action": "Select a file before submitting.",
+                        "code": "no_file_selected",
+                        "details": {},
+                    },
+                }
+            ),
+            400,
+        )
+
+    with observe_file() as observation:
+        classification_result, status_code = await _classify_file(file)
+
+    if _debug_requested():
+        classification_result = {
+            **classification_result,
+            "debug": debug_summary(observation),
+        }
+
+    if status_code == 503:
+        return (
+            jsonify(classification_result),
+            status_code,
+            {"Retry-After": str(_ASGI_SETTINGS["retry_after_seconds"])},
+        )
+
+    return jsonify(classification_result), status_code
+
+
+# Run the pipeline for one file — the filename stages inline, the MIME check and result cache lookup on a thread, and
+# the content stages on the executor, all with the same ruleset.
+async def _classify_file(file):
+    ruleset = get_ruleset()
+
+    # The extension check and filename stages are cheap enough to run on the event loop.
+    classification_result, file_ext = classify_file_metadata_stages(file, ruleset)
+    if classification_result is not None:
+        return classification_result
+
+    # Hashing the upload for the result cache reads all of it, and the cache's SQLite tier can block — keep both off
+    # the event loop. asyncio.to_thread carries over context variables, so they're recorded against this file.
+    classification_result, cache_key = await asyncio.to_thread(
+        classify_file_cache_stages, file, file_ext, ruleset
+    )
+    if classification_result is not None:
+        return classification_result
+
+    if not _content_slots.acquire(blocking=False):
+        return (
+            {
+                "success": False,
+                "error": {
+                    "message": "Server is busy classifying other documents.",
+                    "action": "Retry the request shortly.",
+                    "code": "server_busy",
+                    "details": {"max_pending": _ASGI_SETTINGS["max_pending"]},
+                },
+            },
+            503,
+        )
+
+    # run_in_executor doesn't carry over context variables — run the content stages in a copy of this context, so they
+    # are recorded against the same file's observation.
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _content_executor,
+        context.run,
+        _run_content_stages,
+        file,
+        file_ext,
+        cache_key,
+        ruleset,
+    )
+
+
+# Prometheus metrics, as served by the WSGI app.
+@app.route("/metrics", methods=["GET"])
+async def metrics_route():
+
+    body, content_type = render_metrics()
+    return body, 200, {"Content-Type": content_type}
+
+
+# Check the request carries the admin token (the CLASSIFIER_ADMIN_TOKEN env variable) — no request does if it's unset.
+def _admin_authorised():
+    token = os.getenv("CLASSIFIER_ADMIN_TOKEN", "")
+    provided = request.headers.get("X-Classifier-Admin-Token", "")
+    return bool(token) and hmac.compare_digest(provided.encode(), token.encode())
+
+
+# Reloads the rules, as the WSGI app does — compiling them off the event loop.
+@app.route("/admin/reload_rules", methods=["POST"])
+async def reload_rules_route():
+
+    if not RUNTIME_SETTINGS["ruleset"]["admin_endpoint"]:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "Reloading rules over HTTP is disabled.",
+                        "action": "Enable ruleset.admin_endpoint in runtime_settings.yaml.",
+                        "code": "endpoint_disabled",
+                        "details": {},
+                    },
+                }
+            ),
+            404,
+        )
+
+    if not _admin_authorised():
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "Missing or incorrect admin token.",
+                        "action": "Send the token set in CLASSIFIER_ADMIN_TOKEN in the X-Classifier-Admin-Token header.",
+                        "code": "unauthorised",
+                        "details": {},
+                    },
+                }
+            ),
+            401,
+        )
+
+    ruleset, error = await asyncio.to_thread(reload_ruleset, True)
+    if error is not None:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "Rules config is invalid — the previous rules are still in use.",
+                        "action": "Validate the rules config (e.g., with scripts/build_ruleset.py) and reload again.",
+                        "code": "invalid_rules",
+                        "details": {"rules_version": ruleset.version},
+                    },
+                }
+            ),
+            422,
+        )
+
+    return jsonify({"success": True, "data": {"rules_version": ruleset.version}}), 200
@@ -1,10 +1,24 @@
+from collections import namedtuple
 from pathlib import Path
 import os, yaml, importlib.resources as pkg
+import hashlib
+import json
+import logging
 import re
+import threading
+import time
 
+from .file_content_classifier.rule_matcher import ContentMatcher
+from .filename_classifier.rule_matchers import FilenameMatcher
+from .metrics import record_ruleset_reload
+from .pattern_prefilter import literal_prefilter
 
-# Load raw rules from override / default config
-def load_config(filename, override=False):
+
+_logger = logging.getLogger(__name__)
+
+
+# Path of the config file to load — the override file, if there is one, otherwise the default.
+def _config_path(filename, override=False):
 
     # If the override flag is true, check for the presence of an overriding config file
     if override:
@@ -23,17 +37,24 @@ def load_config(filename, override=False):
         for dir_path in config_dir_paths:
             file_path = dir_path / filename
             if file_path.exists():
-                with file_path.open() as file:
-                    return yaml.safe_load(file)
+                return file_path
 
     # Fall back on the default config shipped in src/classifier/config/
-    with pkg.files("classifier.config").joinpath(filename).open() as file:
+    return pkg.files("classifier.config").joinpath(filename)
+
+
+# Load raw rules from override / default config
+def load_config(filename, override=False):
+    with _config_path(filename, override).open() as file:
         return yaml.safe_load(file)
 
 
 # Validates each rule has a non-empty 'label'
 # All other fields must be either empty or lists of strings
 def _validate_rule(rule):
+    if not isinstance(rule, dict):
+        raise ValueError(f"Rule {rule!r} must be a dictionary")
+
     label = rule.get("label", "")
     if not label.strip():
         raise ValueError(
@@ -87,6 +108,9 @@ def _validate_rule(rule):
 
 # Validates each rule before compiling regex patterns and lowercasing fuzzy keywords
 def _compile_rules(raw_rules):
+    if not isinstance(raw_rules, list):
+        raise ValueError("Rules config must be a list of rules")
+
     compiled_rules = []
 
     for rule in raw_rules:
@@ -124,19 +148,325 @@ def _compile_rules(raw_rules):
     return compiled_rules
 
 
+# Bump whenever _compile_rules or literal_prefilter change what they produce, so artifacts built by an older version
+# are ignored rather than loaded.
+_COMPILED_RULES_FORMAT = 2
+
+
+# Precompiled artifact for a rules file (see write_compiled_rules) — beside it, e.g. industry_rules.compiled.json.
+def _compiled_rules_path(rules_path):
+    rules_path = Path(str(rules_path))
+    return rules_path.with_name(f"{rules_path.stem}.compiled.json")
+
+
+def _encode_patterns(patterns):
+    return [
+        {
+            "source": pattern.pattern,
+            "flags": pattern.flags,
+            "prefilter": literal_prefilter(pattern),
+        }
+        for pattern in patterns
+    ]
+
+
+# Compile a rule's encoded patterns, noting each one's prefilter in prefilters.
+def _decode_patterns(encoded_patterns, prefilters):
+    patterns = []
+    for encoded_pattern in encoded_patterns:
+        pattern = re.compile(encoded_pattern["source"], encoded_pattern["flags"])
+        prefilter = encoded_pattern["prefilter"]
+        prefilters[pattern] = tuple(prefilter) if prefilter is not None else None
+        patterns.append(pattern)
+    return patterns
+
+
+# Validate and compile a rules file, and write its precompiled artifact beside it — plain JSON, so loading it can't run
+# code: the format and SHA-256 of the YAML it was built from, the raw rules (for the rules version), and the validated
+# rules with each pattern's source, flags and literal prefilter. Written to a temporary file and renamed into place, so
+# a worker never loads a partly written artifact.
+def write_compiled_rules(rules_path):
+    rules_bytes = Path(rules_path).read_bytes()
+    raw_rules = yaml.safe_load(rules_bytes)
+    document_rules = _compile_rules(raw_rules)
+
+    artifact = {
+        "format": _COMPILED_RULES_FORMAT,
+        "source_sha256": hashlib.sha256(rules_bytes).hexdigest(),
+        "raw_rules": raw_rules,
+        "rules": [
+            {
+                "label": rule["label"],
+                "filename_regex": _encode_patterns(rule["filename_regex"]),
+                "fuzzy_keywords": rule["fuzzy_keywords"],
+                "content_regex": {
+                    kind: _encode_patterns(patterns)
+                    for kind, patterns in rule["content_regex"].items()
+                },
+            }
+            for rule in document_rules
+        ],
+    }
+
+    artifact_path = _compiled_rules_path(rules_path)
+    temporary_path = artifact_path.with_name(f".{artifact_path.name}.{os.getpid()}")
+    with temporary_path.open("w") as file:
+        json.dump(artifact, file)
+    os.replace(temporary_path, artifact_path)
+    return artifact_path
+
+
+# Load a rules file's precompiled artifact, as its raw rules, compiled rules and pattern prefilters — None if there
+# isn't one, or it was built from different YAML or by a different format version, in which case the YAML is parsed and
+# compiled as usual. Patterns are still compiled here; what the artifact saves is parsing the YAML, validating the
+# rules, and working out the prefilters. An artifact that can't be read or decoded also falls back on the YAML, with a
+# warning.
+def _load_compiled_rules(rules_path, rules_bytes):
+    artifact_path = _compiled_rules_path(rules_path)
+    if not artifact_path.exists():
+        return None
+
+    try:
+        with artifact_path.open() as file:
+            artifact = json.load(file)
+        if (
+            artifact["format"] != _COMPILED_RULES_FORMAT
+            or artifact["source_sha256"] != hashlib.sha256(rules_bytes).hexdigest()
+        ):
+            return None
+
+        prefilters = {}
+        document_rules = [
+            {
+                "label": rule["label"],
+                "filename_regex": _decode_patterns(rule["filename_regex"], prefilters),
+                "fuzzy_keywords": rule["fuzzy_keywords"],
+                "content_regex": {
+                    kind: _decode_patterns(patterns, prefilters)
+                    for kind, patterns in rule["content_regex"].items()
+                },
+            }
+            for rule in artifact["rules"]
+        ]
+        return artifact["raw_rules"], document_rules, prefilters
+    except (OSError, ValueError, KeyError, TypeError, re.error) as error:
+        _logger.warning(
+            "Ignoring precompiled rules '%s', parsing the YAML instead: %r",
+            artifact_path,
+            error,
+        )
+        return None
+
+
+_EXTRACTION_LIMITS = ("max_pages", "max_rows", "max_chars", "max_seconds")
+
+
+# Validates each filetype maps to either a list of MIME types, or a dictionary of its 'mime_types' and (optionally) its
+# 'extraction_limits' — positive numbers, keyed by limit name.
 def _validate_filetypes(mapping):
-    for extension, mimes in mapping.items():
+    if not isinstance(mapping, dict):
+        raise ValueError("Supported filetypes config must be a dictionary")
+
+    for extension, filetype in mapping.items():
         if not isinstance(extension, str) or "." in extension:
             raise ValueError(f"Invalid extension key: {extension}")
+
+        mimes = filetype.get("mime_types") if isinstance(filetype, dict) else filetype
         if not isinstance(mimes, list) or not all(
             isinstance(mime, str) for mime in mimes
         ):
             raise ValueError(f"Invalid MIME list for {extension}")
-    return mapping
 
+        limits = filetype.get("extraction_limits") if isinstance(filetype, dict) else {}
+        if not isinstance(limits or {}, dict):
+            raise ValueError(f"Extraction limits for {extension} must be a dictionary")
+        for limit, value in (limits or {}).items():
+            if limit not in _EXTRACTION_LIMITS:
+                raise ValueError(f"Unknown extraction limit '{limit}' for {extension}")
+            if (
+                isinstance(value, bool)
+                or not isinstance(value, (int, float))
+                or value <= 0
+            ):
+                raise ValueError(
+                    f"Extraction limit '{limit}' for {extension} must be a positive number"
+                )
+    return mapping
 
-_RAW_RULES = load_config("industry_rules.yaml", True)
-DOCUMENT_RULES = _compile_rules(_RAW_RULES)
 
-_RAW_FILETYPES = load_config("supported_filetypes.yaml", False)
-SUPPORTED_FILETYPES = _validate_filetypes(_RAW_FILETYPES)
+# Split validated filetypes into each extension's MIME types, and each extension's extraction limits (None where unset).
+def _split_filetypes(mapping):
+    mime_types, extraction_limits = {}, {}
+    for extension, filetype in mapping.items():
+        if isinstance(filetype, dict):
+            mime_types[extension] = filetype["mime_types"]
+            limits = filetype.get("extraction_limits") or {}
+        else:
+            mime_types[extension] = filetype
+            limits = {}
+        extraction_limits[extension] = {
+            limit: limits.get(limit) for limit in _EXTRACTION_LIMITS
+        }
+    return mime_types, extraction_limits
+
+
+# Recursively overlay override settings onto the default settings.
+def _merge_settings(defaults, overrides):
+    merged = dict(defaults)
+    for key, value in (overrides or {}).items():
+        if isinstance(merged.get(key), dict) and isinstance(value, dict):
+            merged[key] = _merge_settings(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+# Validates that every top-level setting is a section (dictionary) known in the default settings.
+def _validate_runtime_settings(settings, defaults):
+    for section, values in settings.items():
+        if section not in defaults:
+            raise ValueError(f"Unknown runtime settings section '{section}'")
+        if not isinstance(values, dict):
+            raise ValueError(
+                f"Runtime settings section '{section}' must be a dictionary"
+            )
+    return settings
+
+
+# Short, stable identifier for a config — changes whenever its content changes.
+def _config_version(raw_config):
+    canonical = json.dumps(raw_config, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:12]
+
+
+# Everything files are matched against — the compiled document rules and their matchers, and the supported file types
+# and their extraction limits — with a version that changes whenever any of it does. A ruleset is never modified once
+# built: a reload builds a new one and swaps it in whole, so a request that took the current ruleset uses the same
+# version throughout.
+Ruleset = namedtuple(
+    "Ruleset",
+    [
+        "version",
+        "document_rules",
+        "content_matcher",
+        "filename_matcher",
+        "supported_filetypes",
+        "extraction_limits",
+    ],
+)
+
+_RULESET_CONFIGS = [("industry_rules.yaml", True), ("supported_filetypes.yaml", False)]
+
+
+# The files the ruleset would be loaded from, and when they last changed — an edited, added or removed override file
+# changes these.
+def _ruleset_sources():
+    sources = []
+    for filename, override in _RULESET_CONFIGS:
+        path = _config_path(filename, override)
+        stat = os.stat(path)
+        sources.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return sources
+
+
+# Load, validate and compile a ruleset from the current config files — raises if any of it is invalid. The rules come
+# from their precompiled artifact instead, if it was built from the same YAML.
+def build_ruleset():
+    rules_path = _config_path("industry_rules.yaml", True)
+    rules_bytes = rules_path.read_bytes()
+    compiled_rules = _load_compiled_rules(rules_path, rules_bytes)
+    if compiled_rules is None:
+        raw_rules = yaml.safe_load(rules_bytes)
+        document_rules = tuple(_compile_rules(raw_rules))
+        prefilters = None
+    else:
+        raw_rules, document_rules, prefilters = compiled_rules
+        document_rules = tuple(document_rules)
+
+    raw_filetypes = load_config("supported_filetypes.yaml", False)
+    supported_filetypes, extraction_limits = _split_filetypes(
+        _validate_filetypes(raw_filetypes)
+    )
+    return Ruleset(
+        version=_config_version({"rules": raw_rules, "filetypes": raw_filetypes}),
+        document_rules=document_rules,
+        content_matcher=ContentMatcher(document_rules, prefilters),
+        filename_matcher=FilenameMatcher(document_rules, prefilters),
+        supported_filetypes=supported_filetypes,
+        extraction_limits=extraction_limits,
+    )
+
+
+_ruleset_sources_loaded = _ruleset_sources()
+_ruleset = build_ruleset()
+_reload_lock = threading.Lock()
+_watcher_lock = threading.Lock()
+_watcher_pid = None
+
+# The rules and filetypes as loaded at startup, for scripts and tests — hot reloading doesn't update these, so the
+# service uses get_ruleset().
+DOCUMENT_RULES = _ruleset.document_rules
+SUPPORTED_FILETYPES = _ruleset.supported_filetypes
+
+
+# Reload the ruleset if its config files have changed since it was last loaded (or regardless, with force). The new
+# ruleset only replaces the current one once it has loaded and validated — otherwise the current one stays in use, and
+# the same files aren't retried until they change again. Returns the current ruleset, and the error if the reload
+# failed.
+def reload_ruleset(force=False):
+    global _ruleset, _ruleset_sources_loaded
+
+    with _reload_lock:
+        try:
+            sources = _ruleset_sources()
+            if sources == _ruleset_sources_loaded and not force:
+                return _ruleset, None
+            _ruleset_sources_loaded = sources
+            ruleset = build_ruleset()
+        # Whatever is wrong with the new config (unreadable files, invalid YAML, rules or patterns), keep serving.
+        except Exception as error:
+            record_ruleset_reload("invalid")
+            return _ruleset, error
+
+        if ruleset.version == _ruleset.version:
+            record_ruleset_reload("unchanged")
+        else:
+            _ruleset = ruleset
+            record_ruleset_reload("reloaded")
+        return _ruleset, None
+
+
+def _watch_ruleset(poll_interval_seconds):
+    while True:
+        time.sleep(poll_interval_seconds)
+        reload_ruleset()
+
+
+# Returns the current ruleset. With ruleset.watch, the first call in each process also starts a thread that polls the
+# ruleset's config files and reloads it when they change — threads don't survive a fork, so every gunicorn worker and
+# job worker process watches for itself.
+def get_ruleset():
+    global _watcher_pid
+
+    settings = RUNTIME_SETTINGS["ruleset"]
+    if settings["watch"] and _watcher_pid != os.getpid():
+        with _watcher_lock:
+            if _watcher_pid != os.getpid():
+                _watcher_pid = os.getpid()
+                threading.Thread(
+                    target=_watch_ruleset,
+                    args=(settings["poll_interval_seconds"],),
+                    name="ruleset-watcher",
+                    daemon=True,
+                ).start()
+
+    return _ruleset
+
+
+_DEFAULT_RUNTIME_SETTINGS = load_config("runtime_settings.yaml", False)
+RUNTIME_SETTINGS = _validate_runtime_settings(
+    _merge_settings(
+        _DEFAULT_RUNTIME_SETTINGS, load_config("runtime_settings.yaml", True)
+    ),
+    _DEFAULT_RUNTIME_SETTINGS,
+)
@@ -1,28 +1,151 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing, contextmanager
 from pathlib import Path
-import pytesseract
+import multiprocessing
+import os
+import threading
+import time
 from werkzeug.datastructures import FileStorage
-import pdfminer.high_level
-from pdfminer.pdfpage import PDFPage
 import tempfile
-from PIL import Image
 
-from pdf2image import convert_from_path
-import docx
-from openpyxl import load_workbook
+from .config_loader import RUNTIME_SETTINGS
+from .metrics import record_ocr_page, time_stage
+from .ocr_engines import get_ocr_engine
+from .ocr_preprocessing import open_image, preprocess_image, split_header_region
 
 
-_OCR_LANG = "eng"
 _SCANNED_PDF_MIN_CHARS = 50
+_SCANNED_PAGE_MIN_CHARS = 50
+_OCR_SETTINGS = RUNTIME_SETTINGS["ocr"]
 
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
 
-# Get extract from image using OCR.
+
+# Tracks text extraction against a file type's extraction limits (None for no limit). Extractors check it between pages
+# / rows and stop at the first limit reached, which is recorded in truncated_by.
+class ExtractionBudget:
+    def __init__(self, max_pages=None, max_rows=None, max_chars=None, max_seconds=None):
+        self._limits = {
+            "max_pages": max_pages,
+            "max_rows": max_rows,
+            "max_chars": max_chars,
+            "max_seconds": max_seconds,
+        }
+        self._deadline = (
+            time.monotonic() + max_seconds if max_seconds is not None else None
+        )
+        self._chars = 0
+        self.truncated_by = None
+
+    def _stop(self, limit):
+        if self.truncated_by is None:
+            self.truncated_by = limit
+        return False
+
+    def _allows(self, limit, number):
+        if self._limits[limit] is not None and number > self._limits[limit]:
+            return self._stop(limit)
+        if (
+            self._limits["max_chars"] is not None
+            and self._chars >= self._limits["max_chars"]
+        ):
+            return self._stop("max_chars")
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            return self._stop("max_seconds")
+        return True
+
+    # Whether extraction may go on to the given page (numbered from 1).
+    def allows_page(self, page_number):
+        return self._allows("max_pages", page_number)
+
+    # Whether extraction may go on to the given row (numbered from 1, across all tables / sheets).
+    def allows_row(self, row_number):
+        return self._allows("max_rows", row_number)
+
+    # Clip extracted text to the remaining character budget.
+    def take(self, text):
+        max_chars = self._limits["max_chars"]
+        if max_chars is not None and self._chars + len(text) > max_chars:
+            text = text[: max_chars - self._chars]
+            self._stop("max_chars")
+        self._chars += len(text)
+        return text
+
+    # Which limit truncated the extraction, and its value — None if extraction wasn't truncated.
+    def truncation(self):
+        if self.truncated_by is None:
+            return None
+        return {"limit": self.truncated_by, "value": self._limits[self.truncated_by]}
+
+
+# The extraction libraries are imported on first use rather than at startup, as importing them all is slow. Import
+# them up front (e.g., in a background warm-up) so the first request that needs them doesn't pay for it.
+def import_extractors():
+    import docx
+    import openpyxl
+    import pdf2image
+    import PIL.Image
+
+    from . import pdf_pages
+
+    get_ocr_engine()
+
+
+# Get the process pool shared by all requests for PDF page OCR, creating it on first use (i.e., after gunicorn has
+# forked). Pool processes are spawned rather than forked, so they don't inherit the worker's threads or loaded models.
+def _get_ocr_pool():
+    global _ocr_pool
+
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=_OCR_SETTINGS["pdf_page_workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    return _ocr_pool
+
+
+# Discard the OCR pool after one of its processes died (e.g., killed for running out of memory on a huge page, or a
+# crash in poppler / tesseract) — a broken pool fails every later submission, so the next caller creates a new one.
+def _discard_ocr_pool(pool):
+    global _ocr_pool
+
+    with _ocr_pool_lock:
+        if _ocr_pool is pool:
+            _ocr_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# OCR an image with the configured OCR engine (see ocr_engines.py).
+def _tesseract(img):
+    return get_ocr_engine().image_to_string(img).strip()
+
+
+# Get extract from image using OCR, preprocessing it first (see ocr_preprocessing.py).
 def _ocr_image(img):
-    return pytesseract.image_to_string(img, lang=_OCR_LANG).strip()
+    return _tesseract(preprocess_image(img))
+
+
+# OCR an image region by region — its header region first, if header-first OCR is enabled — yielding each region's
+# text, so the caller can stop as soon as the header is enough to classify the document.
+def _iter_ocr_image_regions(img, budget):
+    with time_stage("ocr_preprocessing"):
+        regions = split_header_region(preprocess_image(img))
+
+    record_ocr_page()
+    for region in regions:
+        with time_stage("ocr"):
+            region_text = _tesseract(region)
+        yield budget.take(region_text)
 
 
-# Extract machine-readable text from PDF.
-def _extract_pdf_text(path):
-    return pdfminer.high_level.extract_text(str(path)) or ""
+# Get the upload's stream, rewound, for the extraction libraries to read from directly — no temporary copy needed.
+def _rewound_stream(file):
+    file.stream.seek(0)
+    return file.stream
 
 
 # Rudimentary logic to get number of pages to perform OCR on for document scans (minimise processing time).
@@ -35,84 +158,241 @@ def pages_to_ocr(total_pages):
         return min(3, total_pages)
 
 
-# Convert pdf into images.
-def _ocr_pdf(path):
-    with open(path, "rb") as file:
-        num_pages = sum(1 for _ in PDFPage.get_pages(file))
+# Convert a single pdf page into an image — in grayscale straight away, if OCR preprocessing converts it anyway.
+def _rasterise_pdf_page(path, page_number):
+    from pdf2image import convert_from_path
 
-    last_page = pages_to_ocr(num_pages)
-    pages = convert_from_path(str(path), dpi=300, first_page=1, last_page=last_page)
+    preprocessing = _OCR_SETTINGS["preprocessing"]
+    (page,) = convert_from_path(
+        path,
+        dpi=_OCR_SETTINGS["pdf_dpi"],
+        first_page=page_number,
+        last_page=page_number,
+        grayscale=preprocessing["enabled"] and preprocessing["grayscale"],
+    )
+    return page
 
-    return " ".join(_ocr_image(p) for p in pages)
 
+# Convert a single pdf page into an image and OCR it.
+def _ocr_pdf_page(path, page_number):
+    return _ocr_image(_rasterise_pdf_page(path, page_number))
 
-# Extract text from pdf — fall back on OCR if machine-readable text is sparse.
-def _extract_pdf(path):
-    text = _extract_pdf_text(path)
 
-    if len(text.strip()) >= _SCANNED_PDF_MIN_CHARS:
-        return text
+# OCR the given pdf pages, yielding their text in page order — pages are spread across the OCR pool. If a pool process
+# dies, this file's extraction fails, but the pool is replaced for the requests after it.
+def _iter_ocr_pdf_pages(path, page_numbers):
+    if _OCR_SETTINGS["pdf_page_workers"] > 0 and len(page_numbers) > 1:
+        pool = _get_ocr_pool()
+        futures = []
+        try:
+            for page_number in page_numbers:
+                futures.append(pool.submit(_ocr_pdf_page, str(path), page_number))
+            for future in futures:
+                yield future.result()
+        except BrokenProcessPool:
+            _discard_ocr_pool(pool)
+            raise
+        finally:
+            # If the caller stopped early, don't OCR pages that haven't been started yet.
+            for future in futures:
+                future.cancel()
+    else:
+        for page_number in page_numbers:
+            yield _ocr_pdf_page(str(path), page_number)
+
+
+# A page is treated as a scan if it has (almost) no machine-readable text but draws an image.
+def _page_needs_ocr(page):
+    return page["has_images"] and len(page["text"].strip()) < _SCANNED_PAGE_MIN_CHARS
+
+
+# Get the page numbers of a pdf worth performing OCR on — only scanned pages, up to the OCR page budget.
+def _pdf_pages_to_ocr(pages, text):
+    scanned_pages = [page for page in pages if _page_needs_ocr(page)]
+
+    # No text and no images anywhere (e.g., text drawn as vector outlines) — OCR from the first page.
+    if not scanned_pages and len(text.strip()) < _SCANNED_PDF_MIN_CHARS:
+        scanned_pages = pages
+
+    return [page["page_number"] for page in scanned_pages][: pages_to_ocr(len(pages))]
 
-    return _ocr_pdf(path)
+
+# Extract text from pdf — its text layer, plus OCR of any scanned pages.
+def _extract_pdf(file, budget):
+    return " ".join(_iter_pdf(file, budget))
+
+
+# OCR the given pdf pages (see _iter_ocr_pdf_pages), stopping once the extraction budget runs out.
+def _iter_ocr_pdf_pages_within_budget(path, page_numbers, budget):
+    with closing(_iter_ocr_pdf_pages(path, page_numbers)) as page_texts:
+        for page_number in page_numbers:
+            if not budget.allows_page(page_number):
+                return
+            with time_stage("ocr"):
+                page_text = next(page_texts)
+            record_ocr_page()
+            yield budget.take(page_text)
+
+
+# Streaming version of _extract_pdf. The pdf is parsed once, page by page, deciding for each page whether it has a text
+# layer or is a scan. The text layer is yielded first, then OCR'd pages one at a time, so the caller can stop before any
+# (or all) of the expensive OCR. The first scanned page is OCR'd on its own (header region first, if header-first OCR is
+# enabled), as it is often enough to classify the document.
+def _iter_pdf(file, budget):
+    from .pdf_pages import iter_pdf_pages
+
+    pages, page_texts = [], []
+    with time_stage("text_extraction"):
+        for page in iter_pdf_pages(_rewound_stream(file)):
+            if not budget.allows_page(page["page_number"]):
+                break
+            pages.append(page)
+            page_texts.append(budget.take(page["text"]))
+
+    text = "".join(page_texts)
+    if text.strip():
+        yield text
+
+    page_numbers = _pdf_pages_to_ocr(pages, text)
+    if not page_numbers:
+        return
+
+    # Only scanned pages are rasterised — poppler can only rasterise pdfs on disk.
+    with _file_path(file, "pdf") as path:
+        if _OCR_SETTINGS["preprocessing"]["header_first"]["enabled"]:
+            if budget.allows_page(page_numbers[0]):
+                with time_stage("ocr"):
+                    first_page = _rasterise_pdf_page(str(path), page_numbers[0])
+                yield from _iter_ocr_image_regions(first_page, budget)
+        else:
+            yield from _iter_ocr_pdf_pages_within_budget(path, page_numbers[:1], budget)
+        yield from _iter_ocr_pdf_pages_within_budget(path, page_numbers[1:], budget)
 
 
 # Extract text from docx file paragraphs and table cells.
-def _extract_docx(path):
-    doc = docx.Document(str(path))
+def _extract_docx(stream, budget):
+    import docx
+
+    doc = docx.Document(stream)
     paragraphs = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
     tables = []
 
+    row_number = 0
     for table in doc.tables:
         for row in table.rows:
+            row_number += 1
+            if not budget.allows_row(row_number):
+                return budget.take("\n".join(paragraphs + tables))
+
             row_text = " ".join(
                 cell.text.strip() for cell in row.cells if cell.text.strip()
             )
             if row_text:
                 tables.append(row_text)
 
-    return "\n".join(paragraphs + tables)
+    return budget.take("\n".join(paragraphs + tables))
+
 
+# Extract text from xlsx file cells. The workbook is opened read-only, so rows are streamed rather than all loaded.
+def _extract_xlsx(stream, budget):
+    from openpyxl import load_workbook
 
-# Extract text from xlsx file cells.
-def _extract_xlsx(path):
-    wb = load_workbook(str(path), data_only=True)
+    wb = load_workbook(stream, read_only=True, data_only=True)
     text_lines = []
 
-    for sheet in wb.worksheets:
-        for row in sheet.iter_rows(values_only=True):
-            row_text = " ".join(
-                str(cell).strip()
-                for cell in row
-                if cell is not None and str(cell).strip()
-            )
-            if row_text:
-                text_lines.append(row_text)
+    try:
+        row_number = 0
+        for sheet in wb.worksheets:
+            for row in sheet.iter_rows(values_only=True):
+                row_number += 1
+                if not budget.allows_row(row_number):
+                    return "\n".join(text_lines)
 
-    return "\n".join(text_lines)
+                row_text = " ".join(
+                    str(cell).strip()
+                    for cell in row
+                    if cell is not None and str(cell).strip()
+                )
+                if row_text:
+                    text_lines.append(budget.take(row_text))
+    finally:
+        wb.close()
 
+    return "\n".join(text_lines)
 
-# Extract text from document, choosing extraction method based on file extension — this is safe as we've already verified the extension matches the MIME type.
-def extract_file_text(file, ext):
-    ext = ext.lower()
 
-    # Temporarily write file to disk
+# Temporarily write file to disk, removing it once the caller is done with it.
+@contextmanager
+def _temporary_copy(file, ext):
     with tempfile.NamedTemporaryFile(suffix=f".{ext}", delete=False) as temp_file:
+        _rewound_stream(file)
         file.save(temp_file)
         temp_path = Path(temp_file.name)
 
     try:
-        match ext:
-            case "pdf":
-                return _extract_pdf(temp_path)
-            case "docx":
-                return _extract_docx(temp_path)
-            case "xlsx":
-                return _extract_xlsx(temp_path)
-            case "png" | "jpg" | "jpeg" | "tiff" | "bmp":
-                return _ocr_image(Image.open(temp_path))
-            case _:
-                return None
+        yield temp_path
     finally:
         # Clean up the temporary file.
         if temp_path.exists():
             temp_path.unlink()
+
+
+# Get a path to the file, for tools that can only read files on disk — the stream's own file if it has one (e.g., a
+# spooled job's file), otherwise a temporary copy.
+@contextmanager
+def _file_path(file, ext):
+    name = getattr(file.stream, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        yield Path(name)
+        return
+
+    with _temporary_copy(file, ext) as temp_path:
+        yield temp_path
+
+
+# Extract text from document, choosing extraction method based on file extension — this is safe as we've already verified the extension matches the MIME type.
+# Text is extracted from the upload's stream in place; only scanned pdfs are written to disk (for rasterising).
+# Pass in an ExtractionBudget to stop extraction at the file type's extraction limits.
+def extract_file_text(file, ext, budget=None):
+    ext = ext.lower()
+    budget = budget or ExtractionBudget()
+
+    match ext:
+        case "pdf":
+            return _extract_pdf(file, budget)
+        case "docx":
+            with time_stage("text_extraction"):
+                return _extract_docx(_rewound_stream(file), budget)
+        case "xlsx":
+            with time_stage("text_extraction"):
+                return _extract_xlsx(_rewound_stream(file), budget)
+        case "png" | "jpg" | "jpeg" | "tiff" | "bmp":
+            with time_stage("ocr_preprocessing"):
+                img = preprocess_image(open_image(_rewound_stream(file)))
+            with time_stage("ocr"):
+                text = _tesseract(img)
+            record_ocr_page()
+            return budget.take(text)
+        case _:
+            return None
+
+
+# Streaming version of extract_file_text — yields text in chunks (one per OCR'd page for scanned pdfs, otherwise the
+# whole text at once). Joining the chunks with spaces gives the same text as extract_file_text — except that with
+# header-first OCR, images and the first scanned pdf page are OCR'd (and yielded) in two regions. Close the generator
+# (e.g., with contextlib.closing) to stop extraction early.
+def iter_file_text(file, ext, budget=None):
+    ext = ext.lower()
+    budget = budget or ExtractionBudget()
+
+    if ext in ("png", "jpg", "jpeg", "tiff", "bmp"):
+        yield from _iter_ocr_image_regions(open_image(_rewound_stream(file)), budget)
+        return
+
+    if ext != "pdf":
+        file_text = extract_file_text(file, ext, budget)
+        if file_text is not None:
+            yield file_text
+        return
+
+    yield from _iter_pdf(file, budget)
@@ -1,75 +1,301 @@
-from sentence_transformers import SentenceTransformer
-import joblib
+import hashlib
 import os
+import threading
 
-from .rule_matcher import regex_match_file_content
+from ..config_loader import RUNTIME_SETTINGS
+from ..metrics import time_stage
+from .embedders import EmbeddingBatcher, OnnxEmbedder, token_windows
+from .embedding_cache import EmbeddingCache
+from .head import LinearClassifierHead
+from .ngram import HashedNgramClassifier
+from .rule_matcher import ContentMatcher
 
 
 _MODEL_PATH = "src/classifier/file_content_classifier/models"
+_ONNX_MODEL_PATH = os.path.join(_MODEL_PATH, "onnx")
+_EMBEDDING_SETTINGS = RUNTIME_SETTINGS["embedding"]
+_NGRAM_SETTINGS = RUNTIME_SETTINGS["ngram_classifier"]
+_LAYOUT_SETTINGS = RUNTIME_SETTINGS["layout_classifier"]
+_LAYOUT_MODEL_PATH = "src/classifier/layout_classifier/models/layout_classifier.npz"
 
 
-# Initialise embedding model, classifier and label encoder.
-_embedder = SentenceTransformer(
-    open(os.path.join(_MODEL_PATH, "embedder.txt")).read().strip()
-)
-_classifier = joblib.load(os.path.join(_MODEL_PATH, "classifier.joblib"))
-_label_encoder = joblib.load(os.path.join(_MODEL_PATH, "label_encoder.joblib"))
+# Load the configured embedding backend — both backends expose encode(texts), returning one embedding per text.
+def _load_embedder():
+    backend = _EMBEDDING_SETTINGS["backend"]
 
+    if backend == "onnx":
+        return OnnxEmbedder(
+            os.path.join(_ONNX_MODEL_PATH, _EMBEDDING_SETTINGS["onnx_model"]),
+            os.path.join(_ONNX_MODEL_PATH, "tokenizer.json"),
+        )
+
+    if backend == "sentence_transformers":
+        from sentence_transformers import SentenceTransformer
 
-def classify_using_file_content(file_text, RULES, MIN_CONFIDENCE):
-    # Try rule-based matching.
-    for rule in RULES:
-        confidence, text_matches = regex_match_file_content(
-            rule.get("content_regex", []), file_text
+        return SentenceTransformer(
+            open(os.path.join(_MODEL_PATH, "embedder.txt")).read().strip()
         )
 
-        if confidence >= MIN_CONFIDENCE:
-            return {
+    raise ValueError(f"Unknown embedding backend '{backend}'")
+
+
+_models = None
+_models_lock = threading.Lock()
+
+
+# Returns the embedding model and classifier head, loading them on first use — loading the embedding model (and
+# importing torch) takes several seconds, and most requests are classified by filename without it.
+def load_models():
+    global _models
+
+    with _models_lock:
+        if _models is None:
+            base_embedder = embedder = _load_embedder()
+            batching = _EMBEDDING_SETTINGS["batching"]
+            if batching["enabled"]:
+                embedder = EmbeddingBatcher(
+                    embedder, batching["max_batch_size"], batching["max_wait_ms"]
+                )
+
+            cache = _EMBEDDING_SETTINGS["cache"]
+            if cache["enabled"]:
+                embedder = EmbeddingCache(
+                    embedder,
+                    lambda texts: token_windows(base_embedder, texts),
+                    EMBEDDER_VERSION,
+                    cache["memory_max_entries"],
+                    cache["disk_path"],
+                    cache["disk_max_entries"],
+                )
+
+            _models = (
+                embedder,
+                LinearClassifierHead(os.path.join(_MODEL_PATH, "classifier_head.npz")),
+            )
+
+    return _models
+
+
+_ngram_classifier = None
+
+
+# Returns the hashed n-gram classifier, loading it on first use (None if the tier is disabled). Loading it only reads a
+# small array file, so it doesn't need a lock — concurrent first calls just load it twice.
+def load_ngram_classifier():
+    global _ngram_classifier
+
+    if _NGRAM_SETTINGS["enabled"] and _ngram_classifier is None:
+        _ngram_classifier = HashedNgramClassifier(
+            os.path.join(_MODEL_PATH, "ngram_classifier.npz")
+        )
+    return _ngram_classifier
+
+
+# Identify the model artifacts in use, so cached results are invalidated when the model is rebuilt.
+# The ONNX backend's embeddings differ slightly from PyTorch's (more so when quantised), so it is part of the version.
+# Turning the n-gram or layout classifier on or off changes which results are given too, so the classifier version
+# includes both, and the layout model (and the confidence it must reach) while it is enabled.
+def _model_version(include_classifier_head=True):
+    artifacts = [os.path.join(_MODEL_PATH, "embedder.txt")]
+    settings = [_EMBEDDING_SETTINGS["backend"]]
+    if include_classifier_head:
+        artifacts += [
+            os.path.join(_MODEL_PATH, "classifier_head.npz"),
+            os.path.join(_MODEL_PATH, "ngram_classifier.npz"),
+        ]
+        settings += [
+            f"ngram_classifier.enabled={_NGRAM_SETTINGS['enabled']}",
+            f"layout_classifier.enabled={_LAYOUT_SETTINGS['enabled']}",
+        ]
+        if _LAYOUT_SETTINGS["enabled"]:
+            artifacts.append(_LAYOUT_MODEL_PATH)
+            settings.append(
+                f"layout_classifier.min_confidence={_LAYOUT_SETTINGS['min_confidence']}"
+            )
+    if _EMBEDDING_SETTINGS["backend"] == "onnx":
+        artifacts += [
+            os.path.join(_ONNX_MODEL_PATH, _EMBEDDING_SETTINGS["onnx_model"]),
+            os.path.join(_ONNX_MODEL_PATH, "tokenizer.json"),
+        ]
+
+    digest = hashlib.sha256()
+    digest.update("\n".join(settings).encode())
+    for artifact in artifacts:
+        with open(artifact, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+MODEL_VERSION = _model_version()
+# Cached embeddings only depend on the embedding model, so survive the classifiers being retrained.
+EMBEDDER_VERSION = _model_version(include_classifier_head=False)
+
+
+# Try rule-based matching — returns None if no rule reaches the required confidence.
+# Pass in a prebuilt ContentMatcher for RULES to avoid rebuilding it on every call.
+def classify_using_file_content_rules(
+    file_text, RULES, MIN_CONFIDENCE, content_matcher=None
+):
+    content_matcher = content_matcher or ContentMatcher(RULES)
+
+    with time_stage("content_regex"):
+        for rule, confidence, text_matches in content_matcher.match_rules(file_text):
+            if confidence >= MIN_CONFIDENCE:
+                return {
+                    "success": True,
+                    "data": {
+                        "label": rule["label"],
+                        "step": 3,
+                        "based_on": "file content",
+                        "match_type": "regex",
+                        "additional_info": {"text_matches": text_matches},
+                        "confidence": confidence,
+                    },
+                }
+
+    return None
+
+
+# Try the hashed n-gram classifier — returns a result for each text it classifies with the required confidence, and
+# None for the rest (and for every text, if the tier is disabled).
+def classify_using_ngrams(file_texts, MIN_CONFIDENCE):
+    ngram_classifier = load_ngram_classifier()
+    if ngram_classifier is None:
+        return [None] * len(file_texts)
+
+    with time_stage("content_ngram"):
+        labels, confidences, probabilities = ngram_classifier.score(file_texts)
+
+    results = []
+    for label, confidence, class_probabilities in zip(
+        labels, confidences, probabilities
+    ):
+        if confidence < MIN_CONFIDENCE:
+            results.append(None)
+            continue
+
+        results.append(
+            {
                 "success": True,
                 "data": {
-                    "label": rule["label"],
-                    "step": 3,
+                    "label": str(label),
+                    "step": 5,
                     "based_on": "file content",
-                    "match_type": "regex",
-                    "additional_info": {"text_matches": text_matches},
-                    "confidence": confidence,
+                    "match_type": "hashed n-grams + classifier",
+                    "additional_info": {
+                        "class_probabilities": dict(
+                            zip(
+                                ngram_classifier.labels.tolist(),
+                                class_probabilities.tolist(),
+                            )
+                        )
+                    },
+                    "confidence": float(confidence),
                 },
             }
+        )
 
-    # Fall back on use embedding + classifier if rule-based match confidence is insufficinet.
-    # Embed file text.
-    embedding = _embedder.encode([file_text])[0]
-
-    # Predict label with an associated level of confidence using classifier.
-    prediction = _classifier.predict([embedding])[0]
-    label = _label_encoder.inverse_transform([prediction])[0]
-    confidence = max(_classifier.predict_proba([embedding])[0])
-
-    if confidence >= MIN_CONFIDENCE:
-        return {
-            "success": True,
-            "data": {
-                "label": label,
-                "step": 4,
-                "based_on": "file content",
-                "match_type": "embedding + classifier",
-                "additional_info": {},
-                "confidence": confidence,
-            },
-        }
-
-    else:
-        return {
-            "success": False,
-            "error": {
-                "message": "Could not confidently classify document.",
-                "action": "Document saved for manual review.",
-                "code": "unclassifiable_file",
-                "details": {
-                    "final_predicted_label": label,
-                    "predicted_confidence": confidence,
-                    "min_confidence_required": MIN_CONFIDENCE,
-                    "fallback_model": "embedding + classifier",
-                },
-            },
-        }
+    return results
+
+
+# Embed file texts and predict labels — a single encode call and a single scoring call cover the whole batch.
+def classify_using_embeddings(file_texts, MIN_CONFIDENCE):
+    embedder, classifier_head = load_models()
+
+    # Embed file texts.
+    with time_stage("embedding"):
+        embeddings = embedder.encode(file_texts)
+
+    # Predict labels with an associated level of confidence using the classifier head.
+    with time_stage("predict_proba"):
+        labels, confidences, probabilities = classifier_head.score(embeddings)
+
+    results = []
+    for label, confidence, class_probabilities in zip(
+        labels, confidences, probabilities
+    ):
+        label, confidence = str(label), float(confidence)
+        class_probabilities = dict(
+            zip(classifier_head.labels.tolist(), class_probabilities.tolist())
+        )
+
+        if confidence >= MIN_CONFIDENCE:
+            results.append(
+                {
+                    "success": True,
+                    "data": {
+                        "label": label,
+                        "step": 4,
+                        "based_on": "file content",
+                        "match_type": "embedding + classifier",
+                        "additional_info": {"class_probabilities": class_probabilities},
+                        "confidence": confidence,
+                    },
+                }
+            )
+        else:
+            results.append(
+                {
+                    "success": False,
+                    "error": {
+                        "message": "Could not confidently classify document.",
+                        "action": "Document saved for manual review.",
+                        "code": "unclassifiable_file",
+                        "details": {
+                            "final_predicted_label": label,
+                            "predicted_confidence": confidence,
+                            "min_confidence_required": MIN_CONFIDENCE,
+                            "class_probabilities": class_probabilities,
+                            "fallback_model": "embedding + classifier",
+                        },
+                    },
+                }
+            )
+
+    return results
+
+
+# Classify file texts with the models — the hashed n-gram classifier first, then the embedding model for the texts it
+# isn't confident about, so those that it is skip the transformer.
+def classify_using_models(file_texts, MIN_CONFIDENCE):
+    results = classify_using_ngrams(file_texts, MIN_CONFIDENCE)
+
+    unresolved = [i for i, result in enumerate(results) if result is None]
+    if unresolved:
+        embedding_results = classify_using_embeddings(
+            [file_texts[i] for i in unresolved], MIN_CONFIDENCE
+        )
+        for i, result in zip(unresolved, embedding_results):
+            results[i] = result
+
+    return results
+
+
+def classify_using_file_content(file_text, RULES, MIN_CONFIDENCE, content_matcher=None):
+    return classify_using_file_content_batch(
+        [file_text], RULES, MIN_CONFIDENCE, content_matcher
+    )[0]
+
+
+# Classify several file texts at once — rules run per text, then every text still unresolved is scored by the models together.
+def classify_using_file_content_batch(
+    file_texts, RULES, MIN_CONFIDENCE, content_matcher=None
+):
+    content_matcher = content_matcher or ContentMatcher(RULES)
+    results = [
+        classify_using_file_content_rules(
+            file_text, RULES, MIN_CONFIDENCE, content_matcher
+        )
+        for file_text in file_texts
+    ]
+
+    # Fall back on the models if rule-based match confidence is insufficient.
+    unresolved = [i for i, result in enumerate(results) if result is None]
+    if unresolved:
+        model_results = classify_using_models(
+            [file_texts[i] for i in unresolved], MIN_CONFIDENCE
+        )
+        for i, result in zip(unresolved, model_results):
+            results[i] = result
+
+    return results
@@ -0,0 +1,170 @@
+from concurrent.futures import Future
+import numpy as np
+import os
+import queue
+import threading
+import time
+
+from ..metrics import observe_embedding_batch
+
+
+# Embeds text with an ONNX export of the sentence embedding model (see scripts/export_onnx_embedder.py), run on
+# onnxruntime — avoids loading torch, and supports the dynamically quantised int8 export. Has the same encode
+# interface as SentenceTransformer, and returns the same (normalised) embeddings, up to quantisation error.
+class OnnxEmbedder:
+    def __init__(self, model_path, tokenizer_path, batch_size=32):
+        from tokenizers import Tokenizer
+
+        self._model_path = model_path
+        self._batch_size = batch_size
+
+        # Truncation to the model's max sequence length is saved in the tokenizer file itself.
+        self._tokenizer = Tokenizer.from_file(tokenizer_path)
+        self._tokenizer.enable_padding()
+
+        self._session = None
+        self._session_pid = None
+        self._get_session()
+
+    # Returns this process's inference session. The session's thread pool doesn't survive a fork, so a forked worker
+    # (e.g. under gunicorn's preload_app) creates its own session on first use.
+    def _get_session(self):
+        if self._session is None or self._session_pid != os.getpid():
+            import onnxruntime
+
+            self._session = onnxruntime.InferenceSession(
+                self._model_path, providers=["CPUExecutionProvider"]
+            )
+            self._session_pid = os.getpid()
+            self._input_names = [
+                model_input.name for model_input in self._session.get_inputs()
+            ]
+        return self._session
+
+    # The token ids the model sees for each text — normalised by the tokenizer, and truncated to the max sequence length.
+    def token_windows(self, texts):
+        return [
+            encoding.ids[: sum(encoding.attention_mask)]
+            for encoding in self._tokenizer.encode_batch(texts)
+        ]
+
+    def encode(self, texts):
+        session = self._get_session()
+        embeddings = []
+
+        for start in range(0, len(texts), self._batch_size):
+            encodings = self._tokenizer.encode_batch(
+                texts[start : start + self._batch_size]
+            )
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array(
+                    [e.attention_mask for e in encodings], dtype=np.int64
+                ),
+                "token_type_ids": np.array(
+                    [e.type_ids for e in encodings], dtype=np.int64
+                ),
+            }
+            (batch_embeddings,) = session.run(
+                None, {name: inputs[name] for name in self._input_names}
+            )
+            embeddings.append(batch_embeddings)
+
+        return np.vstack(embeddings)
+
+
+# Collects encode calls from concurrent threads (e.g. the ASGI app's content workers) into shared batches, rather than
+# encoding one document per call. The first waiting call holds the batch open for up to max_wait_ms, or until
+# max_batch_size texts are waiting, then a single encode covers them all and each caller gets its own embeddings back.
+# Has the same encode interface as the embedder it wraps.
+class EmbeddingBatcher:
+    def __init__(self, embedder, max_batch_size=32, max_wait_ms=5):
+        self._embedder = embedder
+        self._max_batch_size = max_batch_size
+        self._max_wait_seconds = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._requests = None
+        self._requests_pid = None
+
+    # Returns this process's request queue, starting the thread that batches it — threads don't survive a fork, so a
+    # forked worker starts its own on first use.
+    def _get_requests(self):
+        with self._lock:
+            if self._requests is None or self._requests_pid != os.getpid():
+                self._requests = queue.SimpleQueue()
+                self._requests_pid = os.getpid()
+                threading.Thread(
+                    target=self._run,
+                    args=(self._requests,),
+                    name="embedding-batcher",
+                    daemon=True,
+                ).start()
+        return self._requests
+
+    def encode(self, texts):
+        future = Future()
+        self._get_requests().put((list(texts), future))
+        return future.result()
+
+    # Stop this process's batching thread, once it has encoded any requests already waiting — only once callers have
+    # stopped calling encode.
+    def close(self):
+        with self._lock:
+            if self._requests is not None and self._requests_pid == os.getpid():
+                self._requests.put(None)
+            self._requests = None
+
+    def _run(self, requests):
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+
+            batch = [request]
+            batch_size = len(request[0])
+            deadline = time.monotonic() + self._max_wait_seconds
+
+            while batch_size < self._max_batch_size:
+                try:
+                    request = requests.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._encode_batch(batch)
+                    return
+                batch.append(request)
+                batch_size += len(request[0])
+
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        texts = [text for request_texts, _ in batch for text in request_texts]
+        observe_embedding_batch(len(texts))
+
+        try:
+            embeddings = self._embedder.encode(texts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        start = 0
+        for request_texts, future in batch:
+            future.set_result(embeddings[start : start + len(request_texts)])
+            start += len(request_texts)
+
+
+# The token ids each text is embedded from, whichever backend is in use — after the tokenizer's normalisation
+# (lowercasing, whitespace, accents) and truncation to the model's max sequence length. Texts with the same token window
+# have the same embedding.
+def token_windows(embedder, texts):
+    if isinstance(embedder, OnnxEmbedder):
+        return embedder.token_windows(texts)
+
+    features = embedder.tokenize(texts)
+    return [
+        input_ids[attention_mask.bool()].tolist()
+        for input_ids, attention_mask in zip(
+            features["input_ids"], features["attention_mask"]
+        )
+    ]
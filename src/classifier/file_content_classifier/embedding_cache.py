@@ -0,0 +1,259 @@
+from collections import OrderedDict
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+
+from ..metrics import record_embedding_cache_lookup
+
+
+_DISK_MAGIC = b"EMBCACHE"
+_DISK_FORMAT_VERSION = 1
+_DISK_HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("format_version", "<u4"),
+        ("dimension", "<u4"),
+        ("sets", "<u8"),
+        ("ways", "<u4"),
+    ]
+)
+# Entries start on a page boundary after the header.
+_DISK_HEADER_BYTES = 4096
+
+
+# Digest of the namespace (the embedding model version) and a text's token window.
+def _window_key(namespace, window):
+    digest = hashlib.blake2b(namespace.encode(), digest_size=16)
+    digest.update(np.asarray(window, dtype="<i8").tobytes())
+    return digest.digest()
+
+
+# The embedding dimension of an existing disk tier file, or None if there isn't a valid one.
+def _stored_dimension(path):
+    try:
+        with open(path, "rb") as file:
+            header = np.frombuffer(
+                file.read(_DISK_HEADER_DTYPE.itemsize), dtype=_DISK_HEADER_DTYPE
+            )
+    except FileNotFoundError:
+        return None
+
+    if (
+        len(header)
+        and header["magic"][0] == _DISK_MAGIC
+        and header["format_version"][0] == _DISK_FORMAT_VERSION
+    ):
+        return int(header["dimension"][0])
+    return None
+
+
+# Fixed-size, set-associative file of embeddings, memory-mapped by every process that uses it — so it survives
+# restarts, and an embedding computed by one gunicorn worker is read by the others without a copy through a database.
+# A key can only be stored in one set of `ways` slots (chosen by its digest); when the set is full, its least recently
+# used entry is evicted. Access is serialised between processes with a lock on the file (shared for reads, exclusive
+# for writes), and between this process's threads by the caller.
+class _DiskEmbeddingStore:
+    def __init__(self, path, dimension, max_entries, ways=8):
+        self._path = path
+        self.dimension = dimension
+        self._ways = ways
+        self._sets = max(math.ceil(max_entries / ways), 1)
+        self._entry_dtype = np.dtype(
+            [
+                ("key", "S16"),
+                ("last_used_at", "<f8"),
+                ("vector", "<f4", (dimension,)),
+            ]
+        )
+
+        self._fd = None
+        self._fd_pid = None
+        self._entries = None
+        self._open()
+
+    # Returns this process's mapping of the file. A forked worker opens the file again — file locks are shared by
+    # everything using the same open file, so a descriptor inherited from the parent wouldn't exclude it.
+    def _open(self):
+        if self._fd is not None and self._fd_pid == os.getpid():
+            return self._entries
+
+        header = np.zeros((), dtype=_DISK_HEADER_DTYPE)
+        header["magic"] = _DISK_MAGIC
+        header["format_version"] = _DISK_FORMAT_VERSION
+        header["dimension"] = self.dimension
+        header["sets"] = self._sets
+        header["ways"] = self._ways
+        size = _DISK_HEADER_BYTES + self._sets * self._ways * self._entry_dtype.itemsize
+
+        # A file with a different layout (e.g. after a model change) is replaced with an empty one, rather than resized
+        # in place — processes still mapping the old file keep using it, instead of faulting on truncated pages.
+        while True:
+            fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                # Another process may have replaced the file between it being opened and locked.
+                if os.fstat(fd).st_ino == os.stat(self._path).st_ino:
+                    if (
+                        os.pread(fd, _DISK_HEADER_DTYPE.itemsize, 0) == header.tobytes()
+                        and os.fstat(fd).st_size == size
+                    ):
+                        break
+
+                    temporary_path = f"{self._path}.{os.getpid()}.tmp"
+                    with open(temporary_path, "wb") as file:
+                        file.write(header.tobytes())
+                        file.truncate(size)
+                    os.replace(temporary_path, self._path)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+        self._fd = fd
+        self._fd_pid = os.getpid()
+        self._entries = np.ndarray(
+            (self._sets, self._ways),
+            dtype=self._entry_dtype,
+            buffer=mmap.mmap(fd, size),
+            offset=_DISK_HEADER_BYTES,
+        )
+        return self._entries
+
+    def _set_index(self, key):
+        return int.from_bytes(key[:8], "little") % self._sets
+
+    # Returns a copy of the stored embedding, or None on a miss.
+    def get(self, key):
+        entries = self._open()
+        entry_set = entries[self._set_index(key)]
+
+        fcntl.flock(self._fd, fcntl.LOCK_SH)
+        try:
+            (ways,) = np.nonzero(entry_set["key"] == key)
+            if not len(ways):
+                return None
+            vector = np.array(entry_set["vector"][ways[0]])
+            # Racing readers may overwrite each other's access times — eviction order only needs to be approximate.
+            entry_set["last_used_at"][ways[0]] = time.time()
+            return vector
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def set(self, key, vector):
+        entries = self._open()
+        entry_set = entries[self._set_index(key)]
+
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            (ways,) = np.nonzero(entry_set["key"] == key)
+            # Fill an empty slot first (its access time is 0), else evict the least recently used entry.
+            way = ways[0] if len(ways) else int(entry_set["last_used_at"].argmin())
+            entry_set[way] = (key, time.time(), vector)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+# Cache of text embeddings, in front of an embedder — keyed on the token window the model actually embeds (see
+# embedders.token_windows), so re-saved or re-scanned documents whose extracted text only differs in case, whitespace,
+# or beyond the model's max sequence length skip the transformer. Two tiers: a bounded in-process LRU, in front of an
+# optional memory-mapped file shared between workers (see _DiskEmbeddingStore). Has the same encode interface as the
+# embedder it wraps, which only receives the texts missing from both tiers.
+class EmbeddingCache:
+    def __init__(
+        self,
+        embedder,
+        token_windows,
+        namespace,
+        memory_max_entries,
+        disk_path=None,
+        disk_max_entries=None,
+    ):
+        self._embedder = embedder
+        self._token_windows = token_windows
+        self._namespace = namespace
+        self._memory_max_entries = memory_max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._disk_path = disk_path
+        self._disk_max_entries = disk_max_entries
+        self._disk = None
+
+    def encode(self, texts):
+        keys = [
+            _window_key(self._namespace, window)
+            for window in self._token_windows(list(texts))
+        ]
+
+        embeddings = {}
+        with self._lock:
+            for key in keys:
+                if key not in embeddings:
+                    embeddings[key] = self._get(key)
+
+        # Embed each missing token window once, even if several texts share it.
+        missing_texts = {}
+        for key, text in zip(keys, texts):
+            if embeddings[key] is None and key not in missing_texts:
+                missing_texts[key] = text
+
+        if missing_texts:
+            missing_embeddings = self._embedder.encode(list(missing_texts.values()))
+            with self._lock:
+                for key, embedding in zip(missing_texts, missing_embeddings):
+                    embedding = np.asarray(embedding, dtype=np.float32)
+                    embeddings[key] = embedding
+                    self._set(key, embedding)
+
+        return np.vstack([embeddings[key] for key in keys])
+
+    # Returns the disk tier (None if disabled). Its file is sized by the embedding dimension — an existing file's
+    # dimension is used until the first embedding computed by this process shows whether it still matches.
+    def _get_disk(self, dimension=None):
+        if not self._disk_path:
+            return None
+
+        dimension = dimension or _stored_dimension(self._disk_path)
+        if dimension is None:
+            return None
+        if self._disk is None or self._disk.dimension != dimension:
+            self._disk = _DiskEmbeddingStore(
+                self._disk_path, dimension, self._disk_max_entries
+            )
+        return self._disk
+
+    def _get(self, key):
+        embedding = self._memory.get(key)
+        if embedding is not None:
+            self._memory.move_to_end(key)
+            record_embedding_cache_lookup("memory_hit")
+            return embedding
+
+        disk = self._get_disk()
+        if disk is not None:
+            embedding = disk.get(key)
+            if embedding is not None:
+                self._set_memory(key, embedding)
+                record_embedding_cache_lookup("disk_hit")
+                return embedding
+
+        record_embedding_cache_lookup("miss")
+        return None
+
+    def _set(self, key, embedding):
+        self._set_memory(key, embedding)
+
+        disk = self._get_disk(embedding.shape[-1])
+        if disk is not None:
+            disk.set(key, embedding)
+
+    def _set_memory(self, key, embedding):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_max_entries:
+            self._memory.popitem(last=False)
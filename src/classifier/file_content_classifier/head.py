@@ -0,0 +1,41 @@
+import numpy as np
+
+
+# The logistic regression classifier head, as exported by scripts/build_classifier.py — its weights, biases and labels
+# as plain arrays. Scores a batch of embeddings with one matrix product, without scikit-learn (or unpickling).
+# Reproduces LogisticRegression.predict_proba: one-vs-rest models (e.g. the liblinear solver) normalise each class's
+# sigmoid, multinomial models take a softmax.
+class LinearClassifierHead:
+    def __init__(self, path):
+        with np.load(path) as head:
+            self._coef = head["coef"]
+            self._intercept = head["intercept"]
+            self.labels = head["labels"]
+            self._multi_class = str(head["multi_class"])
+
+    # Each class's score for each embedding.
+    def decision_function(self, embeddings):
+        return np.asarray(embeddings) @ self._coef.T + self._intercept
+
+    def predict_proba(self, embeddings):
+        scores = self.decision_function(embeddings)
+
+        if self._multi_class == "multinomial":
+            # Binary models have a single row of weights, scoring the second class against the first.
+            if scores.shape[1] == 1:
+                scores = np.hstack([-scores, scores])
+            exp_scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            return exp_scores / exp_scores.sum(axis=1, keepdims=True)
+
+        probabilities = 1 / (1 + np.exp(-scores))
+        if probabilities.shape[1] == 1:
+            return np.hstack([1 - probabilities, probabilities])
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    # Returns each embedding's predicted label and its probability (the confidence), plus the full per-class
+    # distributions (columns in the order of self.labels).
+    def score(self, embeddings):
+        probabilities = self.predict_proba(embeddings)
+        predictions = probabilities.argmax(axis=1)
+        confidences = probabilities[np.arange(len(predictions)), predictions]
+        return self.labels[predictions], confidences, probabilities
@@ -0,0 +1,83 @@
+import re
+import zlib
+
+import numpy as np
+
+from .head import LinearClassifierHead
+
+
+_WORD_PATTERN = re.compile(r"\w\w+")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# Multiplier of the polynomial rolling hash, and of the final mixing step (both odd 64-bit constants).
+_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+_MIX_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+# Polynomial hashes of every n-gram of the sequence, for each n in ngram_range — computed for all n-grams at once, with
+# arithmetic wrapping around at 64 bits. Each n (and each kind of n-gram) starts from a different seed, so equal
+# sequences of different kinds don't collide.
+def _ngram_hashes(sequence, ngram_range, seed):
+    hashes = []
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        count = len(sequence) - n + 1
+        if count <= 0:
+            continue
+        ngram_hashes = np.full(count, seed * 31 + n, dtype=np.uint64)
+        for offset in range(n):
+            ngram_hashes = (
+                ngram_hashes * _HASH_MULTIPLIER + sequence[offset : offset + count]
+            )
+        hashes.append(ngram_hashes)
+    return hashes
+
+
+# Hashed bag of character and word n-grams of a text — returns the indices of its non-zero features (out of
+# n_features) and their values: log-scaled n-gram counts, normalised to unit length. Features are hashed rather than
+# learned from a vocabulary, so the same function produces the training features (see scripts/build_classifier.py) and
+# the serving features, and no vocabulary needs to be stored. Character n-grams are taken over the text's UTF-8 bytes.
+def hashed_ngram_features(text, n_features, char_ngram_range, word_ngram_range):
+    text = _WHITESPACE_PATTERN.sub(" ", text.lower()).strip()
+    characters = np.frombuffer(f" {text} ".encode(), dtype=np.uint8).astype(np.uint64)
+    words = np.fromiter(
+        (zlib.crc32(word.encode()) for word in _WORD_PATTERN.findall(text)),
+        dtype=np.uint64,
+    )
+
+    hashes = _ngram_hashes(characters, char_ngram_range, seed=1) + _ngram_hashes(
+        words, word_ngram_range, seed=2
+    )
+    if not hashes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    # Mix the high bits into the low bits before taking the remainder.
+    hashes = np.concatenate(hashes) * _MIX_MULTIPLIER
+    hashes ^= hashes >> np.uint64(29)
+    indices, counts = np.unique(
+        (hashes % np.uint64(n_features)).astype(np.int64), return_counts=True
+    )
+    values = np.log1p(counts)
+    return indices, values / np.linalg.norm(values)
+
+
+# Linear classifier over hashed n-gram features, as exported by scripts/build_classifier.py — a cheap tier run before
+# the embedding model. Scores texts directly: each text's scores only read the weights of its own n-grams.
+class HashedNgramClassifier(LinearClassifierHead):
+    def __init__(self, path):
+        super().__init__(path)
+
+        with np.load(path) as head:
+            self._n_features = int(head["n_features"])
+            self._char_ngram_range = tuple(head["char_ngram_range"].tolist())
+            self._word_ngram_range = tuple(head["word_ngram_range"].tolist())
+
+    def features(self, text):
+        return hashed_ngram_features(
+            text, self._n_features, self._char_ngram_range, self._word_ngram_range
+        )
+
+    def decision_function(self, texts):
+        scores = np.empty((len(texts), self._coef.shape[0]))
+        for i, text in enumerate(texts):
+            indices, values = self.features(text)
+            scores[i] = self._coef[:, indices] @ values
+        return scores + self._intercept
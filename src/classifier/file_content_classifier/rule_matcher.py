@@ -1,3 +1,6 @@
+from ..pattern_prefilter import fold_case, literal_prefilter
+
+
 # Tunable scoring constants.
 _BASE_SCORE = 0.60  # Score once every required pattern is found
 _ADDITIONAL_RANGE = 0.35  # Max confidence boost from supporting patterns
@@ -7,29 +10,31 @@ if _BASE_SCORE + _ADDITIONAL_RANGE > 1.0:
     raise ValueError("Combined _BASE_SCORE and _ADDITIONAL_RANGE must not exceed 1.0")
 
 
-# Search file text content for regex pattern matches.
-def regex_match_file_content(file_content_patterns, file_text):
-    # Store found matches.
-    text_matches = {
+def _empty_text_matches():
+    return {
         "required": [],
         "supporting": [],
         "negative": [],
     }
 
-    # Exit early if no text is passed in.
-    if not file_text:
-        return 0, text_matches
+
+# Score file text content against a rule's patterns.
+# search(pattern) must return the pattern's first match in the text (or None), and find_all(pattern) all of its
+# non-overlapping matches — i.e., pattern.search / pattern.finditer, or cached results of those.
+def _score_file_content(file_content_patterns, search, find_all):
+    # Store found matches.
+    text_matches = _empty_text_matches()
 
     # Check for negative matches — if any are found, disqualify early.
     for pattern in file_content_patterns.get("negative", []):
-        match = pattern.search(file_text)
+        match = search(pattern)
         if match:
             text_matches["negative"].append(match.group())
             return 0, text_matches
 
     # Check that all required patterns are present — if any are not found, disqualify.
     for pattern in file_content_patterns.get("required", []):
-        match = pattern.search(file_text)
+        match = search(pattern)
         if match:
             text_matches["required"].append(match.group())
         else:
@@ -37,7 +42,7 @@ def regex_match_file_content(file_content_patterns, file_text):
 
     # Search for supporting matches.
     for pattern in file_content_patterns.get("supporting", []):
-        for match in pattern.finditer(file_text):
+        for match in find_all(pattern):
             text_matches["supporting"].append(match.group())
 
     # Calculate confidence level based on found matches.
@@ -51,3 +56,85 @@ def regex_match_file_content(file_content_patterns, file_text):
     confidence = _BASE_SCORE + (frac * _ADDITIONAL_RANGE)
 
     return confidence, text_matches
+
+
+# Search file text content for regex pattern matches.
+def regex_match_file_content(file_content_patterns, file_text):
+    # Exit early if no text is passed in.
+    if not file_text:
+        return 0, _empty_text_matches()
+
+    return _score_file_content(
+        file_content_patterns,
+        lambda pattern: pattern.search(file_text),
+        lambda pattern: pattern.finditer(file_text),
+    )
+
+
+# Matches file text against the content patterns of every rule at once. Each distinct pattern (across all rules) is
+# searched at most once per text, and only if the text contains the pattern's literal prefilter — the results go into a
+# shared table that every rule is scored from. Scores and text matches are identical to regex_match_file_content.
+# prefilters may hold patterns' literal prefilters already worked out (e.g., by a precompiled ruleset).
+class ContentMatcher:
+    def __init__(self, rules, prefilters=None):
+        self._rules = rules
+        self._prefilters = {}
+        prefilters = prefilters or {}
+
+        for rule in rules:
+            for patterns in rule.get("content_regex", {}).values():
+                for pattern in patterns:
+                    if pattern not in self._prefilters:
+                        self._prefilters[pattern] = (
+                            prefilters[pattern]
+                            if pattern in prefilters
+                            else literal_prefilter(pattern)
+                        )
+
+    # Yield (rule, confidence, text_matches) for each rule, in rule order. Patterns are only searched for when a rule
+    # first needs them, so stopping early also skips the remaining searches.
+    def match_rules(self, file_text):
+        # Exit early if no text is passed in.
+        if not file_text:
+            for rule in self._rules:
+                yield rule, 0, _empty_text_matches()
+            return
+
+        lowered_text = None
+        searches = {}
+        all_matches = {}
+
+        def may_match(pattern):
+            nonlocal lowered_text
+
+            prefilter = self._prefilters.get(pattern)
+            if prefilter is None:
+                return True
+
+            literal, ignore_case = prefilter
+            if not ignore_case:
+                return literal in file_text
+
+            if lowered_text is None:
+                lowered_text = fold_case(file_text)
+            return literal in lowered_text
+
+        def search(pattern):
+            if pattern not in searches:
+                searches[pattern] = (
+                    pattern.search(file_text) if may_match(pattern) else None
+                )
+            return searches[pattern]
+
+        def find_all(pattern):
+            if pattern not in all_matches:
+                all_matches[pattern] = (
+                    list(pattern.finditer(file_text)) if may_match(pattern) else []
+                )
+            return all_matches[pattern]
+
+        for rule in self._rules:
+            confidence, text_matches = _score_file_content(
+                rule.get("content_regex", {}), search, find_all
+            )
+            yield rule, confidence, text_matches
@@ -1,4 +1,8 @@
+from collections import defaultdict
 from rapidfuzz import fuzz, process
+import numpy as np
+
+from ..pattern_prefilter import fold_case, literal_prefilter
 
 
 # In production, the threshold for fuzzy search should tuned by assessing balance between false positives vs. missed matches. For simplicity, in this task I've set it as equal to the MIN_CONFIDENCE rating used throughout the pipeline.
@@ -31,3 +35,92 @@ def get_fuzzy_score(fuzzy_keywords, filename):
         return score, best_match
     else:
         return score, None
+
+
+# Matches a filename against the filename rules of every rule at once, with the same results (and first-match
+# precedence) as calling regex_match_filename / get_fuzzy_score rule by rule:
+# - Filename regexes are indexed by the first trigram of the literal every match of the pattern must contain (see
+#   literal_prefilter). Only patterns whose trigram occurs in the filename (plus any patterns without a usable literal)
+#   are searched, in precedence order, so the cost depends on the filename rather than on the number of rules.
+# - All fuzzy keywords go into one flat table, indexed by the rule each keyword belongs to, and are scored against the
+#   filename in a single cdist call.
+# As with ContentMatcher, prefilters may hold patterns' literal prefilters already worked out.
+class FilenameMatcher:
+    def __init__(self, rules, prefilters=None):
+        prefilters = prefilters or {}
+
+        # Filename regexes, flattened in precedence order.
+        self._regex_entries = [
+            (rule, pattern)
+            for rule in rules
+            for pattern in rule.get("filename_regex", [])
+        ]
+
+        self._regex_index = defaultdict(list)
+        self._unindexed_regex_entries = []
+        for entry_index, (_, pattern) in enumerate(self._regex_entries):
+            prefilter = (
+                prefilters[pattern]
+                if pattern in prefilters
+                else literal_prefilter(pattern)
+            )
+            if prefilter is None:
+                self._unindexed_regex_entries.append(entry_index)
+            else:
+                literal, _ = prefilter
+                self._regex_index[literal[:3].lower()].append(entry_index)
+
+        # Fuzzy keywords, flattened in rule order. For each keyword, index the rule it belongs to and the (contiguous)
+        # range of positions that rule's keywords occupy.
+        self._keywords = []
+        self._keyword_rules = []
+        self._keyword_ranges = []
+        for rule in rules:
+            keywords = rule.get("fuzzy_keywords", [])
+            keyword_range = (len(self._keywords), len(self._keywords) + len(keywords))
+            self._keywords.extend(keywords)
+            self._keyword_rules.extend([rule] * len(keywords))
+            self._keyword_ranges.extend([keyword_range] * len(keywords))
+
+    # Find the first rule (in rule order) with a filename regex match — returns (rule, matching_text) or None.
+    def match_regex(self, filename):
+        folded_filename = fold_case(filename)
+
+        candidates = set(self._unindexed_regex_entries)
+        for i in range(len(folded_filename) - 2):
+            candidates.update(self._regex_index.get(folded_filename[i : i + 3], ()))
+
+        for entry_index in sorted(candidates):
+            rule, pattern = self._regex_entries[entry_index]
+            match = pattern.search(filename)
+            if match:
+                return rule, match.group()
+
+        return None
+
+    # Find the first rule (in rule order) whose best fuzzy keyword score reaches the threshold — returns
+    # (rule, score, best_matching_text) or None.
+    def match_fuzzy(self, filename):
+        if not self._keywords:
+            return None
+
+        # Scores below the threshold are never used, so let the scorer give up on those early (they come back as 0).
+        scores = process.cdist(
+            [filename],
+            self._keywords,
+            scorer=fuzz.partial_ratio,
+            score_cutoff=_FUZZY_THRESHOLD,
+            dtype=np.float64,
+        )[0]
+
+        # Keywords are in rule order, so the first keyword over the threshold belongs to the first rule that matches.
+        matching_keywords = np.flatnonzero(scores >= _FUZZY_THRESHOLD)
+        if matching_keywords.size == 0:
+            return None
+
+        rule = self._keyword_rules[matching_keywords[0]]
+        start, end = self._keyword_ranges[matching_keywords[0]]
+
+        # As with extractOne, ties go to the first keyword listed.
+        best_index = start + int(np.argmax(scores[start:end]))
+        return rule, float(scores[best_index]), self._keywords[best_index]
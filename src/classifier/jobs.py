@@ -0,0 +1,216 @@
+from pathlib import Path
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# Result stored for a job that couldn't be finished.
+def _job_failure(message, code, details):
+    return {
+        "success": False,
+        "error": {
+            "message": message,
+            "action": "Retry the request; if the problem persists, contact support.",
+            "code": code,
+            "details": details,
+        },
+    }
+
+
+# Local job queue backed by SQLite — no external broker needed. Uploaded files are spooled to disk while their job is
+# queued, so any process with access to the database and spool directory (API or job worker) can see or run the job.
+class JobQueue:
+    def __init__(self, queue_path, spool_dir):
+        self._queue_path = queue_path
+        self._spool_dir = Path(spool_dir)
+        self._spool_dir.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    file_ext TEXT NOT NULL,
+                    spool_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    status_code INTEGER,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at)"
+            )
+
+    # One connection per thread — sqlite3 connections can't be shared between threads.
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self._queue_path, timeout=30, isolation_level=None
+            )
+            self._local.connection = connection
+        return connection
+
+    # Spool the file to disk and queue a job for it.
+    def enqueue(self, file, file_ext):
+        job_id = uuid.uuid4().hex
+        spool_path = self._spool_dir / f"{job_id}.{file_ext}"
+
+        file.stream.seek(0)
+        file.save(spool_path)
+
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs VALUES (?, ?, ?, ?, 'queued', NULL, NULL, ?, ?)",
+            (job_id, file.filename, file_ext, str(spool_path), now, now),
+        )
+        return job_id
+
+    # Atomically take the oldest queued job — returns None if the queue is empty. The job's updated_at records when it
+    # was claimed, which fail_expired measures its lease from.
+    def claim(self):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT id, filename, file_ext, spool_path FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                    (time.time(), row[0]),
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            return None
+
+        job_id, filename, file_ext, spool_path = row
+        return {
+            "id": job_id,
+            "filename": filename,
+            "file_ext": file_ext,
+            "spool_path": spool_path,
+        }
+
+    # Store a finished job's result and remove its spooled file.
+    def complete(self, job_id, result, status_code, status="done"):
+        connection = self._connect()
+        row = connection.execute(
+            "SELECT spool_path FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        connection.execute(
+            "UPDATE jobs SET status = ?, result = ?, status_code = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result), status_code, time.time(), job_id),
+        )
+
+        if row is not None and os.path.exists(row[0]):
+            os.unlink(row[0])
+
+    # Returns the job's status, plus its result and status code once finished — None if the job doesn't exist.
+    def get(self, job_id):
+        row = (
+            self._connect()
+            .execute(
+                "SELECT status, result, status_code FROM jobs WHERE id = ?", (job_id,)
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+
+        status, result, status_code = row
+        return {
+            "status": status,
+            "result": json.loads(result) if result is not None else None,
+            "status_code": status_code,
+        }
+
+    # Fail jobs claimed more than lease_seconds ago and still running — their worker died mid-job (e.g., killed for
+    # running out of memory, or restarted by a deploy), so nothing else will ever finish them. They're failed rather than
+    # requeued, as a file that killed one worker would likely kill the next. Their spooled files are removed.
+    def fail_expired(self, lease_seconds):
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, spool_path FROM jobs WHERE status = 'running' AND updated_at < ?",
+                (time.time() - lease_seconds,),
+            ).fetchall()
+            result = _job_failure(
+                "Classification job was lost — its worker stopped before finishing it.",
+                "job_lost",
+                {"lease_seconds": lease_seconds},
+            )
+            for job_id, _ in rows:
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', result = ?, status_code = 500, updated_at = ? WHERE id = ?",
+                    (json.dumps(result), time.time(), job_id),
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        for _, spool_path in rows:
+            if os.path.exists(spool_path):
+                os.unlink(spool_path)
+
+    # Delete finished jobs older than ttl_seconds.
+    def purge_finished(self, ttl_seconds):
+        self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+            (time.time() - ttl_seconds,),
+        )
+
+
+# Take jobs off the queue and run them until stop_event is set. Whenever the queue is empty, purge expired results and
+# (with lease_seconds) fail jobs abandoned by workers that died. run_job(file_path, filename, file_ext) must return a
+# (result, status_code) pair.
+def run_job_worker(
+    job_queue,
+    run_job,
+    poll_interval_seconds,
+    result_ttl_seconds,
+    stop_event=None,
+    lease_seconds=None,
+):
+    stop_event = stop_event or threading.Event()
+
+    while not stop_event.is_set():
+        job = job_queue.claim()
+        if job is None:
+            if lease_seconds is not None:
+                job_queue.fail_expired(lease_seconds)
+            job_queue.purge_finished(result_ttl_seconds)
+            stop_event.wait(poll_interval_seconds)
+            continue
+
+        try:
+            result, status_code = run_job(
+                job["spool_path"], job["filename"], job["file_ext"]
+            )
+            job_queue.complete(job["id"], result, status_code)
+        except Exception as e:
+            job_queue.complete(
+                job["id"],
+                _job_failure(
+                    "Classification job failed.",
+                    "job_failed",
+                    {"exception": type(e).__name__},
+                ),
+                500,
+                status="failed",
+            )
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+
+from ..config_loader import RUNTIME_SETTINGS
+from ..file_content_classifier.head import LinearClassifierHead
+from ..metrics import time_stage
+from .features import layout_features, open_layout_image
+
+
+_MODEL_PATH = "src/classifier/layout_classifier/models"
+_LAYOUT_SETTINGS = RUNTIME_SETTINGS["layout_classifier"]
+_IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "tiff", "bmp")
+
+
+# Linear classifier over an image's layout features (see features.py), as exported by
+# scripts/build_layout_classifier.py. Features are standardised with the training set's mean and scale first.
+class LayoutClassifier(LinearClassifierHead):
+    def __init__(self, path):
+        super().__init__(path)
+
+        with np.load(path) as head:
+            self._mean = head["mean"]
+            self._scale = head["scale"]
+
+    def decision_function(self, images):
+        features = np.array([layout_features(img) for img in images])
+        return super().decision_function((features - self._mean) / self._scale)
+
+
+_layout_classifier = None
+
+
+# Returns the layout classifier, loading it on first use (None if the stage is disabled).
+def load_layout_classifier():
+    global _layout_classifier
+
+    if _LAYOUT_SETTINGS["enabled"] and _layout_classifier is None:
+        _layout_classifier = LayoutClassifier(
+            os.path.join(_MODEL_PATH, "layout_classifier.npz")
+        )
+    return _layout_classifier
+
+
+# Classify an uploaded image by its visual layout alone, before any OCR — returns None for other file types, or if the
+# layout classifier isn't confident enough (or is disabled). A result here skips OCR entirely, so its confidence
+# threshold is set separately from (and higher than) MIN_CONFIDENCE.
+def classify_using_layout(file, file_ext):
+    if file_ext.lower() not in _IMAGE_EXTENSIONS:
+        return None
+
+    layout_classifier = load_layout_classifier()
+    if layout_classifier is None:
+        return None
+
+    with time_stage("image_layout"):
+        file.stream.seek(0)
+        img = open_layout_image(file.stream)
+        labels, confidences, probabilities = layout_classifier.score([img])
+
+    confidence = float(confidences[0])
+    if confidence < _LAYOUT_SETTINGS["min_confidence"]:
+        return None
+
+    return {
+        "success": True,
+        "data": {
+            "label": str(labels[0]),
+            "step": 6,
+            "based_on": "image layout",
+            "match_type": "layout features + classifier",
+            "additional_info": {
+                "class_probabilities": dict(
+                    zip(layout_classifier.labels.tolist(), probabilities[0].tolist())
+                )
+            },
+            "confidence": confidence,
+        },
+    }
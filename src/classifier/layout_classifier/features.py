@@ -0,0 +1,74 @@
+import numpy as np
+
+
+# Images are reduced to this many pixels square before their features are computed.
+THUMBNAIL_SIZE = 64
+_HISTOGRAM_BINS = 16
+_PROFILE_BANDS = 16
+_HOG_CELLS = 4
+_HOG_ORIENTATIONS = 8
+
+
+# Open an image for its layout features — JPEGs are decoded at the smallest scale that still covers the thumbnail, so
+# this costs a few milliseconds even for a 12 megapixel photo.
+def open_layout_image(stream):
+    from PIL import Image, ImageOps
+
+    img = Image.open(stream)
+    img.draft("RGB", (THUMBNAIL_SIZE * 4, THUMBNAIL_SIZE * 4))
+    return ImageOps.exif_transpose(img).convert("RGB")
+
+
+# Histograms of gradient orientations (weighted by gradient magnitude) over a grid of cells — a coarse HOG descriptor
+# of where edges are, and which way they run: photos, card borders and text lines each leave a different pattern.
+def _hog(gray):
+    dy, dx = np.gradient(gray)
+    magnitude = np.hypot(dx, dy)
+    # Unsigned orientation, in [0, pi).
+    orientation = np.arctan2(dy, dx) % np.pi
+    bins = np.minimum(
+        (orientation / np.pi * _HOG_ORIENTATIONS).astype(int), _HOG_ORIENTATIONS - 1
+    )
+
+    cell_size = THUMBNAIL_SIZE // _HOG_CELLS
+    cells = (np.arange(THUMBNAIL_SIZE) // cell_size)[:, None] * _HOG_CELLS + (
+        np.arange(THUMBNAIL_SIZE) // cell_size
+    )[None, :]
+    hog = np.bincount(
+        (cells * _HOG_ORIENTATIONS + bins).ravel(),
+        weights=magnitude.ravel(),
+        minlength=_HOG_CELLS * _HOG_CELLS * _HOG_ORIENTATIONS,
+    )
+    return hog / (np.linalg.norm(hog) + 1e-6)
+
+
+# Fixed-length vector of cheap visual features of an image, for the layout classifier: its aspect ratio (ID cards are
+# landscape, ~1.59:1; pages are portrait, ~1:1.41), how colourful it is, its grayscale histogram, how dark each
+# horizontal / vertical band of it is (text rows down a page, a photo on one side of a card) and a coarse HOG
+# descriptor. Computed on a small thumbnail, so it takes about a millisecond.
+def layout_features(img):
+    from PIL import Image
+
+    aspect_ratio = np.log(img.width / img.height)
+    thumbnail = img.convert("RGB").resize(
+        (THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.BOX
+    )
+
+    saturation = np.asarray(thumbnail.convert("HSV"))[:, :, 1] / 255
+    gray = np.asarray(thumbnail.convert("L"), dtype=np.float64) / 255
+    histogram = np.histogram(gray, bins=_HISTOGRAM_BINS, range=(0, 1))[0] / gray.size
+    darkness = 1 - gray
+    band_size = THUMBNAIL_SIZE // _PROFILE_BANDS
+    row_profile = darkness.reshape(_PROFILE_BANDS, band_size, -1).mean(axis=(1, 2))
+    column_profile = darkness.reshape(-1, _PROFILE_BANDS, band_size).mean(axis=(0, 2))
+
+    return np.concatenate(
+        [
+            [aspect_ratio, abs(aspect_ratio)],
+            [saturation.mean(), saturation.std(), gray.mean(), gray.std()],
+            histogram,
+            row_profile,
+            column_profile,
+            _hog(gray),
+        ]
+    )
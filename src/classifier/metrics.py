@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+# Metrics are kept per process. When PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it) before this module is
+# first imported, every process writes its metrics to files in that directory, and /metrics aggregates them — so
+# whichever worker serves the scrape reports the metrics of all of them.
+
+STAGE_SECONDS = Histogram(
+    "classifier_stage_duration_seconds",
+    "Time spent in each pipeline stage, per call.",
+    ["stage", "file_type"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+FILES_RESOLVED = Counter(
+    "classifier_files_resolved_total",
+    "Files by the stage that settled their result (a label, or an error).",
+    ["resolved_by", "file_type"],
+)
+OCR_PAGES = Counter(
+    "classifier_ocr_pages_total",
+    "Pages (or images) OCR'd.",
+    ["file_type"],
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "classifier_embedding_batch_size",
+    "Texts per encode call made by the embedding micro-batcher.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "classifier_embedding_cache_lookups_total",
+    "Embedding cache lookups, by the tier that hit (memory_hit, disk_hit) or miss.",
+    ["result"],
+)
+RULESET_RELOADS = Counter(
+    "classifier_ruleset_reloads_total",
+    "Ruleset reloads after its config files changed, by result (reloaded, unchanged, or invalid — the previous "
+    "ruleset stays in use).",
+    ["result"],
+)
+RESULT_CACHE_LOOKUPS = Counter(
+    "classifier_result_cache_lookups_total",
+    "Result cache lookups, by whether they hit.",
+    ["result"],
+)
+
+
+# The file currently being classified — its file type (for metric labels), and what happened to it so far. Stages
+# deep in the pipeline record into it without it being passed down.
+_observation = ContextVar("classifier_observation", default=None)
+
+
+# Observe the classification of a single file in this context — yields a dictionary of its stage timings, OCR page
+# count and resolving stage, e.g. for debug output.
+@contextmanager
+def observe_file(file_type=None):
+    observation = {
+        "file_type": file_type,
+        "resolved_by": None,
+        "stage_seconds": {},
+        "ocr_pages": 0,
+    }
+    token = _observation.set(observation)
+    try:
+        yield observation
+    finally:
+        _observation.reset(token)
+
+
+def _file_type():
+    observation = _observation.get()
+    return (observation and observation["file_type"]) or "unknown"
+
+
+# Set the file type of the file being observed. Only pass supported file types — every distinct value becomes a new
+# set of time series.
+def set_file_type(file_type):
+    observation = _observation.get()
+    if observation is not None:
+        observation["file_type"] = file_type
+
+
+# Time the enclosed pipeline stage. Don't yield from a generator inside it — the time the consumer spends in between
+# would be counted too.
+@contextmanager
+def time_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage, _file_type()).observe(elapsed)
+
+        observation = _observation.get()
+        if observation is not None:
+            stage_seconds = observation["stage_seconds"]
+            stage_seconds[stage] = stage_seconds.get(stage, 0) + elapsed
+
+
+def record_resolution(resolved_by):
+    FILES_RESOLVED.labels(resolved_by, _file_type()).inc()
+
+    observation = _observation.get()
+    if observation is not None:
+        observation["resolved_by"] = resolved_by
+
+
+def record_ocr_page():
+    OCR_PAGES.labels(_file_type()).inc()
+
+    observation = _observation.get()
+    if observation is not None:
+        observation["ocr_pages"] += 1
+
+
+def record_result_cache_lookup(hit):
+    RESULT_CACHE_LOOKUPS.labels("hit" if hit else "miss").inc()
+
+
+def record_embedding_cache_lookup(result):
+    EMBEDDING_CACHE_LOOKUPS.labels(result).inc()
+
+
+def record_ruleset_reload(result):
+    RULESET_RELOADS.labels(result).inc()
+
+
+def observe_embedding_batch(batch_size):
+    EMBEDDING_BATCH_SIZE.observe(batch_size)
+
+
+# Summary of an observed file, for responses to requests that ask for debug output.
+def debug_summary(observation):
+    return {
+        "file_type": observation["file_type"],
+        "resolved_by": observation["resolved_by"],
+        "stage_seconds": {
+            stage: round(seconds, 6)
+            for stage, seconds in observation["stage_seconds"].items()
+        },
+        "ocr_pages": observation["ocr_pages"],
+    }
+
+
+# Render the metrics in the Prometheus text format — aggregated across processes in multiprocess mode. Returns the
+# body and its content type.
+def render_metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,161 @@
+import collections
+from contextlib import contextmanager
+import os
+import queue
+import threading
+
+from .config_loader import RUNTIME_SETTINGS
+
+
+_OCR_LANG = "eng"
+_ENGINE_SETTINGS = RUNTIME_SETTINGS["ocr"]["engine"]
+
+
+# OCRs images with the tesseract command line, via pytesseract. Every call starts a new tesseract process, which writes
+# the image to a temporary file and loads the language data again before reading it.
+class PytesseractEngine:
+    # pytesseract is imported up front, so warming up the engine imports it.
+    def __init__(self, lang=_OCR_LANG):
+        import pytesseract
+
+        self._lang = lang
+
+    def image_to_string(self, img):
+        import pytesseract
+
+        return pytesseract.image_to_string(img, lang=self._lang)
+
+    # Degrees to rotate the image by (counter-clockwise) to turn its text upright, from tesseract's orientation and
+    # script detection — 0 if detection fails (e.g., too little text, or no osd language data installed).
+    def rotation(self, img):
+        import pytesseract
+
+        try:
+            osd = pytesseract.image_to_osd(img, output_type=pytesseract.Output.DICT)
+        except pytesseract.TesseractError:
+            return 0
+        # "rotate" is the clockwise rotation.
+        return -osd["rotate"] % 360
+
+
+# OCRs images in-process through tesseract's C API, via the tesserocr package. Keeps a pool of up to pool_size
+# long-lived tesseract instances per process, each loading the language data once, when it is first needed. Images are
+# handed over in memory, and tesseract releases the GIL while it reads them, so up to pool_size threads OCR at once —
+# any more wait for an instance to be free, in the order they arrived.
+class TesserocrEngine:
+    def __init__(self, lang=_OCR_LANG, pool_size=1, tessdata_path=None):
+        import tesserocr
+
+        self._lang = lang
+        self._pool_size = pool_size
+        self._tessdata_path = tessdata_path
+        self._lock = threading.Lock()
+        self._idle = []
+        self._created = 0
+        # A queue per waiting caller, which a released instance is handed to directly — so a caller that has just
+        # released one can't take it straight back ahead of them.
+        self._waiters = collections.deque()
+        self._pid = os.getpid()
+
+    def _create_api(self):
+        import tesserocr
+
+        if self._tessdata_path:
+            return tesserocr.PyTessBaseAPI(path=self._tessdata_path, lang=self._lang)
+        return tesserocr.PyTessBaseAPI(lang=self._lang)
+
+    # Returns an idle instance, or None if the caller should create one — waiting for one to be released if the pool
+    # is full. Instances don't survive a fork, so a forked worker (e.g. under gunicorn's preload_app) starts its own
+    # pool.
+    def _checkout(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle, self._created, self._pid = [], 0, os.getpid()
+                self._waiters = collections.deque()
+            if self._idle:
+                return self._idle.pop()
+            if self._created < self._pool_size:
+                self._created += 1
+                return None
+            waiter = queue.SimpleQueue()
+            self._waiters.append(waiter)
+        return waiter.get()
+
+    # Hand an instance to the longest waiting caller, or return it to the pool — None (an instance that failed to
+    # load) hands the waiter its place in the pool instead.
+    def _release(self, api):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            if self._waiters:
+                self._waiters.popleft().put(api)
+            elif api is None:
+                self._created -= 1
+            else:
+                self._idle.append(api)
+
+    # Check out one of this process's tesseract instances, creating it if the pool isn't full yet.
+    @contextmanager
+    def _api(self):
+        api = self._checkout()
+        if api is None:
+            # Loading the language data takes a while, so it's done outside the lock.
+            try:
+                api = self._create_api()
+            except BaseException:
+                self._release(None)
+                raise
+
+        try:
+            yield api
+        finally:
+            self._release(api)
+
+    def image_to_string(self, img):
+        with self._api() as api:
+            api.SetImage(img)
+            return api.GetUTF8Text()
+
+    # As PytesseractEngine.rotation.
+    def rotation(self, img):
+        with self._api() as api:
+            api.SetImage(img)
+            try:
+                osd = api.DetectOrientationScript()
+            except RuntimeError:
+                return 0
+        return osd["orient_deg"] if osd else 0
+
+    # Release this process's tesseract instances, once callers have stopped OCRing.
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                for api in self._idle:
+                    api.End()
+                self._created -= len(self._idle)
+            self._idle = []
+
+
+_ocr_engine = None
+_ocr_engine_lock = threading.Lock()
+
+
+# Returns the configured OCR engine, creating it on first use — both engines expose image_to_string(img) and
+# rotation(img).
+def get_ocr_engine():
+    global _ocr_engine
+
+    with _ocr_engine_lock:
+        if _ocr_engine is None:
+            backend = _ENGINE_SETTINGS["backend"]
+            if backend == "pytesseract":
+                _ocr_engine = PytesseractEngine()
+            elif backend == "tesserocr":
+                _ocr_engine = TesserocrEngine(
+                    pool_size=_ENGINE_SETTINGS["pool_size"],
+                    tessdata_path=_ENGINE_SETTINGS["tessdata_path"],
+                )
+            else:
+                raise ValueError(f"Unknown OCR engine backend '{backend}'")
+
+    return _ocr_engine
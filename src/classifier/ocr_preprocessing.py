@@ -0,0 +1,127 @@
+from .config_loader import RUNTIME_SETTINGS
+from .ocr_engines import get_ocr_engine
+
+
+_PREPROCESSING_SETTINGS = RUNTIME_SETTINGS["ocr"]["preprocessing"]
+
+
+# Open an uploaded image for OCR. Large JPEGs are decoded at a reduced scale (JPEG's draft mode decodes at 1/2, 1/4 or
+# 1/8 size directly), so a 12 megapixel phone photo isn't fully decoded only to be downscaled straight after.
+def open_image(stream, settings=_PREPROCESSING_SETTINGS):
+    from PIL import Image
+
+    img = Image.open(stream)
+    if settings["enabled"] and img.format == "JPEG":
+        scale = _downscale_factor(img.size, settings["max_megapixels"])
+        if scale < 1:
+            img.draft(
+                "L" if settings["grayscale"] else img.mode,
+                (round(img.width * scale), round(img.height * scale)),
+            )
+    return img
+
+
+# Factor to scale an image of the given size by, so it has at most max_megapixels.
+def _downscale_factor(size, max_megapixels):
+    width, height = size
+    if not max_megapixels or width * height <= max_megapixels * 1_000_000:
+        return 1
+    return (max_megapixels * 1_000_000 / (width * height)) ** 0.5
+
+
+# Global (Otsu) threshold of a grayscale image's histogram — the level that best separates dark text from the page.
+def _otsu_threshold(histogram):
+    total = sum(histogram)
+    level_sum = sum(level * count for level, count in enumerate(histogram))
+
+    best_threshold, best_variance = 0, 0
+    background_count, background_sum = 0, 0
+    for level, count in enumerate(histogram):
+        background_count += count
+        if background_count == 0:
+            continue
+        foreground_count = total - background_count
+        if foreground_count == 0:
+            break
+
+        background_sum += level * count
+        background_mean = background_sum / background_count
+        foreground_mean = (level_sum - background_sum) / foreground_count
+        variance = (
+            background_count
+            * foreground_count
+            * (background_mean - foreground_mean) ** 2
+        )
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+
+    return best_threshold
+
+
+# Rotate the image upright, as detected by tesseract's orientation and script detection. Costs an extra tesseract
+# pass, so is off by default — phone photos are usually rotated upright by their EXIF orientation alone. Leaves the
+# image as it is if detection fails (e.g., too little text, or no osd language data installed).
+def _rotate_upright(img):
+    rotation = get_ocr_engine().rotation(img)
+    return img.rotate(rotation, expand=True) if rotation else img
+
+
+# Prepare an image for OCR — tesseract's time grows with the number of pixels, and it reads dark text on a light
+# background best. In order: apply its EXIF orientation, downscale it to at most max_megapixels, convert it to
+# grayscale, binarise it, and rotate it upright (each step as configured in ocr.preprocessing).
+def preprocess_image(img, settings=_PREPROCESSING_SETTINGS):
+    from PIL import Image, ImageOps
+
+    if not settings["enabled"]:
+        return img
+
+    img = ImageOps.exif_transpose(img)
+
+    scale = _downscale_factor(img.size, settings["max_megapixels"])
+    if scale < 1:
+        img = img.resize(
+            (int(img.width * scale), int(img.height * scale)),
+            Image.Resampling.LANCZOS,
+            reducing_gap=2.0,
+        )
+
+    if settings["grayscale"] or settings["binarize"]:
+        img = img.convert("L")
+    if settings["binarize"]:
+        threshold = _otsu_threshold(img.histogram())
+        img = img.point(lambda level: 255 if level > threshold else 0)
+
+    if settings["detect_orientation"]:
+        img = _rotate_upright(img)
+
+    return img
+
+
+# Split a (preprocessed) image into its header region — about the top header_first.height_fraction of it, where document
+# titles ("DRIVER LICENSE", "INVOICE", bank names) usually are — and the rest. The split is made at the lightest row
+# near that height (a gap between lines of text), so no line is cut in half. Returns just the whole image if
+# header-first OCR is disabled.
+def split_header_region(img, settings=_PREPROCESSING_SETTINGS):
+    import numpy as np
+
+    header_first = settings["header_first"]
+    if not (settings["enabled"] and header_first["enabled"]):
+        return [img]
+
+    target_height = round(img.height * header_first["height_fraction"])
+    search_from = max(round(target_height * 0.8), 1)
+    search_to = min(round(target_height * 1.2), img.height - 1)
+    if search_from >= search_to:
+        return [img]
+
+    row_brightness = np.asarray(
+        img.convert("L").crop((0, search_from, img.width, search_to))
+    ).mean(axis=1)
+    # Of the lightest rows, split at the one nearest the target height.
+    lightest_rows = search_from + np.flatnonzero(row_brightness == row_brightness.max())
+    header_height = int(lightest_rows[np.abs(lightest_rows - target_height).argmin()])
+
+    return [
+        img.crop((0, 0, img.width, header_height)),
+        img.crop((0, header_height, img.width, img.height)),
+    ]
@@ -0,0 +1,44 @@
+from re import _constants as sre_constants, _parser as sre_parser
+import re
+
+
+# Shortest literal worth using as a prefilter — shorter literals appear in most texts anyway.
+_MIN_PREFILTER_LENGTH = 3
+
+# Non-ASCII characters that case-insensitively match an ASCII letter in re, but that str.lower() doesn't map to it
+# (or, for "İ", maps to two characters).
+_CASE_FOLDS = str.maketrans({"İ": "i", "ı": "i", "ſ": "s"})
+
+
+# Lowercase text so that it contains a prefilter literal whenever a case-insensitive pattern could match it.
+def fold_case(text):
+    return text.translate(_CASE_FOLDS).lower()
+
+
+# Get the longest literal run every match of the pattern must contain (lowercased if the pattern ignores case), or
+# None if the pattern has no usable literal — e.g., "driver'?s? licen[cs]e" always contains "driver".
+# Returns a (literal, ignore_case) pair — if ignore_case is set, look for the literal in fold_case(text).
+def literal_prefilter(pattern):
+    try:
+        parsed = sre_parser.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+
+    ignore_case = bool(parsed.state.flags & re.IGNORECASE)
+    literals, current = [], []
+
+    # Only top-level literals are guaranteed to be part of every match — anything else ends the current run.
+    for op, value in parsed:
+        if op is sre_constants.LITERAL and value < 128:
+            current.append(chr(value).lower() if ignore_case else chr(value))
+        elif current:
+            literals.append("".join(current))
+            current = []
+    if current:
+        literals.append("".join(current))
+
+    literal = max(literals, key=len, default="")
+    if len(literal) < _MIN_PREFILTER_LENGTH:
+        return None
+
+    return literal, ignore_case
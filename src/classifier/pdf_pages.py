@@ -0,0 +1,39 @@
+from io import StringIO
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+
+
+# pdfminer text converter that also notes whether each page draws any images (without decoding them), and hands over
+# each page's text as soon as the page has been processed.
+class _PageTextConverter(TextConverter):
+    def __init__(self, resource_manager):
+        super().__init__(resource_manager, StringIO(), laparams=LAParams())
+        self._page_has_images = False
+
+    def render_image(self, name, stream):
+        self._page_has_images = True
+
+    # Returns the text and image flag of the page just processed, resetting them for the next page.
+    def take_page(self):
+        text = self.outfp.getvalue()
+        self.outfp.seek(0)
+        self.outfp.truncate()
+
+        has_images = self._page_has_images
+        self._page_has_images = False
+        return text, has_images
+
+
+# Parse a pdf once, yielding a dictionary per page with its page number, its text layer (exactly as pdfminer's
+# extract_text would extract it — joining every page's text gives the same text), and whether it draws any images.
+def iter_pdf_pages(stream):
+    resource_manager = PDFResourceManager()
+    converter = _PageTextConverter(resource_manager)
+    interpreter = PDFPageInterpreter(resource_manager, converter)
+
+    for page_number, page in enumerate(PDFPage.get_pages(stream), start=1):
+        interpreter.process_page(page)
+        text, has_images = converter.take_page()
+        yield {"page_number": page_number, "text": text, "has_images": has_images}
@@ -1,20 +1,62 @@
+from contextlib import closing
 from pathlib import Path
 import filetype
+import threading
+from werkzeug.datastructures import FileStorage
 
-from .config_loader import DOCUMENT_RULES, SUPPORTED_FILETYPES
+from .config_loader import RUNTIME_SETTINGS, get_ruleset
 from .filename_classifier.classifier import classify_using_filename
-from .file_content_classifier.classifier import classify_using_file_content
-from .extract import extract_file_text
+from .file_content_classifier.classifier import (
+    MODEL_VERSION,
+    classify_using_file_content,
+    classify_using_file_content_batch,
+    classify_using_file_content_rules,
+    classify_using_models,
+    load_models,
+    load_ngram_classifier,
+)
+from .extract import (
+    ExtractionBudget,
+    extract_file_text,
+    import_extractors,
+    iter_file_text,
+)
+from .layout_classifier.classifier import (
+    classify_using_layout,
+    load_layout_classifier,
+)
+from .metrics import (
+    observe_file,
+    record_resolution,
+    record_result_cache_lookup,
+    set_file_type,
+    time_stage,
+)
+from .result_cache import ResultCache, file_digest
 from .save_unclassifiable import save_unclassifiable_file
 
 
 MIN_CONFIDENCE = 0.8
 
+_EARLY_EXIT_EXTRACTION = RUNTIME_SETTINGS["ocr"]["early_exit"]
+
+_RESULT_CACHE_SETTINGS = RUNTIME_SETTINGS["result_cache"]
+_result_cache = (
+    ResultCache(
+        _RESULT_CACHE_SETTINGS["memory_max_entries"],
+        _RESULT_CACHE_SETTINGS["ttl_seconds"],
+        _RESULT_CACHE_SETTINGS["disk_path"],
+        _RESULT_CACHE_SETTINGS["disk_max_entries"],
+    )
+    if _RESULT_CACHE_SETTINGS["enabled"]
+    else None
+)
+
 
 # Check whether file extension is an existing key in SUPPORTED_FILETYPES.yaml config file.
-def _allowed_file(ext):
+def _allowed_file(ext, ruleset=None):
     ext = ext.lower()
-    return ext in SUPPORTED_FILETYPES
+    return ext in (ruleset or get_ruleset()).supported_filetypes
 
 
 # Get file MIME type using filetype (less accurate and broad than python-magic but sufficient here).
@@ -24,17 +66,18 @@ def _detect_mime(file):
 
 
 # Check whether detected file MIME type matches the filename extension.
-def _check_mime_match(ext, mime_type):
-    return mime_type in SUPPORTED_FILETYPES.get(ext.lower(), [])
+def _check_mime_match(ext, mime_type, ruleset):
+    return mime_type in ruleset.supported_filetypes.get(ext.lower(), [])
 
 
-# Classification pipeline.
-def classify_file(file):
-    filename = file.filename
-    file_ext = Path(filename).suffix.lstrip(".")
-
+# Run the cheap, filename-only stages — reject unsupported extensions, then attempt filename-based classification.
+# Returns None if the file needs to proceed to the content-based stages.
+def _classify_using_file_metadata(filename, file_ext, ruleset):
     # Reject unsupported file extensions.
-    if not _allowed_file(file_ext):
+    with time_stage("extension_check"):
+        allowed = _allowed_file(file_ext, ruleset)
+        set_file_type(file_ext.lower() if allowed else "unsupported")
+    if not allowed:
         return (
             {
                 "success": False,
@@ -49,17 +92,24 @@ def classify_file(file):
         )
 
     # Attempt filename-based classification.
-    filename_classification_result = classify_using_filename(filename, DOCUMENT_RULES)
+    filename_classification_result = classify_using_filename(
+        filename, ruleset.document_rules, ruleset.filename_matcher
+    )
     if (
         filename_classification_result is not None
         and filename_classification_result["success"]
     ):
         return filename_classification_result, 200
 
-    # Verify MIME type matches extension.
-    mime_type = _detect_mime(file)
+    return None
+
+
+# Verify MIME type matches extension — returns None if it does.
+def _verify_mime_type(file, file_ext, ruleset):
+    with time_stage("mime_check"):
+        mime_type = _detect_mime(file)
     if mime_type == "application/octet-stream" or not _check_mime_match(
-        file_ext, mime_type
+        file_ext, mime_type, ruleset
     ):
         return (
             {
@@ -77,15 +127,329 @@ def classify_file(file):
             400,
         )
 
-    # Attempt content-based classification.
-    file_text = extract_file_text(file, file_ext)
-    file_content_classification_result = classify_using_file_content(
-        file_text, DOCUMENT_RULES, MIN_CONFIDENCE
-    )
+    return None
 
+
+# Attach a status code to a content-based classification result.
+def _finalise_file_content_result(file, file_content_classification_result):
     if file_content_classification_result["success"]:
         return file_content_classification_result, 200
     else:
         # Final fallback — save unclassifiable document for manual review.
         save_unclassifiable_file(file)
         return file_content_classification_result, 422
+
+
+# Cached results depend only on the file's bytes and extension (not its name), plus the rules, model and threshold.
+def _result_cache_key(file, file_ext, ruleset):
+    return ":".join(
+        [
+            file_digest(file),
+            file_ext.lower(),
+            ruleset.version,
+            MODEL_VERSION,
+            str(MIN_CONFIDENCE),
+        ]
+    )
+
+
+# Look up the result of a previous upload with identical content — returns None on a miss or if caching is disabled.
+# Also returns the file's cache key, for caching its result on a miss.
+def _classify_using_result_cache(file, file_ext, ruleset):
+    if _result_cache is None:
+        return None, None
+
+    with time_stage("result_cache"):
+        cache_key = _result_cache_key(file, file_ext, ruleset)
+        return _get_cached_result(file, cache_key), cache_key
+
+
+def _get_cached_result(file, cache_key):
+    if _result_cache is None:
+        return None
+
+    cached = _result_cache.get(cache_key)
+    record_result_cache_lookup(cached is not None)
+    if cached is None:
+        return None
+
+    classification_result, status_code = cached
+    if status_code == 422:
+        # The cached result is still unclassifiable — this upload needs manual review too.
+        save_unclassifiable_file(file)
+
+    return {**classification_result, "cached": True}, status_code
+
+
+def _cache_result(cache_key, classification_result, status_code):
+    if _result_cache is not None:
+        _result_cache.set(cache_key, classification_result, status_code)
+
+
+# Stage that produces each classification step's labels (see the results' "step"). Step numbers are part of the API, so
+# tiers added later get new numbers rather than renumbering the ones clients already rely on — they don't follow the
+# order the stages run in.
+_STEP_STAGES = {
+    1: "filename_regex",
+    2: "filename_fuzzy",
+    3: "content_regex",
+    4: "embedding",
+    5: "content_ngram",
+    6: "image_layout",
+}
+
+
+# Record which stage settled a file's result — the classification step that labelled it, or the error it was
+# rejected with.
+def _record_resolution(classification_result):
+    if classification_result.get("cached"):
+        record_resolution("result_cache")
+    elif classification_result["success"]:
+        record_resolution(_STEP_STAGES[classification_result["data"]["step"]])
+    else:
+        record_resolution(classification_result["error"]["code"])
+
+
+# Note the version of the rules a result was classified with.
+def _with_rules_version(classification_result, ruleset):
+    result, status_code = classification_result
+    return {**result, "rules_version": ruleset.version}, status_code
+
+
+# Record the result of a stage that settled the file, and note the rules version it was classified with — None if the
+# file wasn't settled.
+def _settled_result(classification_result, ruleset):
+    if classification_result is None:
+        return None
+
+    _record_resolution(classification_result[0])
+    return _with_rules_version(classification_result, ruleset)
+
+
+# Run the extension check and filename stages — these only read the filename, so the ASGI app runs them on its event
+# loop. Returns the result if they settle the file, otherwise None — along with the file extension.
+def classify_file_metadata_stages(file, ruleset):
+    file_ext = Path(file.filename).suffix.lstrip(".")
+    classification_result = _classify_using_file_metadata(
+        file.filename, file_ext, ruleset
+    )
+    return _settled_result(classification_result, ruleset), file_ext
+
+
+# Run the MIME check and result cache lookup — these read the upload (hashing all of it, possibly from a disk spool) and
+# may wait on the cache's SQLite tier, so the ASGI app runs them off its event loop. Returns the result if they settle
+# the file, otherwise None — along with the file's cache key.
+def classify_file_cache_stages(file, file_ext, ruleset):
+    # The MIME check only reads the start of the file, so it runs before the file is hashed for the result cache —
+    # a streamed upload (see streaming_upload.py) with a mismatched MIME type is rejected without reading the rest.
+    mime_error = _verify_mime_type(file, file_ext, ruleset)
+    if mime_error is not None:
+        return _settled_result(mime_error, ruleset), None
+
+    # Everything from here on depends only on file content — reuse the result for a previously seen file.
+    cached_result, cache_key = _classify_using_result_cache(file, file_ext, ruleset)
+    return _settled_result(cached_result, ruleset), cache_key
+
+
+# Run every stage up to (but not including) text extraction. Returns the result if one of these stages settles the file,
+# otherwise None — along with the file extension and cache key. Pass the same ruleset to classify_file_content_stages,
+# so both halves classify against the same rules even if they're reloaded in between.
+def classify_file_before_content_stages(file, ruleset=None):
+    ruleset = ruleset or get_ruleset()
+    classification_result, file_ext = classify_file_metadata_stages(file, ruleset)
+    if classification_result is not None:
+        return classification_result, file_ext, None
+
+    classification_result, cache_key = classify_file_cache_stages(
+        file, file_ext, ruleset
+    )
+    return classification_result, file_ext, cache_key
+
+
+# Budget for extracting a file's text, from its file type's extraction limits.
+def _extraction_budget(file_ext, ruleset):
+    return ExtractionBudget(**ruleset.extraction_limits.get(file_ext.lower(), {}))
+
+
+# Note in a content-based classification result when text extraction stopped at one of the file type's limits.
+def _report_extraction_truncation(file_content_classification_result, budget):
+    truncation = budget.truncation()
+    if truncation is not None:
+        if file_content_classification_result["success"]:
+            file_content_classification_result["data"]["additional_info"][
+                "extraction_truncated"
+            ] = truncation
+        else:
+            file_content_classification_result["error"]["details"][
+                "extraction_truncated"
+            ] = truncation
+
+    return file_content_classification_result
+
+
+# Run the content rules after each chunk of extracted text (e.g., each OCR'd page), stopping extraction as soon as a
+# rule is satisfied. Falls back on the models once all text has been extracted.
+def _classify_using_streamed_file_content(file, file_ext, budget=None, ruleset=None):
+    ruleset = ruleset or get_ruleset()
+    # Stays empty if no text was extracted at all (e.g., a pdf with no pages) — the models still get a string.
+    file_text = ""
+
+    with closing(iter_file_text(file, file_ext, budget)) as text_chunks:
+        for text_chunk in text_chunks:
+            file_text = f"{file_text} {text_chunk}" if file_text else text_chunk
+
+            rules_classification_result = classify_using_file_content_rules(
+                file_text,
+                ruleset.document_rules,
+                MIN_CONFIDENCE,
+                ruleset.content_matcher,
+            )
+            if rules_classification_result is not None:
+                return rules_classification_result
+
+    return classify_using_models([file_text], MIN_CONFIDENCE)[0]
+
+
+# Extract text and attempt content-based classification — the CPU-bound stages, for files
+# classify_file_before_content_stages didn't settle. Images the layout classifier is confident about skip OCR.
+def classify_file_content_stages(file, file_ext, cache_key, ruleset=None):
+    ruleset = ruleset or get_ruleset()
+    file_content_classification_result = classify_using_layout(file, file_ext)
+
+    if file_content_classification_result is None:
+        budget = _extraction_budget(file_ext, ruleset)
+
+        if _EARLY_EXIT_EXTRACTION:
+            file_content_classification_result = _classify_using_streamed_file_content(
+                file, file_ext, budget, ruleset
+            )
+        else:
+            file_text = extract_file_text(file, file_ext, budget)
+            file_content_classification_result = classify_using_file_content(
+                file_text,
+                ruleset.document_rules,
+                MIN_CONFIDENCE,
+                ruleset.content_matcher,
+            )
+        _report_extraction_truncation(file_content_classification_result, budget)
+
+    classification_result, status_code = _finalise_file_content_result(
+        file, file_content_classification_result
+    )
+    _cache_result(cache_key, classification_result, status_code)
+    _record_resolution(classification_result)
+    return _with_rules_version((classification_result, status_code), ruleset)
+
+
+# Classification pipeline — every stage uses the ruleset current when the file arrived.
+def classify_file(file):
+    ruleset = get_ruleset()
+    classification_result, file_ext, cache_key = classify_file_before_content_stages(
+        file, ruleset
+    )
+    if classification_result is not None:
+        return classification_result
+
+    return classify_file_content_stages(file, file_ext, cache_key, ruleset)
+
+
+# Deferred classification pipeline — runs the cheap stages immediately, but hands files that need the expensive
+# content stages to enqueue(file, file_ext), which returns a job id for the client to poll.
+def classify_file_deferred(file, enqueue):
+    classification_result, file_ext, _ = classify_file_before_content_stages(file)
+    if classification_result is not None:
+        return classification_result
+
+    job_id = enqueue(file, file_ext)
+    return {"success": True, "data": {"job_id": job_id, "status": "queued"}}, 202
+
+
+# Run the content stages for a file spooled to disk by classify_file_deferred.
+def classify_spooled_file(file_path, filename, file_ext):
+    with open(file_path, "rb") as stream, observe_file(file_ext.lower()):
+        file = FileStorage(stream=stream, filename=filename)
+        ruleset = get_ruleset()
+
+        # An identical file may have been classified while this one was queued.
+        cached_result, cache_key = _classify_using_result_cache(file, file_ext, ruleset)
+        if cached_result is not None:
+            _record_resolution(cached_result[0])
+            return _with_rules_version(cached_result, ruleset)
+
+        return classify_file_content_stages(file, file_ext, cache_key, ruleset)
+
+
+# Batch classification pipeline — runs each stage across every file before moving on to the next, so that the
+# expensive content stages only see files the cheaper stages couldn't resolve, and the embedding model sees one batch.
+def classify_files(files):
+    ruleset = get_ruleset()
+    results = [None] * len(files)
+
+    # Filename, cache, MIME and image layout stages for all files, then text extraction only for files still unresolved.
+    extracted = []
+    for i, file in enumerate(files):
+        with observe_file():
+            results[i], file_ext, cache_key = classify_file_before_content_stages(
+                file, ruleset
+            )
+            if results[i] is None:
+                layout_classification_result = classify_using_layout(file, file_ext)
+                if layout_classification_result is not None:
+                    result = _finalise_file_content_result(
+                        file, layout_classification_result
+                    )
+                    _cache_result(cache_key, *result)
+                    _record_resolution(result[0])
+                    results[i] = _with_rules_version(result, ruleset)
+                    continue
+
+                budget = _extraction_budget(file_ext, ruleset)
+                file_text = extract_file_text(file, file_ext, budget)
+                extracted.append((i, file, file_ext, cache_key, budget, file_text))
+
+    # Content-based classification for all extracted texts together — its stages are timed under the "batch" file type.
+    if extracted:
+        with observe_file("batch"):
+            file_content_classification_results = classify_using_file_content_batch(
+                [file_text for *_, file_text in extracted],
+                ruleset.document_rules,
+                MIN_CONFIDENCE,
+                ruleset.content_matcher,
+            )
+        for (
+            i,
+            file,
+            file_ext,
+            cache_key,
+            budget,
+            _,
+        ), file_content_classification_result in zip(
+            extracted, file_content_classification_results
+        ):
+            result = _finalise_file_content_result(
+                file,
+                _report_extraction_truncation(
+                    file_content_classification_result, budget
+                ),
+            )
+            _cache_result(cache_key, *result)
+            with observe_file(file_ext.lower()):
+                _record_resolution(result[0])
+            results[i] = _with_rules_version(result, ruleset)
+
+    return results
+
+
+# Load the models and import the text extraction libraries now, rather than on the first request that needs them.
+def warm_up():
+    import_extractors()
+    load_layout_classifier()
+    load_ngram_classifier()
+    load_models()
+
+
+# Warm up in a background thread, so requests classified by filename can be served in the meantime.
+def start_background_warm_up():
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+# Digest the file's bytes without loading the whole upload into memory, leaving the stream where it started.
+def file_digest(file):
+    stream = file.stream
+    start_pos = stream.tell()
+    stream.seek(0)
+
+    digest = hashlib.sha256()
+    while chunk := stream.read(_HASH_CHUNK_SIZE):
+        digest.update(chunk)
+
+    stream.seek(start_pos)
+    return digest.hexdigest()
+
+
+# Two-tier cache of classification results — a bounded in-process LRU in front of an optional SQLite database.
+# Both tiers expire entries after ttl_seconds and evict the least recently used entries once full.
+class ResultCache:
+    def __init__(
+        self,
+        memory_max_entries,
+        ttl_seconds,
+        disk_path=None,
+        disk_max_entries=None,
+    ):
+        self._memory_max_entries = memory_max_entries
+        self._ttl_seconds = ttl_seconds
+        self._disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._disk_path = disk_path
+        self._disk = None
+        self._disk_pid = None
+        self._connect_disk()
+
+    # Returns this process's connection to the disk tier (None if disabled). A forked worker (e.g. under gunicorn's
+    # preload_app) opens its own connection — SQLite connections must not be shared between processes.
+    def _connect_disk(self):
+        if not self._disk_path:
+            return None
+        if self._disk is not None and self._disk_pid == os.getpid():
+            return self._disk
+
+        # The connection is shared between request threads, so access is serialised via self._lock.
+        self._disk = sqlite3.connect(
+            self._disk_path, timeout=30, check_same_thread=False
+        )
+        self._disk_pid = os.getpid()
+        self._disk.execute("PRAGMA journal_mode=WAL")
+        self._disk.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                status_code INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._disk.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_accessed_at ON results (last_accessed_at)"
+        )
+        self._disk.commit()
+        return self._disk
+
+    # Returns the cached (result, status_code) pair, or None on a miss.
+    def get(self, key):
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at < self._ttl_seconds:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            disk = self._connect_disk()
+            if disk is None:
+                return None
+
+            row = disk.execute(
+                "SELECT result, status_code, created_at FROM results WHERE key = ? AND created_at > ?",
+                (key, now - self._ttl_seconds),
+            ).fetchone()
+            if row is None:
+                return None
+
+            disk.execute(
+                "UPDATE results SET last_accessed_at = ? WHERE key = ?", (now, key)
+            )
+            disk.commit()
+
+            result, status_code, created_at = row
+            value = (json.loads(result), status_code)
+            self._set_memory(key, value, created_at)
+            return value
+
+    def set(self, key, result, status_code):
+        now = time.time()
+
+        with self._lock:
+            self._set_memory(key, (result, status_code), now)
+
+            disk = self._connect_disk()
+            if disk is None:
+                return
+
+            disk.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(result), status_code, now, now),
+            )
+            # Evict expired entries, then the least recently used entries beyond the size limit.
+            disk.execute(
+                "DELETE FROM results WHERE created_at <= ?", (now - self._ttl_seconds,)
+            )
+            if self._disk_max_entries is not None:
+                disk.execute(
+                    """
+                    DELETE FROM results WHERE key IN (
+                        SELECT key FROM results ORDER BY last_accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self._disk_max_entries,),
+                )
+            disk.commit()
+
+    def _set_memory(self, key, value, created_at):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_max_entries:
+            self._memory.popitem(last=False)
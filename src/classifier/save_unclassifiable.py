@@ -8,4 +8,6 @@ _UNCLASSIFIABLE_DIR = "manual_review"
 def save_unclassifiable_file(file):
     os.makedirs(_UNCLASSIFIABLE_DIR, exist_ok=True)
     file_path = os.path.join(_UNCLASSIFIABLE_DIR, file.filename)
+    # Earlier stages may have read (part of) the stream.
+    file.stream.seek(0)
     file.save(file_path)
@@ -0,0 +1,120 @@
+import io
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import BadRequest
+from werkzeug.sansio.multipart import (
+    Data,
+    Epilogue,
+    File,
+    MultipartDecoder,
+    NeedData,
+)
+
+
+_CHUNK_SIZE = 64 * 1024
+
+
+# Decodes a multipart/form-data request body straight off the request stream, a chunk at a time, up to the file part
+# named field_name and then through that part's body. Nothing is buffered beyond the chunk being decoded.
+class _MultipartFilePart:
+    def __init__(self, stream, boundary, field_name):
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary.encode())
+        self._field_name = field_name
+        self._finished = False
+
+    def _next_event(self):
+        try:
+            event = self._decoder.next_event()
+            while isinstance(event, NeedData):
+                self._decoder.receive_data(self._stream.read(_CHUNK_SIZE) or None)
+                event = self._decoder.next_event()
+        except ValueError:
+            raise BadRequest("Malformed multipart/form-data request body.")
+        return event
+
+    # Skip ahead to the file part, returning its filename — None if the request has no such part.
+    def read_filename(self):
+        while True:
+            event = self._next_event()
+            if isinstance(event, File) and event.name == self._field_name:
+                return event.filename
+            if isinstance(event, Epilogue):
+                self._finished = True
+                return None
+
+    # Returns the next chunk of the file part's body — b"" once it has all been read.
+    def read_chunk(self):
+        while not self._finished:
+            event = self._next_event()
+            if isinstance(event, Data):
+                self._finished = not event.more_data
+                if event.data:
+                    return event.data
+        return b""
+
+
+# Seekable stream over a file part's body, reading the body from the request stream only as far as it is read (or
+# sought) — e.g., the MIME check only reads the start of the file. Bytes read so far are kept in spool, so the
+# stream can be rewound and re-read like any other upload.
+class _StreamedFileBody(io.RawIOBase):
+    def __init__(self, part, spool):
+        self._part = part
+        self._spool = spool
+        self._received = 0
+        self._position = 0
+
+    # Read the body into the spool until it holds size bytes (or the whole body, if size is None).
+    def _receive(self, size=None):
+        while size is None or self._received < size:
+            chunk = self._part.read_chunk()
+            if not chunk:
+                return
+            self._spool.seek(self._received)
+            self._spool.write(chunk)
+            self._received += len(chunk)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        self._receive(self._position + len(buffer))
+        self._spool.seek(self._position)
+        data = self._spool.read(len(buffer))
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        else:
+            self._receive()
+            self._position = self._received + offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        self._spool.close()
+        super().close()
+
+
+# Open the file part of a multipart/form-data upload while it is still being received — only the request body up to
+# the part's headers is read, and its body is read from the request stream into spool as the file is read. Returns
+# None if the request has no file part named field_name.
+def open_streamed_upload(stream, boundary, field_name, spool):
+    part = _MultipartFilePart(stream, boundary, field_name)
+    filename = part.read_filename()
+    if filename is None:
+        return None
+
+    return FileStorage(
+        stream=_StreamedFileBody(part, spool), filename=filename, name=field_name
+    )
@@ -0,0 +1,36 @@
+from multiprocessing import Process
+import gc
+
+from src.classifier.config_loader import RUNTIME_SETTINGS
+from src.classifier.jobs import JobQueue, run_job_worker
+from src.classifier.pipeline import classify_spooled_file, warm_up
+
+
+_JOB_SETTINGS = RUNTIME_SETTINGS["jobs"]
+
+
+# Run a single job worker against the shared job queue.
+def _run_worker():
+    job_queue = JobQueue(_JOB_SETTINGS["queue_path"], _JOB_SETTINGS["spool_dir"])
+    run_job_worker(
+        job_queue,
+        classify_spooled_file,
+        _JOB_SETTINGS["poll_interval_seconds"],
+        _JOB_SETTINGS["result_ttl_seconds"],
+        lease_seconds=_JOB_SETTINGS["lease_seconds"],
+    )
+
+
+# Dedicated job worker pool — runs the expensive extraction / embedding stages for jobs queued by the API, keeping
+# them off the API's request-handling workers.
+if __name__ == "__main__":
+    # Worker processes are forked with the models already loaded, and share them copy-on-write (see gunicorn.conf.py).
+    warm_up()
+    gc.freeze()
+    workers = [
+        Process(target=_run_worker) for _ in range(_JOB_SETTINGS["worker_processes"])
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
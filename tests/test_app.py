@@ -1,9 +1,29 @@
 from io import BytesIO
+import json
 from pathlib import Path
+import subprocess
+import sys
+import threading
+import time
+import zipfile
 import pytest
+import yaml
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
 
+import src.app as app_module
+import src.classifier.pipeline as pipeline
 from src.app import app
-from src.classifier.pipeline import _allowed_file
+import src.classifier.config_loader as config_loader
+from src.classifier.config_loader import (
+    RUNTIME_SETTINGS,
+    get_ruleset,
+    load_config,
+    reload_ruleset,
+)
+from src.classifier.jobs import JobQueue, run_job_worker
+from src.classifier.pipeline import _allowed_file, classify_spooled_file
+from src.streaming_upload import open_streamed_upload
 
 
 @pytest.fixture
@@ -80,3 +100,461 @@ def test_success(client, filename, expected_class, expected_status_code):
         assert response.get_json()["data"]["label"] == expected_class
     else:
         assert "error" in response.get_json()
+
+
+def test_no_files_in_batch_request(client):
+    response = client.post("/classify_files")
+
+    assert response.status_code == 400
+    assert response.get_json()["error"]["code"] == "missing_file_part"
+
+
+# Test batch classification returns one result per file, in upload order.
+def test_classify_files(client):
+    filenames = ["bank_statement_1.pdf", "invoice_1.pdf", "poorly_named.csv"]
+    files_dir = Path(__file__).parent / "files"
+
+    data = {
+        "files": [
+            (BytesIO((files_dir / filename).read_bytes()), filename)
+            for filename in filenames
+        ]
+    }
+    response = client.post(
+        "/classify_files", data=data, content_type="multipart/form-data"
+    )
+
+    assert response.status_code == 200
+
+    results = response.get_json()["data"]["results"]
+    assert [result["filename"] for result in results] == filenames
+    assert [result["status_code"] for result in results] == [200, 200, 400]
+    assert results[0]["data"]["label"] == "bank_statement"
+    assert results[1]["data"]["label"] == "invoice"
+    assert results[2]["error"]["code"] == "unsupported_file"
+
+
+# Test zip archive members are classified individually.
+def test_classify_files_zip(client):
+    files_dir = Path(__file__).parent / "files"
+
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.write(files_dir / "invoice_1.pdf", "docs/invoice_1.pdf")
+        zip_file.write(files_dir / "drivers_licence_1.jpg", "drivers_licence_1.jpg")
+    archive.seek(0)
+
+    data = {"files": (archive, "uploads.zip")}
+    response = client.post(
+        "/classify_files", data=data, content_type="multipart/form-data"
+    )
+
+    assert response.status_code == 200
+
+    results = response.get_json()["data"]["results"]
+    assert [result["filename"] for result in results] == [
+        "invoice_1.pdf",
+        "drivers_licence_1.jpg",
+    ]
+    assert [result["data"]["label"] for result in results] == [
+        "invoice",
+        "driving_license",
+    ]
+
+
+def _zip_upload(members):
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for name, data in members.items():
+            zip_file.writestr(name, data)
+    archive.seek(0)
+    return {"files": (archive, "uploads.zip")}
+
+
+# Test zip archives are rejected from their directory alone when they hold too many files, or too much data once
+# decompressed, before any member is read.
+def test_classify_files_zip_limits(client, monkeypatch):
+    many_files = _zip_upload({f"invoice_{i}.pdf": b"%PDF-1.4" for i in range(3)})
+    large_file = _zip_upload({"invoice_1.pdf": b"\0" * 1001})
+
+    def fail_open(*args, **kwargs):
+        raise AssertionError("zip member was decompressed")
+
+    monkeypatch.setattr(zipfile.ZipFile, "open", fail_open)
+    monkeypatch.setattr(app_module, "_MAX_BATCH_FILES", 2)
+    response = client.post(
+        "/classify_files", data=many_files, content_type="multipart/form-data"
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"]["code"] == "too_many_files"
+
+    monkeypatch.setitem(app_module._UPLOAD_SETTINGS, "max_zip_bytes", 1000)
+    response = client.post(
+        "/classify_files", data=large_file, content_type="multipart/form-data"
+    )
+    assert response.status_code == 400
+    assert response.get_json()["error"]["code"] == "zip_too_large"
+
+
+# Test the files of a batch that reach the embedding model are embedded in a single call.
+def test_classify_files_shares_embedding_call(client, monkeypatch):
+    import src.classifier.file_content_classifier.classifier as content_classifier
+
+    embedding_calls = []
+
+    def fake_classify_using_embeddings(file_texts, MIN_CONFIDENCE):
+        embedding_calls.append(len(file_texts))
+        return [
+            {"success": True, "data": {"label": "invoice", "step": 4}}
+            for _ in file_texts
+        ]
+
+    monkeypatch.setattr(
+        content_classifier, "classify_using_embeddings", fake_classify_using_embeddings
+    )
+    monkeypatch.setattr(pipeline, "_result_cache", None)
+    file_data = (Path(__file__).parent / "files" / "poorly_named.docx").read_bytes()
+
+    response = client.post(
+        "/classify_files",
+        data={"files": [(BytesIO(file_data), f"upload_{i}.docx") for i in range(3)]},
+        content_type="multipart/form-data",
+    )
+
+    results = response.get_json()["data"]["results"]
+    assert [result["data"]["step"] for result in results] == [4, 4, 4]
+    assert embedding_calls == [3]
+
+
+# Test re-uploading identical content under a new name is served from the result cache.
+def test_reupload_is_cached(client):
+    file_data = (Path(__file__).parent / "files" / "poorly_named.docx").read_bytes()
+
+    first_response = client.post(
+        "/classify_file",
+        data={"file": (BytesIO(file_data), "upload.docx")},
+        content_type="multipart/form-data",
+    )
+    second_response = client.post(
+        "/classify_file",
+        data={"file": (BytesIO(file_data), "upload_retry.docx")},
+        content_type="multipart/form-data",
+    )
+
+    assert second_response.status_code == first_response.status_code
+    assert second_response.get_json()["cached"] is True
+
+    first_result = first_response.get_json()
+    first_result.pop("cached", None)
+    second_result = second_response.get_json()
+    second_result.pop("cached")
+    assert second_result == first_result
+
+
+# Test the debug header adds the stages each file went through, with their timings, to the response.
+def test_debug_output(client):
+    file_data = (Path(__file__).parent / "files" / "bank_statement_1.pdf").read_bytes()
+
+    response = client.post(
+        "/classify_file",
+        data={"file": (BytesIO(file_data), "bank_statement_1.pdf")},
+        content_type="multipart/form-data",
+        headers={"X-Classifier-Debug": "true"},
+    )
+
+    debug = response.get_json()["debug"]
+    assert debug["file_type"] == "pdf"
+    assert debug["resolved_by"] == "filename_regex"
+    assert set(debug["stage_seconds"]) == {"extension_check", "filename_regex"}
+
+
+def test_metrics(client):
+    file_data = (Path(__file__).parent / "files" / "bank_statement_1.pdf").read_bytes()
+    client.post(
+        "/classify_file",
+        data={"file": (BytesIO(file_data), "bank_statement_1.pdf")},
+        content_type="multipart/form-data",
+    )
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    metrics = response.get_data(as_text=True)
+    assert (
+        'classifier_files_resolved_total{file_type="pdf",resolved_by="filename_regex"}'
+        in metrics
+    )
+    assert (
+        'classifier_stage_duration_seconds_count{file_type="pdf",stage="filename_regex"}'
+        in metrics
+    )
+
+
+@pytest.fixture
+def rules_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("CLASSIFIER_CONFIG_DIR", str(tmp_path))
+    yield tmp_path
+    monkeypatch.delenv("CLASSIFIER_CONFIG_DIR")
+    reload_ruleset()
+
+
+_ADMIN_HEADERS = {"X-Classifier-Admin-Token": "secret"}
+
+
+@pytest.fixture
+def admin_endpoint(monkeypatch):
+    monkeypatch.setitem(RUNTIME_SETTINGS["ruleset"], "admin_endpoint", True)
+    monkeypatch.setenv("CLASSIFIER_ADMIN_TOKEN", "secret")
+
+
+# Test the reload endpoint is off by default, and refuses requests without the admin token once enabled.
+def test_reload_rules_requires_admin_token(client, monkeypatch):
+    assert client.post("/admin/reload_rules").status_code == 404
+
+    monkeypatch.setitem(RUNTIME_SETTINGS["ruleset"], "admin_endpoint", True)
+    response = client.post("/admin/reload_rules", headers=_ADMIN_HEADERS)
+    assert response.status_code == 401
+
+    monkeypatch.setenv("CLASSIFIER_ADMIN_TOKEN", "secret")
+    response = client.post(
+        "/admin/reload_rules", headers={"X-Classifier-Admin-Token": "guess"}
+    )
+    assert response.status_code == 401
+    assert response.get_json()["error"]["code"] == "unauthorised"
+
+
+# Test reloading picks up edited rules, and results report the rules version they were classified with.
+def test_reload_rules(client, rules_dir, admin_endpoint):
+    previous_version = get_ruleset().version
+    rules = load_config("industry_rules.yaml") + [
+        {"label": "passport", "filename_regex": ["passport"]}
+    ]
+    (rules_dir / "industry_rules.yaml").write_text(yaml.safe_dump(rules))
+
+    response = client.post("/admin/reload_rules", headers=_ADMIN_HEADERS)
+    assert response.status_code == 200
+    rules_version = response.get_json()["data"]["rules_version"]
+    assert rules_version != previous_version
+
+    response = client.post(
+        "/classify_file",
+        data={"file": (BytesIO(b"%PDF-1.4"), "passport_1.pdf")},
+        content_type="multipart/form-data",
+    )
+    assert response.get_json()["data"]["label"] == "passport"
+    assert response.get_json()["rules_version"] == rules_version
+
+
+# Test invalid rules are rejected, and the previous rules stay in use.
+def test_reload_invalid_rules(client, rules_dir, admin_endpoint):
+    ruleset = get_ruleset()
+    (rules_dir / "industry_rules.yaml").write_text(
+        yaml.safe_dump([{"label": "passport", "filename_regex": ["("]}])
+    )
+
+    response = client.post("/admin/reload_rules", headers=_ADMIN_HEADERS)
+    assert response.status_code == 422
+    assert response.get_json()["error"]["code"] == "invalid_rules"
+    assert response.get_json()["error"]["details"] == {"rules_version": ruleset.version}
+    assert get_ruleset() is ruleset
+
+
+# Test the precompiled rules artifact is plain JSON, is loaded in place of the YAML it was built from, and is ignored
+# once the YAML changes.
+def test_precompiled_rules(rules_dir, monkeypatch):
+    rules = load_config("industry_rules.yaml")
+    rules_path = rules_dir / "industry_rules.yaml"
+    rules_path.write_text(yaml.safe_dump(rules))
+    ruleset = config_loader.build_ruleset()
+
+    artifact_path = config_loader.write_compiled_rules(rules_path)
+    assert json.loads(artifact_path.read_text())["raw_rules"] == rules
+    with monkeypatch.context() as patch:
+        patch.setattr(config_loader, "_compile_rules", None)
+        precompiled_ruleset = config_loader.build_ruleset()
+    assert precompiled_ruleset.version == ruleset.version
+    assert precompiled_ruleset.document_rules == ruleset.document_rules
+
+    rules_path.write_text(yaml.safe_dump(rules + [{"label": "passport"}]))
+    assert config_loader.build_ruleset().document_rules[-1]["label"] == "passport"
+
+
+# Test a truncated precompiled rules artifact falls back on the YAML, with a warning.
+def test_broken_precompiled_rules(rules_dir, caplog):
+    rules_path = rules_dir / "industry_rules.yaml"
+    rules_path.write_text(yaml.safe_dump(load_config("industry_rules.yaml")))
+    ruleset = config_loader.build_ruleset()
+    artifact_path = config_loader.write_compiled_rules(rules_path)
+    artifact_path.write_text(artifact_path.read_text()[:100])
+
+    assert config_loader.build_ruleset().document_rules == ruleset.document_rules
+    assert "Ignoring precompiled rules" in caplog.text
+
+
+# Request body stream that counts the bytes read from it.
+class CountingStream(BytesIO):
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+# Test files classified by filename are answered from the upload's part headers, without reading its body.
+def test_filename_match_skips_upload_body(client):
+    boundary, body = encode_multipart(
+        {"file": FileStorage(BytesIO(b"%PDF-" + b"0" * 5_000_000), "invoice_1.pdf")}
+    )
+    stream = CountingStream(body)
+
+    response = client.post(
+        "/classify_file",
+        input_stream=stream,
+        content_type=f"multipart/form-data; boundary={boundary}",
+        content_length=len(body),
+    )
+
+    assert response.status_code == 200
+    assert response.get_json()["data"]["label"] == "invoice"
+    assert stream.bytes_read < 100_000
+
+
+# Test a streamed upload reads its body on demand, and can be rewound and re-read like a buffered one.
+def test_streamed_upload():
+    file_data = bytes(range(256)) * 4096
+    boundary, body = encode_multipart(
+        {"note": "first", "file": FileStorage(BytesIO(file_data), "invoice_1.pdf")}
+    )
+    stream = CountingStream(body)
+
+    file = open_streamed_upload(stream, boundary, "file", BytesIO())
+    assert file.filename == "invoice_1.pdf"
+    assert file.stream.read(5) == file_data[:5]
+    assert stream.bytes_read < len(body)
+
+    assert file.stream.seek(0, 2) == len(file_data)
+    file.stream.seek(0)
+    assert file.stream.read() == file_data
+
+    assert open_streamed_upload(BytesIO(body), boundary, "missing", BytesIO()) is None
+
+
+@pytest.fixture
+def job_queue(tmp_path, monkeypatch):
+    queue = JobQueue(tmp_path / "jobs.sqlite", tmp_path / "spool")
+    monkeypatch.setattr(app_module, "_job_queue", queue)
+
+    stop_event = threading.Event()
+    worker = threading.Thread(
+        target=run_job_worker,
+        args=(queue, classify_spooled_file, 0.05, 3600, stop_event),
+    )
+    worker.start()
+    yield queue
+    stop_event.set()
+    worker.join()
+
+
+# Test a job whose worker died mid-job is failed once its lease expires, and its spooled file removed.
+def test_lost_job_fails_after_lease(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite", tmp_path / "spool")
+    job_id = queue.enqueue(FileStorage(BytesIO(b"%PDF-1.4"), "scan.pdf"), "pdf")
+    job = queue.claim()
+
+    queue.fail_expired(3600)
+    assert queue.get(job_id)["status"] == "running"
+
+    stop_event = threading.Event()
+    worker = threading.Thread(
+        target=run_job_worker,
+        args=(queue, classify_spooled_file, 0.05, 3600, stop_event),
+        kwargs={"lease_seconds": 0},
+    )
+    worker.start()
+    deadline = time.time() + 10
+    while queue.get(job_id)["status"] == "running" and time.time() < deadline:
+        time.sleep(0.05)
+    stop_event.set()
+    worker.join()
+
+    lost_job = queue.get(job_id)
+    assert lost_job["status"] == "failed"
+    assert lost_job["status_code"] == 500
+    assert lost_job["result"]["error"]["code"] == "job_lost"
+    assert not Path(job["spool_path"]).exists()
+
+
+# Test async mode still answers filename-classifiable files immediately.
+def test_async_filename_match(client, job_queue):
+    file_data = (Path(__file__).parent / "files" / "invoice_1.pdf").read_bytes()
+
+    response = client.post(
+        "/classify_file?async=true",
+        data={"file": (BytesIO(file_data), "invoice_1.pdf")},
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == 200
+    assert response.get_json()["data"]["label"] == "invoice"
+
+
+# Test async mode queues files that need content classification, and the job result can be polled.
+def test_async_job(client, job_queue, monkeypatch):
+    # Bypass the result cache — a cached result would be returned synchronously.
+    monkeypatch.setattr(pipeline, "_result_cache", None)
+    file_data = (Path(__file__).parent / "files" / "poorly_named.docx").read_bytes()
+
+    response = client.post(
+        "/classify_file",
+        data={"file": (BytesIO(file_data), "poorly_named.docx")},
+        content_type="multipart/form-data",
+        headers={"Prefer": "respond-async"},
+    )
+
+    assert response.status_code == 202
+    job_id = response.get_json()["data"]["job_id"]
+    assert response.headers["Location"] == f"/jobs/{job_id}"
+
+    deadline = time.time() + 60
+    job_response = client.get(f"/jobs/{job_id}")
+    while job_response.status_code == 202 and time.time() < deadline:
+        time.sleep(0.1)
+        job_response = client.get(f"/jobs/{job_id}")
+
+    assert job_response.status_code == 422
+    assert job_response.get_json()["error"]["code"] == "unclassifiable_file"
+
+
+def test_unknown_job(client, job_queue):
+    response = client.get("/jobs/does_not_exist")
+
+    assert response.status_code == 404
+    assert response.get_json()["error"]["code"] == "job_not_found"
+
+
+# Test importing the app doesn't load the models or the text extraction libraries, so workers can serve requests
+# classified by filename as soon as they start.
+def test_app_import_is_lazy():
+    heavy_modules = [
+        "sentence_transformers",
+        "torch",
+        "joblib",
+        "pdfminer",
+        "pdf2image",
+        "pytesseract",
+        "tesserocr",
+        "docx",
+        "openpyxl",
+    ]
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, src.app; print([m for m in {heavy_modules!r} if m in sys.modules])",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    assert output.strip() == "[]"
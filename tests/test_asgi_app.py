@@ -0,0 +1,84 @@
+from io import BytesIO
+from pathlib import Path
+import asyncio
+import threading
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import src.asgi_app as asgi_app_module
+import src.classifier.pipeline as pipeline
+from src.asgi_app import app
+
+
+# POST the files to /classify_file through Quart's test client — returns the status code and JSON body.
+def post_classify_file(files=None):
+    async def post():
+        async with app.test_app():
+            response = await app.test_client().post("/classify_file", files=files)
+            return response.status_code, await response.get_json()
+
+    return asyncio.run(post())
+
+
+def upload(filename):
+    file_data = (Path(__file__).parent / "files" / filename).read_bytes()
+    return {"file": FileStorage(stream=BytesIO(file_data), filename=filename)}
+
+
+def test_no_file_in_request():
+    status_code, body = post_classify_file()
+    assert status_code == 400
+    assert body["error"]["code"] == "missing_file_part"
+
+
+@pytest.mark.parametrize(
+    "filename,expected_class,expected_status_code",
+    [
+        ("invoice_1.pdf", "invoice", 200),
+        ("poorly_named.csv", None, 400),
+        ("poorly_named.docx", None, 422),
+    ],
+)
+def test_success(filename, expected_class, expected_status_code):
+    status_code, body = post_classify_file(upload(filename))
+
+    assert status_code == expected_status_code
+
+    if status_code == 200:
+        assert body["data"]["label"] == expected_class
+    else:
+        assert "error" in body
+
+
+# Test files that need the content stages are turned away once every executor slot is taken.
+def test_server_busy(monkeypatch):
+    # Bypass the result cache — a cached result is returned without the content stages.
+    monkeypatch.setattr(pipeline, "_result_cache", None)
+    monkeypatch.setattr(
+        asgi_app_module, "_content_slots", threading.BoundedSemaphore(1)
+    )
+    asgi_app_module._content_slots.acquire()
+
+    status_code, body = post_classify_file(upload("poorly_named.docx"))
+    assert status_code == 503
+    assert body["error"]["code"] == "server_busy"
+
+    # Filename matches don't need the executor, so are still served.
+    status_code, _ = post_classify_file(upload("invoice_1.pdf"))
+    assert status_code == 200
+
+
+# Test hashing the upload and looking it up in the result cache happen off the event loop's thread.
+def test_cache_stages_run_off_event_loop(monkeypatch):
+    digest_threads = []
+    file_digest = pipeline.file_digest
+
+    def recording_file_digest(file):
+        digest_threads.append(threading.current_thread())
+        return file_digest(file)
+
+    monkeypatch.setattr(pipeline, "file_digest", recording_file_digest)
+
+    status_code, _ = post_classify_file(upload("poorly_named.docx"))
+    assert status_code == 422
+    assert digest_threads and threading.main_thread() not in digest_threads
@@ -1,15 +1,31 @@
+from io import BytesIO
 from pathlib import Path
 import pytest
 from werkzeug.datastructures import FileStorage
+from pdfminer.high_level import extract_text
+from PIL import Image
+from openpyxl import Workbook
 import os
 import pandas as pd
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics import classification_report, accuracy_score, f1_score
 import joblib
+import numpy as np
 import re
+import threading
+import time
 
-from src.classifier.extract import extract_file_text
-from src.classifier.file_content_classifier.rule_matcher import regex_match_file_content
+import src.classifier.pipeline as pipeline
+import src.classifier.extract as extract
+import src.classifier.layout_classifier.classifier as layout_classifier
+from src.classifier.extract import ExtractionBudget, extract_file_text, iter_file_text
+from src.classifier.pdf_pages import iter_pdf_pages
+from src.classifier.file_content_classifier.rule_matcher import (
+    ContentMatcher,
+    regex_match_file_content,
+)
+from src.classifier.pattern_prefilter import literal_prefilter
+from src.classifier.config_loader import DOCUMENT_RULES, RUNTIME_SETTINGS, get_ruleset
 
 
 # Test text extraction works as expected.
@@ -48,6 +64,432 @@ def test_extract_file_text(filename, ext, expected_substrings):
             ), f"Missing expected text: '{expected}'"
 
 
+# Test text is extracted from in-memory uploads without writing them to disk.
+@pytest.mark.parametrize(
+    "filename, ext", [("bank_statement_1.pdf", "pdf"), ("poorly_named.docx", "docx")]
+)
+def test_extract_file_text_in_memory(monkeypatch, filename, ext):
+    file_bytes = (Path(__file__).parent / "files" / filename).read_bytes()
+
+    def no_temporary_files(*args, **kwargs):
+        raise AssertionError("Upload written to a temporary file")
+
+    monkeypatch.setattr("tempfile.NamedTemporaryFile", no_temporary_files)
+
+    with open(Path(__file__).parent / "files" / filename, "rb") as f:
+        expected_text = extract_file_text(FileStorage(stream=f, filename=filename), ext)
+    file = FileStorage(stream=BytesIO(file_bytes), filename=filename)
+    file.stream.seek(len(file_bytes))
+
+    assert extract_file_text(file, ext) == expected_text
+
+
+# Test streamed text chunks join up to the same text as a full extraction.
+def test_iter_file_text_matches_extract_file_text():
+    file_path = Path(__file__).parent / "files" / "bank_statement_1.pdf"
+
+    with file_path.open("rb") as f:
+        file = FileStorage(stream=f, filename=file_path.name)
+        text = extract_file_text(file, "pdf")
+        f.seek(0)
+        streamed_text = " ".join(iter_file_text(file, "pdf"))
+
+    assert streamed_text == text
+
+
+# Test the single-pass page parser gives the same text as pdfminer's extract_text, and spots image-only (scanned) pages.
+def test_iter_pdf_pages():
+    file_path = Path(__file__).parent / "files" / "bank_statement_1.pdf"
+    with file_path.open("rb") as f:
+        pages = list(iter_pdf_pages(f))
+        f.seek(0)
+        assert "".join(page["text"] for page in pages) == extract_text(f)
+    assert [page["page_number"] for page in pages] == [1, 2]
+
+    scan = BytesIO()
+    Image.new("RGB", (200, 100), "white").save(scan, format="PDF")
+    scan.seek(0)
+    assert list(iter_pdf_pages(scan)) == [
+        {"page_number": 1, "text": "\x0c", "has_images": True}
+    ]
+
+
+# Test only scanned pages of a mixed pdf are OCR'd (up to the page budget), after its text layer.
+def test_iter_pdf_ocrs_only_scanned_pages(monkeypatch):
+    text_page = (
+        "Account Number 12345678\nStatement Period 01/01/2024 - 31/01/2024\n\x0c"
+    )
+    pages = [
+        {"page_number": 1, "text": "\x0c", "has_images": True},
+        {"page_number": 2, "text": text_page, "has_images": True},
+        {"page_number": 3, "text": text_page, "has_images": False},
+        {"page_number": 4, "text": "\x0c", "has_images": False},
+        {"page_number": 5, "text": "\x0c", "has_images": True},
+        {"page_number": 6, "text": "\x0c", "has_images": True},
+        {"page_number": 7, "text": "\x0c", "has_images": True},
+        {"page_number": 8, "text": "\x0c", "has_images": True},
+    ]
+    ocr_requests = []
+
+    def fake_iter_ocr_pdf_pages(path, page_numbers):
+        ocr_requests.append(list(page_numbers))
+        for page_number in page_numbers:
+            yield f"ocr {page_number}"
+
+    monkeypatch.setattr(
+        "src.classifier.pdf_pages.iter_pdf_pages", lambda stream: iter(pages)
+    )
+    monkeypatch.setattr(extract, "_iter_ocr_pdf_pages", fake_iter_ocr_pdf_pages)
+
+    file = FileStorage(stream=BytesIO(b"%PDF"), filename="statement.pdf")
+    chunks = list(iter_file_text(file, "pdf"))
+
+    assert chunks == ["\x0c" + text_page * 2 + "\x0c" * 5, "ocr 1", "ocr 5", "ocr 6"]
+    assert ocr_requests == [[1], [5, 6]]
+
+
+# Test pages OCR'd on the pool are yielded in page order, whichever finishes first, and pages not yet started are
+# cancelled when the caller stops early. A thread pool stands in for the process pool, so the fake OCR is used.
+def test_ocr_pdf_pages_on_pool(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    started = []
+
+    def fake_ocr_pdf_page(path, page_number):
+        started.append(page_number)
+        # Earlier pages finish last.
+        time.sleep(0.05 * max(0, 4 - page_number))
+        return f"ocr {page_number}"
+
+    pool = ThreadPoolExecutor(max_workers=3)
+    monkeypatch.setattr(extract, "_get_ocr_pool", lambda: pool)
+    monkeypatch.setattr(extract, "_ocr_pdf_page", fake_ocr_pdf_page)
+
+    assert list(extract._iter_ocr_pdf_pages("scan.pdf", [1, 2, 3])) == [
+        "ocr 1",
+        "ocr 2",
+        "ocr 3",
+    ]
+
+    pool = ThreadPoolExecutor(max_workers=1)
+    started.clear()
+    page_texts = extract._iter_ocr_pdf_pages("scan.pdf", [1, 2, 3, 4, 5, 6])
+    assert next(page_texts) == "ocr 1"
+    page_texts.close()
+    pool.shutdown(wait=True)
+    assert started[:1] == [1] and len(started) <= 2
+
+
+# Test a pool whose process died is replaced, rather than failing every later pdf.
+def test_broken_ocr_pool_is_replaced(monkeypatch):
+    from concurrent.futures.process import BrokenProcessPool
+
+    class BrokenPool:
+        def submit(self, *args):
+            raise BrokenProcessPool("a process in the pool died")
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            pass
+
+    broken_pool = BrokenPool()
+    monkeypatch.setattr(extract, "_ocr_pool", broken_pool)
+
+    with pytest.raises(BrokenProcessPool):
+        list(extract._iter_ocr_pdf_pages("scan.pdf", [1, 2]))
+    assert extract._ocr_pool is None
+
+
+# Test images are turned by their EXIF orientation, downscaled to the configured size and converted to grayscale
+# before OCR.
+def test_preprocess_image():
+    from src.classifier.ocr_preprocessing import open_image, preprocess_image
+
+    settings = {
+        "enabled": True,
+        "max_megapixels": 2,
+        "grayscale": True,
+        "binarize": True,
+        "detect_orientation": False,
+        "header_first": {"enabled": False, "height_fraction": 0.3},
+    }
+    photo = Image.new("RGB", (4000, 3000), "white")
+    exif = photo.getexif()
+    exif[0x0112] = 6  # Orientation: rotated 90° clockwise.
+    stream = BytesIO()
+    photo.save(stream, "JPEG", exif=exif)
+
+    img = preprocess_image(open_image(BytesIO(stream.getvalue()), settings), settings)
+
+    assert img.mode == "L"
+    assert img.width < img.height
+    assert img.width * img.height <= 2_000_000
+    assert img.width * img.height > 1_900_000
+    assert {level for level, count in enumerate(img.histogram()) if count} <= {0, 255}
+
+
+# Test the default size limit leaves pdf pages rasterised at the default DPI (A4 and US letter) at full size.
+def test_default_max_megapixels_keeps_pdf_pages():
+    from src.classifier.ocr_preprocessing import _downscale_factor
+
+    max_megapixels = RUNTIME_SETTINGS["ocr"]["preprocessing"]["max_megapixels"]
+    dpi = RUNTIME_SETTINGS["ocr"]["pdf_dpi"]
+    for width_inches, height_inches in [(8.27, 11.69), (8.5, 11)]:
+        size = (round(width_inches * dpi), round(height_inches * dpi))
+        assert _downscale_factor(size, max_megapixels) == 1
+
+
+# Test the header region is split off at the gap between lines of text nearest the configured height.
+def test_split_header_region():
+    from PIL import ImageDraw
+    from src.classifier.ocr_preprocessing import split_header_region
+
+    settings = {
+        "enabled": True,
+        "header_first": {"enabled": True, "height_fraction": 0.3},
+    }
+    page = Image.new("L", (100, 1000), 255)
+    draw = ImageDraw.Draw(page)
+    # "Lines of text" 30 pixels high, with 10 pixel gaps between them.
+    for top in range(5, 1000, 40):
+        draw.rectangle((0, top, 99, top + 29), fill=0)
+
+    header, rest = split_header_region(page, settings)
+
+    assert page.getpixel((0, header.height)) == 255
+    assert abs(header.height - 300) <= 20
+    assert header.height + rest.height == 1000
+    assert split_header_region(
+        page, {**settings, "header_first": {"enabled": False}}
+    ) == [page]
+
+
+# Test header-first OCR doesn't OCR the rest of an image once its header satisfies the content rules.
+def test_header_first_ocr_stops_early(monkeypatch):
+    monkeypatch.setitem(
+        extract._OCR_SETTINGS["preprocessing"]["header_first"], "enabled", True
+    )
+    regions_ocrd = []
+
+    def fake_tesseract(img):
+        regions_ocrd.append(img.size)
+        return "DRIVER LICENSE\nDate of Birth 01/01/1990\nDOB\nExpiry Date 2030\nIssuing Authority"
+
+    monkeypatch.setattr(extract, "_tesseract", fake_tesseract)
+    stream = BytesIO()
+    Image.new("RGB", (600, 400), "white").save(stream, "PNG")
+    file = FileStorage(stream=stream, filename="license.png")
+
+    result = pipeline._classify_using_streamed_file_content(file, "png")
+
+    assert result["data"]["label"] == "driving_license"
+    assert len(regions_ocrd) == 1
+    assert regions_ocrd[0][1] < 400
+
+
+# Test the tesserocr engine creates at most pool_size tesseract instances, shares them between threads, and gives up
+# its place in the pool if an instance fails to load.
+def test_tesserocr_engine_pool():
+    pytest.importorskip("tesserocr")
+    from src.classifier.ocr_engines import TesserocrEngine
+
+    in_use, max_in_use, created = [], [], []
+    lock = threading.Lock()
+
+    class FakeApi:
+        def SetImage(self, img):
+            with lock:
+                in_use.append(self)
+                max_in_use.append(len(in_use))
+            self.img = img
+
+        def GetUTF8Text(self):
+            time.sleep(0.01)
+            with lock:
+                in_use.remove(self)
+            return f"text {self.img}"
+
+    class FakeEngine(TesserocrEngine):
+        def _create_api(self):
+            created.append(None)
+            if len(created) == 1:
+                raise RuntimeError("Failed to init API")
+            return FakeApi()
+
+    engine = FakeEngine(pool_size=2)
+    with pytest.raises(RuntimeError):
+        engine.image_to_string("first")
+
+    results = [None] * 16
+
+    def ocr(i):
+        results[i] = engine.image_to_string(i)
+
+    threads = [threading.Thread(target=ocr, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [f"text {i}" for i in range(16)]
+    assert len(created) == 3
+    assert max(max_in_use) == 2
+
+
+# Test layout features are a fixed length whatever the image's size, and tell landscape cards from portrait pages.
+def test_layout_features():
+    from src.classifier.layout_classifier.features import layout_features
+
+    card = layout_features(Image.new("RGB", (856, 540), "lightblue"))
+    page = layout_features(Image.new("RGB", (1240, 1754), "white"))
+
+    assert card.shape == page.shape
+    assert np.isfinite(card).all()
+    assert card[0] > 0 > page[0]
+
+
+@pytest.fixture
+def enable_layout_classifier(monkeypatch):
+    monkeypatch.setitem(layout_classifier._LAYOUT_SETTINGS, "enabled", True)
+    monkeypatch.setattr(layout_classifier, "_layout_classifier", None)
+
+
+# Test an image the layout classifier is confident about is classified without OCR.
+def test_layout_result_skips_ocr(monkeypatch, enable_layout_classifier):
+    def fake_tesseract(img):
+        raise AssertionError("image was OCR'd")
+
+    monkeypatch.setattr(extract, "_tesseract", fake_tesseract)
+    monkeypatch.setattr(pipeline, "_result_cache", None)
+    with open(Path("tests/files/drivers_licence_1.jpg"), "rb") as stream:
+        file = FileStorage(stream=stream, filename="upload.jpg")
+        result, status_code = pipeline.classify_file_content_stages(file, "jpg", None)
+
+    assert status_code == 200
+    assert result["data"]["label"] == "driving_license"
+    assert result["data"]["step"] == 6
+    assert result["data"]["confidence"] >= 0.95
+
+
+# Test other file types, and images the layout classifier isn't confident about, fall through to text extraction.
+def test_layout_classifier_falls_through(monkeypatch, enable_layout_classifier):
+    with open(Path("tests/files/invoice_1.pdf"), "rb") as stream:
+        file = FileStorage(stream=stream, filename="upload.pdf")
+        assert layout_classifier.classify_using_layout(file, "pdf") is None
+
+    monkeypatch.setitem(layout_classifier._LAYOUT_SETTINGS, "min_confidence", 1.01)
+    with open(Path("tests/files/drivers_licence_1.jpg"), "rb") as stream:
+        file = FileStorage(stream=stream, filename="upload.jpg")
+        assert layout_classifier.classify_using_layout(file, "jpg") is None
+
+
+def _xlsx_upload(rows):
+    workbook = Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    stream = BytesIO()
+    workbook.save(stream)
+    return FileStorage(stream=stream, filename="upload.xlsx")
+
+
+# Test extraction stops at the first extraction limit reached, and reports which one.
+@pytest.mark.parametrize(
+    "limits, expected_text, expected_truncation",
+    [
+        ({}, "invoice 1\ninvoice 2\ninvoice 3", None),
+        ({"max_rows": 2}, "invoice 1\ninvoice 2", {"limit": "max_rows", "value": 2}),
+        ({"max_chars": 12}, "invoice 1\ninv", {"limit": "max_chars", "value": 12}),
+        ({"max_rows": 3, "max_chars": 100}, "invoice 1\ninvoice 2\ninvoice 3", None),
+    ],
+)
+def test_extraction_budget(limits, expected_text, expected_truncation):
+    file = _xlsx_upload([[f"invoice {i}"] for i in range(1, 4)])
+    budget = ExtractionBudget(**limits)
+
+    assert extract_file_text(file, "xlsx", budget) == expected_text
+    assert budget.truncation() == expected_truncation
+
+
+# Test a truncated extraction is reported in the classification result.
+def test_extraction_truncation_reported():
+    ruleset = get_ruleset()
+    ruleset = ruleset._replace(
+        extraction_limits={
+            **ruleset.extraction_limits,
+            "pdf": {
+                "max_pages": 1,
+                "max_rows": None,
+                "max_chars": None,
+                "max_seconds": None,
+            },
+        }
+    )
+    file_path = Path(__file__).parent / "files" / "bank_statement_1.pdf"
+
+    with file_path.open("rb") as f:
+        file = FileStorage(stream=f, filename=file_path.name)
+        result, _ = pipeline.classify_file_content_stages(file, "pdf", None, ruleset)
+
+    details = (
+        result["data"]["additional_info"]
+        if result["success"]
+        else result["error"]["details"]
+    )
+    assert details["extraction_truncated"] == {"limit": "max_pages", "value": 1}
+
+
+# Test extraction stops as soon as the content rules are satisfied.
+def test_streamed_classification_stops_early(monkeypatch):
+    pages = [
+        "DRIVER LICENSE\nDate of Birth 01/01/1990\nDOB\nExpiry Date 2030\nIssuing Authority",
+        "page two",
+        "page three",
+    ]
+    pages_read = []
+
+    def fake_iter_file_text(file, ext, budget=None):
+        for page in pages:
+            pages_read.append(page)
+            yield page
+
+    monkeypatch.setattr(pipeline, "iter_file_text", fake_iter_file_text)
+    result = pipeline._classify_using_streamed_file_content(None, "pdf")
+
+    assert result["data"]["label"] == "driving_license"
+    assert result["data"]["match_type"] == "regex"
+    assert result["data"]["step"] == 3
+    assert pages_read == pages[:1]
+
+
+# Minimal pdf whose page tree has no pages.
+def _empty_pdf():
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [] /Count 0 >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, obj)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return pdf
+
+
+# Test a pdf no text can be extracted from (no pages at all) is left unclassified, rather than raising.
+def test_streamed_classification_of_empty_pdf():
+    file = FileStorage(stream=BytesIO(_empty_pdf()), filename="empty.pdf")
+
+    result = pipeline._classify_using_streamed_file_content(file, "pdf")
+
+    assert result["success"] is False
+
+
 # Test text content pattern scoring works as expected
 @pytest.mark.parametrize(
     "file_text, patterns, expected_confidence, expected_required, expected_supporting, expected_negative",
@@ -147,6 +589,52 @@ def test_regex_match_file_content(
     ]
 
 
+@pytest.mark.parametrize(
+    "pattern, expected",
+    [
+        (re.compile(r"invoice number", re.I), ("invoice number", True)),
+        (re.compile(r"driver'?s? licen[cs]e", re.I), ("driver", True)),
+        (re.compile(r"(bank|acct|account).*statement", re.I), ("statement", True)),
+        (re.compile(r"Bill To"), ("Bill To", False)),
+        (re.compile(r"bank|invoice", re.I), None),
+        (re.compile(r"DOB\b", re.I), ("dob", True)),
+        (re.compile(r"\d{4}", re.I), None),
+    ],
+)
+def test_literal_prefilter(pattern, expected):
+    assert literal_prefilter(pattern) == expected
+
+
+def _load_texts(path):
+    texts = []
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith(".csv"):
+            texts.extend(pd.read_csv(os.path.join(path, filename))["text"].tolist())
+    return texts
+
+
+# Test the combined content matcher gives exactly the same scores and matches as matching each rule separately.
+def test_content_matcher_matches_per_rule_matching():
+    texts = _load_texts("data/training") + [
+        "",
+        "İNVOİCE NUMBER 1\nBILL TO: someone\npaymenT due",
+        "Driver's Licenſe\ndate of birth\nDOB DOB",
+        "account number\nstatement period\ninvoice number",
+    ]
+    content_matcher = ContentMatcher(DOCUMENT_RULES)
+
+    for text in texts:
+        expected = [
+            regex_match_file_content(rule["content_regex"], text)
+            for rule in DOCUMENT_RULES
+        ]
+        actual = [
+            (confidence, text_matches)
+            for _, confidence, text_matches in content_matcher.match_rules(text)
+        ]
+        assert actual == expected
+
+
 VAL_PATH = "data/validation"
 MODEL_PATH = "src/classifier/file_content_classifier/models"
 
@@ -184,4 +672,231 @@ def test_classifier_accuracy_threshold():
     assert macro_f1 >= 0.75, f"Macro F1 too low: {macro_f1:.2f}"
 
 
+ONNX_PATH = os.path.join(MODEL_PATH, "onnx")
+
+
+# Evaluate the hashed n-gram classifier tier on synthetic validation data.
+@pytest.mark.skipif(not os.path.isdir(VAL_PATH), reason="Validation data not available")
+def test_ngram_classifier_accuracy_threshold():
+    from src.classifier.file_content_classifier.ngram import HashedNgramClassifier
+
+    ngram_classifier = HashedNgramClassifier(
+        os.path.join(MODEL_PATH, "ngram_classifier.npz")
+    )
+
+    texts, labels = [], []
+    for filename in os.listdir(VAL_PATH):
+        if filename.endswith(".csv"):
+            df = pd.read_csv(os.path.join(VAL_PATH, filename))
+            texts.extend(df["text"].tolist())
+            labels.extend(df["label"].tolist())
+
+    predicted_labels, _, _ = ngram_classifier.score(texts)
+
+    assert accuracy_score(labels, predicted_labels) >= 0.80
+    assert f1_score(labels, predicted_labels, average="macro") >= 0.75
+
+
+# Test the served n-gram classifier hashes texts exactly as it was trained on (by scripts/build_classifier.py).
+def test_ngram_classifier_matches_training_features():
+    from scripts.build_classifier import ngram_feature_matrix
+    from src.classifier.file_content_classifier.ngram import HashedNgramClassifier
+
+    ngram_classifier = HashedNgramClassifier(
+        os.path.join(MODEL_PATH, "ngram_classifier.npz")
+    )
+    texts = ["Invoice No: 4692\nTotal: $2779.81", "Account   Number", "", "Ünïcödé"]
+
+    X = ngram_feature_matrix(texts)
+    np.testing.assert_allclose(
+        ngram_classifier.decision_function(texts),
+        X @ ngram_classifier._coef.T + ngram_classifier._intercept,
+        rtol=1e-6,
+    )
+
+
+# Test texts the n-gram classifier is confident about skip the embedding model, and the rest fall back on it.
+def test_confident_ngram_results_skip_embeddings(monkeypatch):
+    import src.classifier.file_content_classifier.classifier as content_classifier
+
+    embedded = []
+
+    def fake_classify_using_embeddings(file_texts, MIN_CONFIDENCE):
+        embedded.extend(file_texts)
+        return [{"success": True, "data": {"step": 4}} for _ in file_texts]
+
+    monkeypatch.setattr(
+        content_classifier, "classify_using_embeddings", fake_classify_using_embeddings
+    )
+    invoice = pd.read_csv(os.path.join(VAL_PATH, "invoices_val.csv"))["text"][0]
+
+    results = content_classifier.classify_using_models(
+        [invoice, "lorem ipsum"], MIN_CONFIDENCE=0.8
+    )
+
+    assert results[0]["data"]["label"] == "invoice"
+    assert results[0]["data"]["step"] == 5
+    assert results[1]["data"]["step"] == 4
+    assert embedded == ["lorem ipsum"]
+
+
+# Test turning the n-gram or layout classifier on or off changes the model version cached results are keyed by, but not
+# the embedder version cached embeddings are.
+def test_model_version_covers_optional_classifiers(monkeypatch):
+    import src.classifier.file_content_classifier.classifier as content_classifier
+
+    versions = {content_classifier._model_version()}
+    embedder_version = content_classifier._model_version(include_classifier_head=False)
+    monkeypatch.setitem(content_classifier._NGRAM_SETTINGS, "enabled", False)
+    versions.add(content_classifier._model_version())
+    monkeypatch.setitem(content_classifier._LAYOUT_SETTINGS, "enabled", True)
+    versions.add(content_classifier._model_version())
+    monkeypatch.setitem(content_classifier._LAYOUT_SETTINGS, "min_confidence", 0.9)
+    versions.add(content_classifier._model_version())
+
+    assert len(versions) == 4
+    assert (
+        content_classifier._model_version(include_classifier_head=False)
+        == embedder_version
+    )
+
+
+# Test the ONNX embedding backend agrees with the PyTorch model it was exported from.
+@pytest.mark.skipif(not os.path.isdir(ONNX_PATH), reason="ONNX models not exported")
+@pytest.mark.parametrize(
+    "onnx_model, min_cosine", [("model.onnx", 0.9999), ("model.int8.onnx", 0.98)]
+)
+def test_onnx_embedder_matches_sentence_transformer(onnx_model, min_cosine):
+    from src.classifier.file_content_classifier.embedders import OnnxEmbedder
+
+    embedder_name = open(os.path.join(MODEL_PATH, "embedder.txt")).read().strip()
+    embedder = SentenceTransformer(embedder_name)
+    onnx_embedder = OnnxEmbedder(
+        os.path.join(ONNX_PATH, onnx_model), os.path.join(ONNX_PATH, "tokenizer.json")
+    )
+    clf = joblib.load(os.path.join(MODEL_PATH, "classifier.joblib"))
+
+    # Include a text longer than the model's max sequence length, to check truncation matches.
+    texts = _load_texts(VAL_PATH)[:50] + ["account number " * 500]
+    expected = embedder.encode(texts)
+    actual = onnx_embedder.encode(texts)
+
+    cosine = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    assert cosine.min() >= min_cosine
+    assert (clf.predict(actual) == clf.predict(expected)).mean() >= 0.98
+
+
+# Test the exported classifier head scores embeddings exactly as the scikit-learn model it was exported from does —
+# the one-vs-rest (liblinear) and multinomial (lbfgs) schemes, for binary and multiclass models.
+@pytest.mark.parametrize("solver", ["liblinear", "lbfgs"])
+@pytest.mark.parametrize("n_classes", [2, 3])
+def test_classifier_head_matches_sklearn(tmp_path, solver, n_classes):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import LabelEncoder
+    from scripts.build_classifier import export_classifier_head
+    from src.classifier.file_content_classifier.head import LinearClassifierHead
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 16))
+    labels = np.array(["bank_statement", "driving_license", "invoice"])[
+        rng.integers(0, n_classes, size=300)
+    ]
+    le = LabelEncoder()
+    clf = LogisticRegression(solver=solver).fit(X, le.fit_transform(labels))
+
+    export_classifier_head(clf, le, tmp_path / "classifier_head.npz")
+    head = LinearClassifierHead(tmp_path / "classifier_head.npz")
+
+    expected = clf.predict_proba(X)
+    predicted_labels, confidences, probabilities = head.score(X)
+    np.testing.assert_allclose(probabilities, expected, atol=1e-12)
+    assert (predicted_labels == le.inverse_transform(clf.predict(X))).all()
+    np.testing.assert_allclose(confidences, expected.max(axis=1), atol=1e-12)
+
+
+# Test concurrent encode calls are served by shared batches, each caller getting back the embeddings of its own texts.
+def test_embedding_batcher():
+    from src.classifier.file_content_classifier.embedders import EmbeddingBatcher
+
+    class RecordingEmbedder:
+        batches = []
+
+        def encode(self, texts):
+            self.batches.append(len(texts))
+            return np.array([[float(text)] for text in texts])
+
+    embedder = RecordingEmbedder()
+    batcher = EmbeddingBatcher(embedder, max_batch_size=8, max_wait_ms=200)
+
+    results = [None] * 8
+    start = threading.Barrier(8)
+
+    def caller(i):
+        start.wait()
+        results[i] = batcher.encode([str(i), str(i + 0.5)])
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    for i, embeddings in enumerate(results):
+        assert embeddings.tolist() == [[i], [i + 0.5]]
+    assert sum(embedder.batches) == 16
+    assert len(embedder.batches) < 8
+
+
+# Test cached embeddings are reused for texts with the same token window — from memory, and from the disk tier after a
+# restart — and that only texts missing from both tiers reach the embedder, once per distinct window.
+def test_embedding_cache(tmp_path):
+    from src.classifier.file_content_classifier.embedding_cache import EmbeddingCache
+
+    class RecordingEmbedder:
+        def __init__(self):
+            self.encoded = []
+
+        def encode(self, texts):
+            self.encoded += texts
+            return np.array([[len(text), float(text.count("a"))] for text in texts])
+
+    # Stands in for the tokenizer — lowercases, splits on whitespace and truncates to 3 tokens.
+    def token_windows(texts):
+        return [[hash(word) for word in text.lower().split()[:3]] for text in texts]
+
+    def make_cache(embedder):
+        return EmbeddingCache(
+            embedder,
+            token_windows,
+            "model-v1",
+            memory_max_entries=2,
+            disk_path=str(tmp_path / "embeddings.cache"),
+            disk_max_entries=64,
+        )
+
+    embedder = RecordingEmbedder()
+    cache = make_cache(embedder)
+
+    first = cache.encode(["a bank statement", "An invoice", "an  INVOICE"])
+    assert embedder.encoded == ["a bank statement", "An invoice"]
+    assert first.tolist() == [[16, 3], [10, 0], [10, 0]]
+
+    # Same token windows as texts already embedded — the text beyond the window doesn't matter.
+    second = cache.encode(["A BANK STATEMENT", "a bank statement - page 2 of 3"])
+    assert embedder.encoded == ["a bank statement", "An invoice"]
+    assert second.tolist() == [[16, 3], [16, 3]]
+
+    # A new process, with an empty in-process tier, reads the disk tier.
+    restarted_embedder = RecordingEmbedder()
+    restarted = make_cache(restarted_embedder)
+    assert restarted.encode(["an invoice", "a driving license"]).tolist() == [
+        [10, 0],
+        [17, 1],
+    ]
+    assert restarted_embedder.encoded == ["a driving license"]
+
+
 # TODO: Test end-to-end file content classifier works as expected, mocking its dependencies.
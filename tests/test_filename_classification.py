@@ -4,6 +4,7 @@ import pytest
 from src.classifier.filename_classifier.classifier import classify_using_filename
 from src.classifier.filename_classifier.rule_matchers import (
     _FUZZY_THRESHOLD,
+    FilenameMatcher,
     get_fuzzy_score,
     regex_match_filename,
 )
@@ -91,3 +92,58 @@ def test_classify_using_filename(
         assert result["data"]["label"] == expected_label
         assert result["data"]["step"] == expected_step
         assert result["data"]["match_type"] == expected_match_type
+
+
+# Reference implementation — run each rule's regexes in order, then each rule's fuzzy keywords in order.
+def _classify_rule_by_rule(filename, rules):
+    filename = filename.lower()
+
+    for rule in rules:
+        matched, matching_text = regex_match_filename(rule["filename_regex"], filename)
+        if matched:
+            return rule["label"], 1, matching_text, 1.0
+
+    for rule in rules:
+        score, best_matching_text = get_fuzzy_score(rule["fuzzy_keywords"], filename)
+        if best_matching_text is not None:
+            return rule["label"], 2, best_matching_text, round(score / 100, 2)
+
+    return None
+
+
+# Test the filename matcher gives the same results, with the same precedence, as matching rule by rule.
+@pytest.mark.parametrize("rules", [DOCUMENT_RULES, TEST_RULES])
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "invoice_2023_bank_statement.pdf",
+        "statement_invoice-00123.pdf",
+        "dl_12345_invoice-0012.jpg",
+        "stmt_2023_drivers_license.png",
+        "driverlcence_copy.pdf",
+        "statment of acount.pdf",
+        "invoce amount due.pdf",
+        "amount_due_driver_licence_scan.pdf",
+        "INV20240017.PNG",
+        "accountsummary.pdf",
+        "poorly_named.pdf",
+        "",
+    ],
+)
+def test_filename_matcher_matches_rule_by_rule(filename, rules):
+    expected = _classify_rule_by_rule(filename, rules)
+    result = classify_using_filename(filename, rules, FilenameMatcher(rules))
+
+    if expected is None:
+        assert result is None
+    else:
+        data = result["data"]
+        actual_matching_text = data["additional_info"].get(
+            "matching_text", data["additional_info"].get("best_matching_text")
+        )
+        assert (
+            data["label"],
+            data["step"],
+            actual_matching_text,
+            data["confidence"],
+        ) == expected
@@ -0,0 +1,86 @@
+from io import BytesIO
+import multiprocessing
+import os
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from src.classifier.result_cache import ResultCache, file_digest
+
+
+RESULT = {"success": True, "data": {"label": "invoice", "confidence": 0.9}}
+
+
+# Test the file digest depends only on content, and leaves the stream position unchanged.
+def test_file_digest():
+    stream = BytesIO(b"same bytes")
+    stream.seek(4)
+    file = FileStorage(stream=stream, filename="a.pdf")
+    renamed_file = FileStorage(stream=BytesIO(b"same bytes"), filename="b.pdf")
+
+    assert file_digest(file) == file_digest(renamed_file)
+    assert stream.tell() == 4
+
+
+def test_memory_tier_lru_eviction():
+    cache = ResultCache(memory_max_entries=2, ttl_seconds=60)
+    cache.set("a", RESULT, 200)
+    cache.set("b", RESULT, 200)
+
+    # Reading "a" makes "b" the least recently used entry.
+    assert cache.get("a") == (RESULT, 200)
+    cache.set("c", RESULT, 200)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == (RESULT, 200)
+    assert cache.get("c") == (RESULT, 200)
+
+
+def test_ttl_expiry(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("src.classifier.result_cache.time.time", lambda: now)
+
+    cache = ResultCache(memory_max_entries=10, ttl_seconds=60)
+    cache.set("a", RESULT, 200)
+    assert cache.get("a") == (RESULT, 200)
+
+    now += 61
+    assert cache.get("a") is None
+
+
+def test_disk_tier_persists_between_instances(tmp_path):
+    disk_path = tmp_path / "results.sqlite"
+
+    ResultCache(10, 60, disk_path, 10).set("a", RESULT, 422)
+
+    assert ResultCache(10, 60, disk_path, 10).get("a") == (RESULT, 422)
+
+
+@pytest.mark.parametrize("disk_max_entries, expected_remaining", [(2, 2), (5, 3)])
+def test_disk_tier_size_eviction(tmp_path, disk_max_entries, expected_remaining):
+    disk_path = tmp_path / "results.sqlite"
+
+    cache = ResultCache(10, 60, disk_path, disk_max_entries)
+    for key in ["a", "b", "c"]:
+        cache.set(key, RESULT, 200)
+
+    # Use a fresh instance so lookups can't be served from the memory tier.
+    fresh_cache = ResultCache(10, 60, disk_path, disk_max_entries)
+    remaining = [key for key in ["a", "b", "c"] if fresh_cache.get(key) is not None]
+    assert len(remaining) == expected_remaining
+    assert "c" in remaining
+
+
+# Test a cache created before a fork (e.g. under gunicorn's preload_app) still works in the forked process.
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork not available")
+def test_disk_tier_after_fork(tmp_path):
+    disk_path = tmp_path / "results.sqlite"
+    cache = ResultCache(10, 60, disk_path, 10)
+
+    process = multiprocessing.get_context("fork").Process(
+        target=cache.set, args=("a", RESULT, 200)
+    )
+    process.start()
+    process.join()
+
+    assert process.exitcode == 0
+    assert cache.get("a") == (RESULT, 200)